@@ -1,4 +1,5 @@
 from crosshair.core import realize
+from crosshair.core import register_patch
 from crosshair.core import register_type
 from crosshair.util import IgnoreAttempt
 from crosshair.util import debug
@@ -0,0 +1,85 @@
+import collections.abc
+
+# Like AbcString, but for bytes: implement __bytes__(), and the rest of the
+# bytes API works on the realized value.
+# Subclasses override `data` to realize into a different type (e.g. bytearray),
+# and implement whatever methods they can do better.
+
+
+def _data(value: object) -> object:
+    return value.data if isinstance(value, AbcBytes) else value
+
+
+class AbcBytes(collections.abc.ByteString):
+    data = property(lambda s: s.__bytes__())
+
+    def __bytes__(self):
+        raise NotImplementedError
+
+    def __mod__(self, args): return self.data % args
+
+    # the following methods are defined in alphabetical order:
+    def capitalize(self): return self.data.capitalize()
+
+    def center(self, width, fillbyte=b' '):
+        return self.data.center(width, _data(fillbyte))
+
+    def count(self, sub, *args): return self.data.count(_data(sub), *args)
+
+    def decode(self, encoding='utf-8', errors='strict'):
+        return self.data.decode(encoding, errors)
+
+    def endswith(self, suffix, *args): return self.data.endswith(_data(suffix), *args)
+    def expandtabs(self, tabsize=8): return self.data.expandtabs(tabsize)
+    def find(self, sub, *args): return self.data.find(_data(sub), *args)
+    fromhex = bytes.fromhex
+    def hex(self, *args): return self.data.hex(*args)
+    def index(self, sub, *args): return self.data.index(_data(sub), *args)
+    def isalnum(self): return self.data.isalnum()
+    def isalpha(self): return self.data.isalpha()
+    def isascii(self): return self.data.isascii()
+    def isdigit(self): return self.data.isdigit()
+    def islower(self): return self.data.islower()
+    def isspace(self): return self.data.isspace()
+    def istitle(self): return self.data.istitle()
+    def isupper(self): return self.data.isupper()
+    def join(self, iterable_of_bytes): return self.data.join(map(_data, iterable_of_bytes))
+
+    def ljust(self, width, fillbyte=b' '):
+        return self.data.ljust(width, _data(fillbyte))
+
+    def lower(self): return self.data.lower()
+    def lstrip(self, chars=None): return self.data.lstrip(_data(chars))
+    maketrans = bytes.maketrans
+    def partition(self, sep): return self.data.partition(_data(sep))
+
+    def replace(self, old, new, count=-1):
+        return self.data.replace(_data(old), _data(new), count)
+
+    def rfind(self, sub, *args): return self.data.rfind(_data(sub), *args)
+    def rindex(self, sub, *args): return self.data.rindex(_data(sub), *args)
+
+    def rjust(self, width, fillbyte=b' '):
+        return self.data.rjust(width, _data(fillbyte))
+
+    def rpartition(self, sep): return self.data.rpartition(_data(sep))
+
+    def rsplit(self, sep=None, maxsplit=-1):
+        return self.data.rsplit(_data(sep), maxsplit)
+
+    def rstrip(self, chars=None): return self.data.rstrip(_data(chars))
+
+    def split(self, sep=None, maxsplit=-1):
+        return self.data.split(_data(sep), maxsplit)
+
+    def splitlines(self, keepends=False): return self.data.splitlines(keepends)
+    def startswith(self, prefix, *args): return self.data.startswith(_data(prefix), *args)
+    def strip(self, chars=None): return self.data.strip(_data(chars))
+    def swapcase(self): return self.data.swapcase()
+    def title(self): return self.data.title()
+
+    def translate(self, table, delete=b''):
+        return self.data.translate(_data(table), _data(delete))
+
+    def upper(self): return self.data.upper()
+    def zfill(self, width): return self.data.zfill(width)
@@ -0,0 +1,250 @@
+'''
+Finds out which watched files have changed.
+
+On Linux, changes are pushed to us through inotify (via ctypes, so there
+are no extra dependencies); elsewhere, we fall back to polling file
+modification times.
+'''
+
+import ctypes
+import ctypes.util
+import os
+import os.path
+import select
+import struct
+import time
+from typing import *
+
+from crosshair.util import debug
+
+
+def walk_files(paths: Iterable[str],
+               include: Callable[[str], bool] = lambda filename: True) -> Iterator[str]:
+    '''
+    Lists the existing files among the given paths, and the files under the
+    given directories whose names pass the `include` filter.
+    '''
+    for name in paths:
+        if os.path.isdir(name):
+            for (dirpath, dirs, files) in os.walk(name):
+                for curfile in files:
+                    if include(curfile):
+                        yield os.path.join(dirpath, curfile)
+        elif os.path.exists(name):
+            yield name
+
+
+def mtime(path: str) -> Optional[float]:
+    ''' The modification time of the file, or None if it does not exist. '''
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class ChangeDetector:
+    '''
+    Reports the files (under the given paths) that may have been created,
+    modified, or deleted since the last call.
+    '''
+    def __init__(self, paths: Iterable[str]):
+        self._paths = [os.path.abspath(p) for p in paths]
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        '''
+        Waits (up to `timeout` seconds) for something to change, and returns
+        the paths of the files that changed. Changes may be reported spuriously.
+        '''
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'ChangeDetector':
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class PollingChangeDetector(ChangeDetector):
+    '''
+    Re-scans every file's modification time (at most) once per `poll_interval`.
+    '''
+    _next_poll: float = 0.0
+
+    def __init__(self, paths: Iterable[str], poll_interval: float = 1.0):
+        ChangeDetector.__init__(self, paths)
+        self._poll_interval = poll_interval
+        self._modtimes = {f: mtime(f) for f in walk_files(self._paths)}
+
+    def _poll(self) -> Set[str]:
+        modtimes = self._modtimes
+        current = {f: mtime(f) for f in walk_files(self._paths)}
+        changed = {f for f, t in current.items() if modtimes.get(f) != t}
+        changed.update(f for f in modtimes.keys() if f not in current)
+        self._modtimes = current
+        self._next_poll = time.time() + self._poll_interval
+        return changed
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        deadline = time.time() + timeout
+        while True:
+            now = time.time()
+            if now >= self._next_poll:
+                changed = self._poll()
+                if changed:
+                    return changed
+            if self._next_poll > deadline:
+                return set()
+            time.sleep(max(0.0, self._next_poll - now))
+
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+               _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_inotify() -> Optional[ctypes.CDLL]:
+    if not hasattr(select, 'poll'):
+        return None
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        # (accessing the functions raises AttributeError when missing)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class InotifyChangeDetector(ChangeDetector):
+    '''
+    Watches every directory under the given paths with inotify.
+    (inotify watches are not recursive)
+    Directly watched files are tracked through their parent directory, so that
+    we notice editors that save by replacing the file.
+    '''
+    def __init__(self, paths: Iterable[str], libc: ctypes.CDLL):
+        ChangeDetector.__init__(self, paths)
+        self._libc = libc
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self._poller = select.poll()
+        self._poller.register(fd, select.POLLIN)
+        self._dirs_by_wd: Dict[int, str] = {}
+        # Directories to report everything in, or None when only specific files matter:
+        self._watched_dirs: Dict[str, Optional[Set[str]]] = {}
+        for path in self._paths:
+            if os.path.isdir(path):
+                self._watch_tree(path)
+            else:
+                dirname, filename = os.path.split(path)
+                files = self._watched_dirs.get(dirname, set())
+                if files is not None:
+                    files.add(filename)
+                    self._watch_dir(dirname, files)
+
+    def _watch_dir(self, dirname: str, files: Optional[Set[str]]) -> None:
+        self._watched_dirs[dirname] = files
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirname), _WATCH_MASK)
+        if wd < 0:
+            debug(f'Unable to watch "{dirname}": {os.strerror(ctypes.get_errno())}')
+            return
+        self._dirs_by_wd[wd] = dirname
+
+    def _watch_tree(self, root: str) -> Set[str]:
+        ''' Watches the directories under `root`, returning the files found. '''
+        found: Set[str] = set()
+        for (dirpath, dirs, files) in os.walk(root):
+            self._watch_dir(dirpath, None)
+            found.update(os.path.join(dirpath, f) for f in files)
+        return found
+
+    def _rescan(self) -> Set[str]:
+        debug('inotify event queue overflowed; reporting all files as changed')
+        everything = set()
+        for dirname, files in self._watched_dirs.items():
+            if files is None:
+                everything.update(walk_files([dirname]))
+            else:
+                everything.update(os.path.join(dirname, f) for f in files)
+        return everything
+
+    def _read_events(self) -> Set[str]:
+        changed: Set[str] = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(buf[offset: offset + name_len].rstrip(b'\0'))
+                offset += name_len
+                if mask & _IN_Q_OVERFLOW:
+                    changed.update(self._rescan())
+                    continue
+                dirname = self._dirs_by_wd.get(wd)
+                if dirname is None:
+                    continue
+                if mask & _IN_IGNORED:  # (the watch was removed)
+                    del self._dirs_by_wd[wd]
+                    continue
+                if not name:
+                    continue
+                files = self._watched_dirs.get(dirname)
+                if files is not None and name not in files:
+                    continue
+                path = os.path.join(dirname, name)
+                if mask & _IN_ISDIR:
+                    if files is None and mask & (_IN_CREATE | _IN_MOVED_TO):
+                        changed.update(self._watch_tree(path))
+                    continue
+                changed.add(path)
+
+    def wait_for_changes(self, timeout: float) -> Set[str]:
+        try:
+            ready = self._poller.poll(int(timeout * 1000))
+        except InterruptedError:
+            ready = []
+        if not ready:
+            return set()
+        return self._read_events()
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def make_change_detector(paths: Iterable[str]) -> ChangeDetector:
+    paths = list(paths)
+    libc = _load_inotify()
+    if libc is not None:
+        try:
+            return InotifyChangeDetector(paths, libc)
+        except OSError as e:
+            debug(f'Unable to use inotify ({e}); falling back to polling')
+    return PollingChangeDetector(paths)
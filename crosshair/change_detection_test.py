@@ -0,0 +1,97 @@
+import os
+import os.path
+import shutil
+import tempfile
+import time
+import unittest
+
+from crosshair.change_detection import *
+
+
+def wait_for(detector: ChangeDetector, path: str, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if path in detector.wait_for_changes(timeout=0.2):
+            return True
+    return False
+
+
+def write_file(path: str, content: str) -> None:
+    with open(path, 'w') as fh:
+        fh.write(content)
+
+
+class ChangeDetectorTests:
+    def make_detector(self, paths) -> ChangeDetector:
+        raise NotImplementedError
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_file_lifecycle(self):
+        path = os.path.join(self.root, 'a.py')
+        with self.make_detector([self.root]) as detector:
+            write_file(path, 'x = 1')
+            self.assertTrue(wait_for(detector, path))
+            write_file(path, 'x = 2')
+            os.utime(path, (time.time() + 5, time.time() + 5))
+            self.assertTrue(wait_for(detector, path))
+            os.unlink(path)
+            self.assertTrue(wait_for(detector, path))
+
+    def test_new_subdirectory(self):
+        subdir = os.path.join(self.root, 'sub')
+        path = os.path.join(subdir, 'b.py')
+        with self.make_detector([self.root]) as detector:
+            os.mkdir(subdir)
+            write_file(path, 'y = 1')
+            self.assertTrue(wait_for(detector, path))
+
+    def test_watched_file_replaced(self):
+        path = os.path.join(self.root, 'a.py')
+        other = os.path.join(self.root, 'other.py')
+        write_file(path, 'x = 1')
+        with self.make_detector([path]) as detector:
+            tmp_path = os.path.join(self.root, 'a.py.tmp')
+            write_file(tmp_path, 'x = 2')
+            os.utime(tmp_path, (time.time() + 5, time.time() + 5))
+            os.replace(tmp_path, path)
+            self.assertTrue(wait_for(detector, path))
+            write_file(other, 'z = 1')
+            self.assertNotIn(other, detector.wait_for_changes(timeout=0.2))
+
+
+class PollingChangeDetectorTest(ChangeDetectorTests, unittest.TestCase):
+    def make_detector(self, paths) -> ChangeDetector:
+        return PollingChangeDetector(paths, poll_interval=0.05)
+
+
+class InotifyChangeDetectorTest(ChangeDetectorTests, unittest.TestCase):
+    def make_detector(self, paths) -> ChangeDetector:
+        detector = make_change_detector(paths)
+        if not isinstance(detector, InotifyChangeDetector):
+            self.skipTest('inotify is not available')
+        return detector
+
+
+class WalkFilesTest(unittest.TestCase):
+    def test_include_filters_directory_contents(self):
+        root = os.path.realpath(tempfile.mkdtemp())
+        try:
+            os.mkdir(os.path.join(root, 'sub'))
+            for name in ('a.py', 'b.txt', os.path.join('sub', 'c.py')):
+                write_file(os.path.join(root, name), '')
+            named = os.path.join(root, 'b.txt')
+            missing = os.path.join(root, 'missing.py')
+            found = walk_files([root, named, missing], lambda name: name.endswith('.py'))
+            self.assertEqual(sorted(found), [os.path.join(root, 'a.py'), named,
+                                             os.path.join(root, 'sub', 'c.py')])
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,7 +17,9 @@ from dataclasses import dataclass, replace
 from typing import *
 import ast
 import builtins
+import codecs
 import collections
+import contextlib
 import copy
 import enum
 import inspect
@@ -27,6 +29,9 @@ import functools
 import linecache
 import operator
 import os.path
+import random
+import re
+import string
 import sys
 import time
 import traceback
@@ -38,13 +43,16 @@ import z3  # type: ignore
 
 from crosshair import contracted_builtins
 from crosshair import dynamic_typing
+from crosshair.abcbytes import AbcBytes
 from crosshair.abcstring import AbcString
 from crosshair.condition_parser import get_fn_conditions, get_class_conditions, ConditionExpr, Conditions, fn_globals
-from crosshair.enforce import EnforcedConditions, PostconditionFailed
+from crosshair.corpus import CounterexampleCorpus
+from crosshair.enforce import EnforcedConditions, PostconditionFailed, PreconditionFailed
 from crosshair.objectproxy import ObjectProxy
-from crosshair.simplestructs import SimpleDict, SequenceConcatenation, SliceView, ShellMutableSequence
-from crosshair.statespace import ReplayStateSpace, TrackingStateSpace, StateSpace, HeapRef, SnapshotRef, SearchTreeNode, model_value_to_python, VerificationStatus, IgnoreAttempt, SinglePathNode, CallAnalysis, MessageType, AnalysisMessage
-from crosshair.util import CrosshairInternal, UnexploredPath, IdentityWrapper, AttributeHolder, CrosshairUnsupported, is_iterable
+from crosshair.simplestructs import SimpleDict, SequenceConcatenation, SliceView, ShellMutableSequence, concatenate
+from crosshair.statespace import ConcreteStateSpace, ReplayStateSpace, TrackingStateSpace, StateSpace, HeapRef, SnapshotRef, SearchTreeNode, model_value_to_python, VerificationStatus, IgnoreAttempt, SinglePathNode, CallAnalysis, MessageType, AnalysisMessage, SEARCH_STRATEGIES
+from crosshair.type_handlers import InputNotUnpackableError, make_reader, unpack_signature
+from crosshair.util import CrosshairInternal, UnexploredPath, IdentityWrapper, AttributeHolder, CrosshairUnsupported, PathTimeout, AnalysisCancelled, is_iterable
 from crosshair.util import debug, set_debug, extract_module_from_file, walk_qualname
 from crosshair.type_repo import PYTYPE_SORT, get_subclass_map
 
@@ -86,9 +94,9 @@ class PatchedBuiltins:
         self._patches = patches
         self._enabled = enabled
 
-    def patch(self, key: str, patched_fn: Callable):
-        orig_fn = builtins.__dict__[key]
-        self._originals[key] = orig_fn
+    def patch(self, namespace: Dict[str, object], key: str, patched_fn: Callable):
+        orig_fn = cast(Callable, namespace[key])
+        self._originals.append((namespace, key, orig_fn))
         enabled = self._enabled
 
         def call_if_enabled(*a, **kw):
@@ -97,28 +105,29 @@ class PatchedBuiltins:
             else:
                 return orig_fn(*a, **kw)
         functools.update_wrapper(call_if_enabled, orig_fn)
-        builtins.__dict__[key] = call_if_enabled
+        namespace[key] = call_if_enabled
 
     def __enter__(self):
         patches = self._patches
         added_keys = []
-        self._added_keys = added_keys
-        originals = {}
+        originals: List[Tuple[Dict[str, object], str, Callable]] = []
         self._originals = originals
         for key, val in patches.items():
             if key.startswith('_') or not isinstance(val, Callable):
                 continue
             if hasattr(builtins, key):
-                self.patch(key, val)
+                self.patch(builtins.__dict__, key, val)
             else:
                 added_keys.append(key)
                 builtins.__dict__[key] = val
+        for (module_name, fn_name), patched_fn in _PATCH_REGISTRATIONS.items():
+            self.patch(sys.modules[module_name].__dict__, fn_name, patched_fn)
         self._added_keys = added_keys
-        self._originals = originals
 
     def __exit__(self, exc_type, exc_value, tb):
+        for namespace, key, orig_fn in reversed(self._originals):
+            namespace[key] = orig_fn
         bdict = builtins.__dict__
-        bdict.update(self._originals)
         for key in self._added_keys:
             del bdict[key]
 
@@ -157,11 +166,12 @@ class ExceptionFilter:
             return True
         if isinstance(exc_value, TypeError):
             exc_str = str(exc_value)
-            if 'SmtStr' in exc_str or 'SmtInt' in exc_str or 'SmtFloat' in exc_str:
+            # (e.g. a symbolic value was passed to a C function that requires the real type)
+            if any(name in exc_str for name in stand_in_type_names()):
                 # Ideally we'd attempt literal strings after encountering this.
                 # See https://github.com/pschanely/CrossHair/issues/8
                 raise CrosshairUnsupported('Detected proxy intolerance: '+exc_str)
-        if isinstance(exc_value, (UnexploredPath, CrosshairInternal, z3.Z3Exception)):
+        if isinstance(exc_value, (UnexploredPath, CrosshairInternal, z3.Z3Exception, AnalysisCancelled)):
             return False  # internal issue: re-raise
         if isinstance(exc_value, BaseException):  # TODO: should this be "Exception" instead?
             # Most other issues are assumed to be user-level exceptions:
@@ -325,11 +335,36 @@ _NUMERIC_PROMOTION_FNS = {
     (float, float): lambda x, y: (x, y, float),
 }
 
+def smt_str_value(value: str) -> z3.ExprRef:
+    '''
+    Makes a solver string for a concrete str.
+
+    The solver's characters are all in the latin-1 range, but z3's Python API
+    only accepts ASCII, so other characters are written as SMT-LIB escapes.
+
+    >>> smt_str_value('caf\xe9')
+    "caf\xe9"
+    '''
+    if value.isascii():
+        return z3.StringVal(value)
+    if not is_latin1(value):
+        raise CrosshairUnsupported('Symbolic strings only hold the first 256 code points')
+    escaped = ''.join(c if ' ' <= c <= '~' and c not in '"\\' else f'\\x{ord(c):02x}'
+                      for c in value)
+    (assertion,) = z3.parse_smt2_string(f'(assert (= "{escaped}" ""))')
+    return assertion.arg(0)
+
+
+def is_latin1(value: str) -> bool:
+    ''' Whether a str could be held in a symbolic string. '''
+    return all(c <= '\xff' for c in value)
+
+
 _LITERAL_PROMOTION_FNS = {
     bool: z3.BoolVal,
     int: z3.IntVal,
     float: z3.RealVal if _SMT_FLOAT_SORT == z3.RealSort() else (lambda v: z3.FPVal(v, _SMT_FLOAT_SORT)),
-    str: z3.StringVal,
+    str: smt_str_value,
 }
 
 def smt_coerce(val: Any) -> z3.ExprRef:
@@ -341,7 +376,9 @@ def coerce_to_smt_sort(space: StateSpace, input_value: Any, desired_sort: z3.Sor
     natural_value = None
     input_value = typeable_value(input_value)
     promotion_fn = _LITERAL_PROMOTION_FNS.get(type(input_value))
-    if isinstance(input_value, SmtBackedValue):
+    if isinstance(input_value, SmtBytes):
+        pass  # (bytes share the sort of strings, but are not interchangeable with them)
+    elif isinstance(input_value, SmtBackedValue):
         natural_value = input_value.var
         if type(natural_value) is tuple:
             # Many container types aren't described by a single z3 value:
@@ -394,11 +431,34 @@ def realize(value: object):
         return cast(SmtType, value)._realized()
     elif type(value) is SmtCallable:
         return value # we don't realize callables right now
+    elif type(value) is SmtByteArray:
+        return bytearray(cast(SmtByteArray, value).__bytes__())
     return origin_of(value.python_type)(value)
 
 class CrossHairValue:
     pass
 
+class EmulatedValue:
+    '''
+    A mixin for stand-ins that behave like instances of `_emulated_type`.
+    isinstance() and issubclass() treat the stand-in as that type.
+    '''
+    _emulated_type: type
+
+    @classmethod
+    def _is_subclass_of_(cls, other):
+        return other in cls.__mro__ or issubclass(cls._emulated_type, other)
+
+def stand_in_type_names() -> Set[str]:
+    ''' The names of the classes that stand in for values during symbolic execution. '''
+    names = set()
+    pending = [CrossHairValue, EmulatedValue]
+    while pending:
+        cls = pending.pop()
+        names.add(cls.__name__)
+        pending.extend(cls.__subclasses__())
+    return names
+
 class SmtBackedValue(CrossHairValue):
     def __init__(self, statespace: StateSpace, typ: Type, smtvar: object):
         self.statespace = statespace
@@ -561,6 +621,12 @@ class SmtNumberAble(SmtBackedValue):
             return False
         return SmtBool(self.statespace, bool, result[0])
 
+    def __ne__(self, other):
+        result = self._numeric_binary_smt_op(other, operator.ne)
+        if result is None:
+            return True
+        return SmtBool(self.statespace, bool, result[0])
+
     def __add__(self, other):
         return self._numeric_binary_op(other, operator.add)
 
@@ -617,6 +683,9 @@ class SmtNumberAble(SmtBackedValue):
         return coerce_to_ch_value(other, self.statespace).__or__(self)
 
 class SmtIntable(SmtNumberAble):
+    def _apply_bitwise(self, op: Callable, v1: int, v2: int) -> int:
+        return op(v1.__index__(), v2.__index__())
+
     # bitwise operators
     def __invert__(self):
         return -(self + 1)
@@ -657,6 +726,16 @@ class SmtBool(SmtIntable):
     def __index__(self):
         return SmtInt(self.statespace, int, smt_bool_to_int(self.var))
 
+    def __and__(self, other):
+        if not isinstance(other, (bool, SmtBool)):
+            return SmtIntable.__and__(self, other)
+        return self._binary_op(other, z3.And)
+
+    def __or__(self, other):
+        if not isinstance(other, (bool, SmtBool)):
+            return SmtIntable.__or__(self, other)
+        return self._binary_op(other, z3.Or)
+
     def __xor__(self, other):
         return self._binary_op(other, z3.Xor)
 
@@ -679,15 +758,26 @@ class SmtBool(SmtIntable):
         return self._numeric_binary_op(other, operator.sub)
 
 
+def smt_floordiv(x: z3.ArithRef, y: z3.ArithRef) -> z3.ArithRef:
+    # (Z3's division rounds toward negative infinity only for positive divisors)
+    if z3.is_int_value(y):
+        return x / y if y.as_long() >= 0 else (-x) / (-y)
+    return z3.If(y >= 0, x / y, (-x) / (-y))
+
+
+def smt_mod(x: z3.ArithRef, y: z3.ArithRef) -> z3.ArithRef:
+    # (Z3's remainders are never negative; Python's take the sign of the divisor)
+    if z3.is_int_value(y):
+        return x % y if y.as_long() >= 0 else -((-x) % (-y))
+    return z3.If(y >= 0, x % y, -((-x) % (-y)))
+
+
 class SmtInt(SmtIntable):
     def __init__(self, statespace: StateSpace, typ: Type, smtvar: Union[str, z3.ArithRef]):
         assert typ == int
         assert type(smtvar) != int
         SmtIntable.__init__(self, statespace, typ, smtvar)
 
-    def _apply_bitwise(self, op: Callable, v1: int, v2: int) -> int:
-        return op(v1.__index__(), v2.__index__())
-
     def __repr__(self):
         return self.__index__().__repr__()
 
@@ -718,19 +808,39 @@ class SmtInt(SmtIntable):
     def __truediv__(self, other):
         return self.__float__() / other
 
+    def to_bytes(self, length, byteorder, *, signed=False):
+        if byteorder not in ('big', 'little'):
+            raise ValueError("byteorder must be either 'little' or 'big'")
+        length = realize(length)
+        limit = 256 ** length
+        if signed:
+            if not (-(limit // 2) <= self < limit // 2):
+                raise OverflowError('int too big to convert')
+        else:
+            if self < 0:
+                raise OverflowError("can't convert negative int to unsigned")
+            if self >= limit:
+                raise OverflowError('int too big to convert')
+        unsigned = z3.If(self.var < 0, self.var + limit, self.var)
+        smt_bytes = [z3.Unit(z3.Int2BV((unsigned / (256 ** i)) % 256, 8)) for i in range(length)]
+        if byteorder == 'big':
+            smt_bytes.reverse()
+        return SmtBytes(self.statespace, bytes,
+                        functools.reduce(z3.Concat, smt_bytes, z3.Empty(_SMT_BYTES_SORT)))
+
     def __floordiv__(self, other):
         if not isinstance(other, (bool, int, SmtInt, SmtBool)):
             return realize(self) // realize(other)
-        return self._numeric_binary_op(other, lambda x, y: z3.If(
-            x % y == 0 or x >= 0, x / y, z3.If(y >= 0, x / y + 1, x / y - 1)))
+        if other == 0:
+            raise ZeroDivisionError()
+        return self._numeric_binary_op(other, smt_floordiv)
 
     def __mod__(self, other):
         if not isinstance(other, (bool, int, SmtInt, SmtBool)):
             return realize(self) % realize(other)
         if other == 0:
             raise ZeroDivisionError()
-        return self._numeric_binary_op(other, operator.mod)
-        #return self._binary_op(other, operator.mod)
+        return self._numeric_binary_op(other, smt_mod)
 
 
 _Z3_ONE_HALF = z3.RealVal("1/2")
@@ -814,6 +924,11 @@ def convert(val: object, target_type: type) -> object:
     return val
 
 
+# Iteration decides the length of a symbolic dict or set a chunk at a time:
+# each choice is among this many lengths (or longer):
+_ITERATION_LENGTH_SPLIT = 4
+
+
 class SmtDictOrSet(SmtBackedValue):
     def __init__(self, statespace: StateSpace, typ: Type, smtvar: object):
         self.key_pytype = normalize_pytype(type_arg_of(typ, 0))
@@ -833,6 +948,48 @@ class SmtDictOrSet(SmtBackedValue):
     def __bool__(self):
         return SmtBool(self.statespace, bool, self._len() != 0).__bool__()
 
+    def _with_entry(self, contents: z3.ExprRef, key: z3.ExprRef) -> z3.ExprRef:
+        ''' Adds an entry for the (new) key to an array of contents. '''
+        raise NotImplementedError
+
+    def _iteration_keys(self) -> Iterator[z3.ExprRef]:
+        '''
+        Makes distinct symbolic keys for the entries, as they are needed.
+        The length is decided a chunk at a time, with one choice among the next
+        few lengths (instead of forking once per entry). Once the last chunk is
+        known, the contents are reconciled with all of the keys at once (before
+        the last chunk is yielded, so that its keys are fully constrained).
+        '''
+        space = self.statespace
+        arr_var, len_var = self._arr(), z3.simplify(self._len())
+        known_len = len_var.as_long() if z3.is_int_value(len_var) else None
+        domain = arr_var.sort().domain()
+        keys: List[z3.ExprRef] = []
+        contents = self.empty
+        while True:
+            start = len(keys)
+            if known_len is not None:
+                chunk_len = known_len - start
+            else:
+                chunk_len = space.choose_among(
+                    [len_var == start + count for count in range(_ITERATION_LENGTH_SPLIT)] +
+                    [len_var >= start + _ITERATION_LENGTH_SPLIT])
+            chunk = [z3.Const('k' + str(idx) + space.uniq(), domain)
+                     for idx in range(start, start + chunk_len)]
+            for key in chunk:
+                contents = self._with_entry(contents, key)
+                space.add(z3.And(arr_var[key] == contents[key], *[key != k for k in keys]))
+                keys.append(key)
+            is_last = known_len is not None or chunk_len < _ITERATION_LENGTH_SPLIT
+            if is_last:
+                # In this conditional, we reconcile the parallel symbolic variables for length
+                # and contents:
+                if not space.choose_possible(arr_var == contents, favor_true=True):
+                    raise IgnoreAttempt(f'{type(self).__name__} in inconsistent state')
+            yield from chunk
+            if is_last:
+                return
+
 
 class SmtDict(SmtDictOrSet, collections.abc.MutableMapping):
     def __init__(self, statespace: StateSpace, typ: Type, smtvar: object):
@@ -912,33 +1069,16 @@ class SmtDict(SmtDictOrSet, collections.abc.MutableMapping):
                                    self.val_accessor(possibly_missing),
                                    self.val_pytype)
 
+    def _with_entry(self, contents: z3.ExprRef, key: z3.ExprRef) -> z3.ExprRef:
+        value = z3.Const('v' + self.statespace.uniq(), self.val_constructor.domain(0))
+        return z3.Store(contents, key, self.val_constructor(value))
+
     def __iter__(self):
-        arr_var, len_var = self.var
-        idx = 0
-        arr_sort = self._arr().sort()
-        missing = self.val_missing_constructor()
-        while SmtBool(self.statespace, bool, idx < len_var).__bool__():
-            if SmtBool(self.statespace, bool, arr_var == self.empty).__bool__():
-                raise IgnoreAttempt('SmtDict in inconsistent state')
-            k = z3.Const('k' + str(idx) + self.statespace.uniq(),
-                         arr_sort.domain())
-            v = z3.Const('v' + str(idx) + self.statespace.uniq(),
-                         self.val_constructor.domain(0))
-            remaining = z3.Const('remaining' + str(idx) +
-                                 self.statespace.uniq(), arr_sort)
-            idx += 1
-            self.statespace.add(arr_var == z3.Store(
-                remaining, k, self.val_constructor(v)))
-            self.statespace.add(z3.Select(remaining, k) == missing)
+        for k in self._iteration_keys():
             yield smt_to_ch_value(self.statespace,
                                   self.snapshot,
                                   k,
                                   self.key_pytype)
-            arr_var = remaining
-        # In this conditional, we reconcile the parallel symbolic variables for length
-        # and contents:
-        if SmtBool(self.statespace, bool, arr_var != self.empty).__bool__():
-            raise IgnoreAttempt('SmtDict in inconsistent state')
 
     def copy(self):
         return SmtDict(self.statespace, self.python_type, self.var)
@@ -999,26 +1139,12 @@ class SmtSet(SmtDictOrSet, collections.abc.Set):
         present = self._arr()[k]
         return SmtBool(self.statespace, bool, present)
 
+    def _with_entry(self, contents: z3.ExprRef, key: z3.ExprRef) -> z3.ExprRef:
+        return z3.Store(contents, key, True)
+
     def __iter__(self):
-        arr_var, len_var = self.var
-        idx = 0
-        arr_sort = self._arr().sort()
-        while SmtBool(self.statespace, bool, idx < len_var).__bool__():
-            if SmtBool(self.statespace, bool, arr_var == self.empty).__bool__():
-                raise IgnoreAttempt('SmtSet in inconsistent state')
-            k = z3.Const('k' + str(idx) + self.statespace.uniq(),
-                         arr_sort.domain())
-            remaining = z3.Const('remaining' + str(idx) +
-                                 self.statespace.uniq(), arr_sort)
-            idx += 1
-            self.statespace.add(arr_var == z3.Store(remaining, k, True))
-            self.statespace.add(z3.Not(z3.Select(remaining, k)))
+        for k in self._iteration_keys():
             yield smt_to_ch_value(self.statespace, self.snapshot, k, self.key_pytype)
-            arr_var = remaining
-        # In this conditional, we reconcile the parallel symbolic variables for length
-        # and contents:
-        if SmtBool(self.statespace, bool, arr_var != self.empty).__bool__():
-            raise IgnoreAttempt('SmtSet in inconsistent state')
 
     # Hardwire some operations into abc methods
     # (SmtBackedValue defaults these operations into
@@ -1145,6 +1271,34 @@ class SmtSequence(SmtBackedValue):
     def __bool__(self):
         return SmtBool(self.statespace, bool, z3.Length(self.var) > 0).__bool__()
 
+    def _smt_bounds(self, start, end) -> Tuple[z3.ExprRef, z3.ExprRef]:
+        ''' Interprets optional start and end arguments the way that str.find() does. '''
+        smt_len = z3.Length(self.var)
+        def adjust(idx, default):
+            if idx is None:
+                return default
+            if not isinstance(idx, (int, SmtInt)):
+                raise TypeError('slice indices must be integers or None or have an __index__ method')
+            idx = smt_coerce(idx)
+            return z3.If(idx >= 0, idx, z3.If(smt_len + idx >= 0, smt_len + idx, 0))
+        smt_start = adjust(start, z3.IntVal(0))
+        smt_end = adjust(end, smt_len)
+        return (smt_start, z3.If(smt_end > smt_len, smt_len, smt_end))
+
+    def _affix_test(self, affix, start, end, smt_test, method_name: str):
+        affixes = affix if isinstance(affix, tuple) else (affix,)
+        smt_affixes = [self._smt_affix_arg(a, method_name) for a in affixes]
+        (smt_start, smt_end) = self._smt_bounds(start, end)
+        region = z3.Extract(self.var, smt_start, smt_end - smt_start)
+        return SmtBool(self.statespace, bool, z3.Or(*[
+            z3.And(smt_start + z3.Length(a) <= smt_end, smt_test(a, region))
+            for a in smt_affixes]))
+
+
+# Up to this length, constraints over all the elements of a sequence are written
+# out term-by-term, instead of with quantifiers (which the solver often cannot decide):
+_UNROLLED_LENGTH_LIMIT = 16
+
 
 class SmtArrayBasedUniformTuple(SmtSequence):
     def __init__(self, statespace: StateSpace, typ: Type, smtvar: Union[str, Tuple]):
@@ -1185,10 +1339,51 @@ class SmtArrayBasedUniformTuple(SmtSequence):
     def __bool__(self):
         return SmtBool(self.statespace, bool, self._len() != 0).__bool__()
     
+    def _length_bound(self) -> Optional[int]:
+        '''
+        Returns a small upper bound on the length, if there is one, so that
+        constraints over the elements can be written out without quantifiers.
+        '''
+        len_var = z3.simplify(self._len())
+        if z3.is_int_value(len_var):
+            length = len_var.as_long()
+            return length if length <= _UNROLLED_LENGTH_LIMIT else None
+        if self.statespace.solver.check(len_var > _UNROLLED_LENGTH_LIMIT) == z3.unsat:
+            return _UNROLLED_LENGTH_LIMIT
+        return None
+
+    def _unrolled_eq(self, other) -> Optional[z3.ExprRef]:
+        ''' Writes out equality as one (quantifier-free) expression, when we can. '''
+        if smt_sort_has_heapref(self.item_smt_sort):
+            return None
+        (self_arr, self_len) = self.var
+        if type(other) in (list, tuple):
+            smt_items = [coerce_to_smt_sort(self.statespace, item, self.item_smt_sort)
+                         for item in other]
+            if any(smt_item is None for smt_item in smt_items):
+                return None
+            return z3.And(self_len == len(smt_items),
+                          *[self_arr[idx] == smt_item for idx, smt_item in enumerate(smt_items)])
+        if isinstance(other, SmtArrayBasedUniformTuple) and other.item_smt_sort == self.item_smt_sort:
+            bound = self._length_bound()
+            if bound is None:
+                return None
+            (other_arr, other_len) = other.var
+            return z3.And(self_len == other_len,
+                          *[z3.Implies(idx < self_len, self_arr[idx] == other_arr[idx])
+                            for idx in range(bound)])
+        return None
+
     def __eq__(self, other):
         (self_arr, self_len) = self.var
         if not is_iterable(other):
             return False
+        with self.statespace.framework():
+            unrolled = self._unrolled_eq(other)
+        if unrolled is not None:
+            self.statespace.stats['sequence_eq:unrolled'] += 1
+            return SmtBool(self.statespace, bool, unrolled)
+        self.statespace.stats['sequence_eq:elementwise'] += 1
         if len(self) != len(other):
             return False
         for idx, v in enumerate(other):
@@ -1230,10 +1425,10 @@ class SmtArrayBasedUniformTuple(SmtSequence):
             idx += 1
 
     def __add__(self, other):
-        return SequenceConcatenation(self, other)
+        return concatenate(self, other)
 
     def __radd__(self, other):
-        return SequenceConcatenation(other, self)
+        return concatenate(other, self)
 
     def __contains__(self, other):
         space = self.statespace
@@ -1250,9 +1445,17 @@ class SmtArrayBasedUniformTuple(SmtSequence):
                 if smt_other is None: # couldn't coerce the type. TODO: right now this is none when `other` is a proxy of object.
                     return False
                 # TODO: test smt_item nullness (incorrect type)
-                idx_in_range = z3.Exists(idx, z3.And(0 <= idx,
-                                                     idx < self._len(),
-                                                     z3.Select(self._arr(), idx) == smt_other))
+                bound = self._length_bound()
+                if bound is not None:
+                    space.stats['sequence_contains:unrolled'] += 1
+                    idx_in_range = z3.Or(False, *[
+                        z3.And(i < self._len(), z3.Select(self._arr(), i) == smt_other)
+                        for i in range(bound)])
+                else:
+                    space.stats['sequence_contains:quantified'] += 1
+                    idx_in_range = z3.Exists(idx, z3.And(0 <= idx,
+                                                         idx < self._len(),
+                                                         z3.Select(self._arr(), idx) == smt_other))
                 return SmtBool(space, bool, idx_in_range)
 
     def __getitem__(self, i):
@@ -1481,6 +1684,54 @@ class SmtUniformTuple(SmtArrayBasedUniformTuple, collections.abc.Sequence, colle
         return tuple(self).__hash__()
 
 
+# z3 characters are bytes; these classes only cover the ASCII ones.
+# (methods fall back to realization for strings with other characters)
+_SMT_ASCII_CHAR = z3.Range('\x00', '\x7f')
+_SMT_DIGIT_CHAR = z3.Range('0', '9')
+_SMT_ALPHA_CHAR = z3.Union(z3.Range('a', 'z'), z3.Range('A', 'Z'))
+_SMT_SPACE_CHAR = z3.Union(*[z3.Re(z3.StringVal(c)) for c in map(chr, range(128)) if c.isspace()])
+_ASCII_UPPER = {c: c.upper() for c in string.ascii_lowercase}
+_ASCII_LOWER = {c: c.lower() for c in string.ascii_uppercase}
+
+# The codecs whose (ASCII) conversions we can perform without realization, by alias:
+# (looked up in advance, because the codec modules cannot be imported during analysis)
+_SYMBOLIC_CODECS = {alias: codecs.lookup(alias).name for alias in (
+    'ascii', 'us-ascii', 'utf-8', 'utf8', 'latin-1', 'latin1', 'iso-8859-1', 'iso8859-1')}
+
+# Conversions in a %-format template; those with only a key and a type of "s", "d" or "i"
+# are formatted symbolically:
+_PERCENT_SPEC = re.compile(r'%(?:\(([^)]*)\))?([-+ #0-9.*hlL]*)(.?)')
+
+
+def smt_int_to_str(smt_int: z3.ExprRef) -> z3.ExprRef:
+    return z3.If(smt_int >= 0,
+                 z3.IntToStr(smt_int),
+                 z3.Concat(z3.StringVal('-'), z3.IntToStr(-smt_int)))
+
+
+def smt_str_for_value(value: object, fmt: Callable[[object], str] = str) -> z3.ExprRef:
+    '''
+    Gets the string form of a value, without realizing symbolic strings and
+    integers. (`fmt` formats anything else)
+    '''
+    if isinstance(value, SmtStr):
+        return value.var
+    if isinstance(value, SmtInt):
+        return smt_int_to_str(value.var)
+    return smt_str_value(fmt(value))
+
+
+def _beyond_latin1(value: object) -> bool:
+    # (symbolic strings cannot hold, and so never contain, such a str)
+    return type(value) is str and not is_latin1(value)
+
+
+def _holdable_affixes(affix: object) -> object:
+    if isinstance(affix, tuple):
+        return tuple(a for a in affix if not _beyond_latin1(a))
+    return () if _beyond_latin1(affix) else affix
+
+
 class SmtStr(SmtSequence, AbcString):
     def __init__(self, statespace: StateSpace, typ: Type, smtvar: object):
         assert typ == str
@@ -1501,13 +1752,91 @@ class SmtStr(SmtSequence, AbcString):
         return hash(self.__str__())
 
     def __add__(self, other):
+        if isinstance(other, SmtBytes):
+            raise TypeError('can only concatenate str (not "bytes") to str')
         return self._binary_op(other, operator.add)
 
     def __radd__(self, other):
+        if isinstance(other, SmtBytes):
+            raise TypeError("can't concat str to bytes")
         return self._binary_op(other, lambda a, b: b + a)
 
-    def __mod__(self, other):
-        return self.__str__() % realize(other)
+    def __mod__(self, args):
+        if not self.statespace.smt_fork(z3.Contains(self.var, z3.StringVal('%'))):
+            # Without any conversions, formatting only checks the arguments:
+            if isinstance(args, tuple) and len(args) > 0 or isinstance(args, (str, SmtStr)) or (
+                    not isinstance(args, tuple) and not hasattr(args, '__getitem__')):
+                raise TypeError('not all arguments converted during string formatting')
+            return self
+        template = self.__str__()
+        is_mapping = not isinstance(args, (tuple, str, SmtStr)) and hasattr(args, '__getitem__')
+        positional = args if isinstance(args, tuple) else (args,)
+        arg_idx = 0
+        pieces = []
+        literal_start = 0
+        for match in _PERCENT_SPEC.finditer(template):
+            key, flags, conversion = match.groups()
+            if '*' in flags or not conversion:
+                return template % (args if is_mapping else tuple(map(realize, positional)))
+            pieces.append(smt_str_value(template[literal_start:match.start()]))
+            literal_start = match.end()
+            if conversion == '%' and key is None:
+                pieces.append(z3.StringVal('%'))
+                continue
+            if key is not None:
+                if not is_mapping:
+                    raise TypeError('format requires a mapping')
+                value = args[key]
+            else:
+                if arg_idx >= len(positional):
+                    raise TypeError('not enough arguments for format string')
+                value = positional[arg_idx]
+                arg_idx += 1
+            if flags == '' and (conversion == 's' or (
+                    conversion in 'di' and isinstance(value, SmtInt) and value.python_type is int)):
+                pieces.append(smt_str_for_value(value))
+            else:
+                pieces.append(smt_str_value(('%' + flags + conversion) % (realize(value),)))
+        pieces.append(smt_str_value(template[literal_start:]))
+        if arg_idx < len(positional) and not is_mapping:
+            raise TypeError('not all arguments converted during string formatting')
+        return SmtStr(self.statespace, str, functools.reduce(z3.Concat, pieces))
+
+    def format(self, *args, **kwargs):
+        if not self.statespace.smt_fork(z3.Or(z3.Contains(self.var, z3.StringVal('{')),
+                                              z3.Contains(self.var, z3.StringVal('}')))):
+            return self
+        template = self.__str__()
+        formatter = string.Formatter()
+        auto_idx: Optional[int] = 0
+        pieces = [z3.StringVal('')]
+        try:
+            parsed = list(formatter.parse(template))
+        except ValueError:
+            return template.format(*args, **kwargs)  # (to raise the usual error)
+        for (literal, field_name, format_spec, conversion) in parsed:
+            pieces.append(smt_str_value(literal))
+            if field_name is None:
+                continue
+            if field_name == '':
+                if auto_idx is None:
+                    raise ValueError('cannot switch from manual field specification to automatic field numbering')
+                field_name = str(auto_idx)
+                auto_idx += 1
+            elif field_name.isdigit():
+                if auto_idx:
+                    raise ValueError('cannot switch from automatic field numbering to manual field specification')
+                auto_idx = None
+            if not (field_name.isdigit() or field_name.isidentifier()) or '{' in format_spec:
+                # (attribute/index lookups and nested fields)
+                return template.format(*args, **kwargs)
+            value = args[int(field_name)] if field_name.isdigit() else kwargs[field_name]
+            if conversion is None and format_spec == '':
+                pieces.append(smt_str_for_value(value, lambda v: format(v, '')))
+            else:
+                value = formatter.convert_field(value, conversion)
+                pieces.append(smt_str_value(formatter.format_field(realize(value), format_spec)))
+        return SmtStr(self.statespace, str, functools.reduce(z3.Concat, pieces))
 
     def __mul__(self, other):
         if not isinstance(other, (int, SmtInt)):
@@ -1541,7 +1870,12 @@ class SmtStr(SmtSequence, AbcString):
         return self._cmp_op(other, operator.ge)
 
     def __contains__(self, other):
-        return SmtBool(self.statespace, bool, z3.Contains(self.var, smt_coerce(other)))
+        if _beyond_latin1(other):
+            return False
+        smt_other = coerce_to_smt_sort(self.statespace, other, z3.StringSort())
+        if smt_other is None:
+            raise TypeError(f"'in <string>' requires string as left operand, not {name_of_type(type(other))}")
+        return SmtBool(self.statespace, bool, z3.Contains(self.var, smt_other))
 
     def __getitem__(self, i):
         idx_or_pair = process_slice_vs_symbolic_len(
@@ -1553,12 +1887,427 @@ class SmtStr(SmtSequence, AbcString):
             smt_result = z3.Extract(self.var, idx_or_pair, 1)
         return SmtStr(self.statespace, str, smt_result)
 
+    def _is_ascii(self) -> bool:
+        return self.statespace.choose_possible(
+            z3.InRe(self.var, z3.Star(_SMT_ASCII_CHAR)), favor_true=True)
+
+    def _smt_str_arg(self, value: object, description: str) -> z3.ExprRef:
+        smt_value = coerce_to_smt_sort(self.statespace, value, z3.StringSort())
+        if smt_value is None:
+            raise TypeError(f'{description} must be str, not {name_of_type(type(value))}')
+        return smt_value
+
+    def _smt_affix_arg(self, value: object, method_name: str) -> z3.ExprRef:
+        smt_value = coerce_to_smt_sort(self.statespace, value, z3.StringSort())
+        if smt_value is None:
+            raise TypeError(f'{method_name} first arg must be str or a tuple of str, '
+                            f'not {name_of_type(type(value))}')
+        return smt_value
+
+    def startswith(self, prefix, start=None, end=None):
+        prefix = _holdable_affixes(prefix)
+        if isinstance(prefix, tuple) and not prefix:
+            return False
+        return self._affix_test(prefix, start, end, z3.PrefixOf, 'startswith')
+
+    def endswith(self, suffix, start=None, end=None):
+        suffix = _holdable_affixes(suffix)
+        if isinstance(suffix, tuple) and not suffix:
+            return False
+        return self._affix_test(suffix, start, end, z3.SuffixOf, 'endswith')
+
     def find(self, substr, start=None, end=None):
-        if end is None:
-            return SmtInt(self.statespace, int,
-                          z3.IndexOf(self.var, smt_coerce(substr), start or 0))
+        if _beyond_latin1(substr):
+            return -1
+        smt_substr = self._smt_str_arg(substr, 'substring')
+        (smt_start, smt_end) = self._smt_bounds(start, end)
+        return SmtInt(self.statespace, int,
+                      z3.IndexOf(z3.Extract(self.var, 0, smt_end), smt_substr, smt_start))
+
+    def index(self, substr, start=None, end=None):
+        idx = self.find(substr, start, end)
+        if idx == -1:
+            raise ValueError('substring not found')
+        return idx
+
+    def count(self, substr, start=None, end=None):
+        if _beyond_latin1(substr):
+            return 0
+        space = self.statespace
+        smt_substr = self._smt_str_arg(substr, 'substring')
+        (smt_start, smt_end) = self._smt_bounds(start, end)
+        if not space.smt_fork(z3.Length(smt_substr) > 0):
+            # (the empty string is found between every character)
+            return SmtInt(space, int, z3.If(smt_start > smt_end, 0, smt_end - smt_start + 1))
+        remaining = z3.Extract(self.var, smt_start, smt_end - smt_start)
+        found = 0
+        while True:
+            idx = z3.IndexOf(remaining, smt_substr, 0)
+            if not space.smt_fork(idx >= 0):
+                return found
+            found += 1
+            remaining = z3.Extract(remaining, idx + z3.Length(smt_substr),
+                                   z3.Length(remaining) - idx - z3.Length(smt_substr))
+
+    def replace(self, old, new, count=-1):
+        if _beyond_latin1(old):
+            return self
+        if _beyond_latin1(new):
+            return self.__str__().replace(old, new, realize(count))
+        space = self.statespace
+        smt_old = self._smt_str_arg(old, 'replace() argument 1')
+        smt_new = self._smt_str_arg(new, 'replace() argument 2')
+        if not space.smt_fork(z3.Length(smt_old) > 0):
+            return self.__str__().replace(realize(old), realize(new), realize(count))
+        pieces = []
+        remaining = self.var
+        while count < 0 or len(pieces) < count:
+            idx = z3.IndexOf(remaining, smt_old, 0)
+            if not space.smt_fork(idx >= 0):
+                break
+            pieces.append(z3.Concat(z3.Extract(remaining, 0, idx), smt_new))
+            remaining = z3.Extract(remaining, idx + z3.Length(smt_old),
+                                   z3.Length(remaining) - idx - z3.Length(smt_old))
+        return SmtStr(space, str, functools.reduce(z3.Concat, pieces + [remaining]))
+
+    def split(self, sep=None, maxsplit=-1):
+        if sep is None:
+            # (splitting on runs of whitespace)
+            return self.__str__().split(None, realize(maxsplit))
+        if _beyond_latin1(sep):
+            return [self]
+        space = self.statespace
+        smt_sep = self._smt_str_arg(sep, 'separator')
+        if not space.smt_fork(z3.Length(smt_sep) > 0):
+            raise ValueError('empty separator')
+        pieces = []
+        remaining = self.var
+        while maxsplit < 0 or len(pieces) < maxsplit:
+            idx = z3.IndexOf(remaining, smt_sep, 0)
+            if not space.smt_fork(idx >= 0):
+                break
+            pieces.append(SmtStr(space, str, z3.Extract(remaining, 0, idx)))
+            remaining = z3.Extract(remaining, idx + z3.Length(smt_sep),
+                                   z3.Length(remaining) - idx - z3.Length(smt_sep))
+        pieces.append(SmtStr(space, str, remaining))
+        return pieces
+
+    def _strip(self, chars, left: bool, right: bool, method_name: str):
+        if chars is None:
+            if not self._is_ascii():
+                return getattr(self.__str__(), method_name)()
+            char_class = _SMT_SPACE_CHAR
         else:
-            return self.__getitem__(slice(start, end, 1)).index(s)
+            chars = realize(chars)
+            if not isinstance(chars, str):
+                raise TypeError(f'{method_name} arg must be None or str')
+            if not chars:
+                return self
+            if not chars.isascii():
+                return getattr(self.__str__(), method_name)(chars)
+            char_class = z3.Union(*[z3.Re(z3.StringVal(c)) for c in set(chars)])
+        # Rather than forking on each character, describe the parts that get stripped:
+        space = self.statespace
+        uniq = space.uniq()
+        stripped = z3.String('stripped' + uniq)
+        head = z3.String('strippedhead' + uniq) if left else z3.StringVal('')
+        tail = z3.String('strippedtail' + uniq) if right else z3.StringVal('')
+        stripped_len = z3.Length(stripped)
+        space.add(self.var == z3.Concat(head, stripped, tail))
+        space.add(z3.InRe(head, z3.Star(char_class)))
+        space.add(z3.InRe(tail, z3.Star(char_class)))
+        if left:
+            space.add(z3.Implies(stripped_len > 0, z3.Not(
+                z3.InRe(z3.Extract(stripped, 0, 1), char_class))))
+        if right:
+            space.add(z3.Implies(stripped_len > 0, z3.Not(
+                z3.InRe(z3.Extract(stripped, stripped_len - 1, 1), char_class))))
+        return SmtStr(space, str, stripped)
+
+    def strip(self, chars=None):
+        return self._strip(chars, True, True, 'strip')
+
+    def lstrip(self, chars=None):
+        return self._strip(chars, True, False, 'lstrip')
+
+    def rstrip(self, chars=None):
+        return self._strip(chars, False, True, 'rstrip')
+
+    def join(self, items):
+        items = list(items)
+        if any(map(_beyond_latin1, items)):
+            return self.__str__().join(map(realize, items))
+        pieces = []
+        for item in items:
+            if pieces:
+                pieces.append(self.var)
+            if not isinstance(item, (str, SmtStr)):
+                raise TypeError(f'sequence item {len(pieces) // 2}: expected str instance, '
+                                f'{name_of_type(type(item))} found')
+            pieces.append(smt_coerce(item) if isinstance(item, SmtStr) else smt_str_value(item))
+        if not pieces:
+            return ''
+        return SmtStr(self.statespace, str, functools.reduce(z3.Concat, pieces))
+
+    def encode(self, encoding='utf-8', errors='strict'):
+        codec = _SYMBOLIC_CODECS.get(encoding.lower().replace('_', '-'))
+        # (the solver's characters are all in the latin-1 range)
+        if codec == 'iso8859-1' or (codec in ('ascii', 'utf-8') and self._is_ascii()):
+            return SmtBytes(self.statespace, bytes, self.var)
+        return self.__str__().encode(encoding, errors)
+
+    def _map_ascii_chars(self, mapping: Mapping[str, str], method_name: str):
+        if not self._is_ascii():
+            return getattr(self.__str__(), method_name)()
+        # Without sequence-mapping operations in the solver, we map character by character,
+        # which requires a concrete length:
+        chars = []
+        for idx in range(realize(self.__len__())):
+            char = z3.Extract(self.var, idx, 1)
+            mapped = char
+            for (before, after) in mapping.items():
+                mapped = z3.If(char == z3.StringVal(before), z3.StringVal(after), mapped)
+            chars.append(mapped)
+        if not chars:
+            return ''
+        return SmtStr(self.statespace, str, functools.reduce(z3.Concat, chars))
+
+    def lower(self):
+        return self._map_ascii_chars(_ASCII_LOWER, 'lower')
+
+    def upper(self):
+        return self._map_ascii_chars(_ASCII_UPPER, 'upper')
+
+    def _matches_ascii_class(self, char_class: z3.ReRef, method_name: str):
+        if not self._is_ascii():
+            return getattr(self.__str__(), method_name)()
+        return SmtBool(self.statespace, bool, z3.InRe(self.var, z3.Plus(char_class)))
+
+    def isascii(self):
+        return SmtBool(self.statespace, bool, z3.InRe(self.var, z3.Star(_SMT_ASCII_CHAR)))
+
+    def isdigit(self):
+        return self._matches_ascii_class(_SMT_DIGIT_CHAR, 'isdigit')
+
+    def isdecimal(self):
+        return self._matches_ascii_class(_SMT_DIGIT_CHAR, 'isdecimal')
+
+    def isnumeric(self):
+        return self._matches_ascii_class(_SMT_DIGIT_CHAR, 'isnumeric')
+
+    def isalpha(self):
+        return self._matches_ascii_class(_SMT_ALPHA_CHAR, 'isalpha')
+
+    def isalnum(self):
+        return self._matches_ascii_class(z3.Union(_SMT_ALPHA_CHAR, _SMT_DIGIT_CHAR), 'isalnum')
+
+    def isspace(self):
+        return self._matches_ascii_class(_SMT_SPACE_CHAR, 'isspace')
+
+
+# (z3 represents strings as sequences of bytes, so this is the same sort as z3.StringSort())
+_SMT_BYTES_SORT = z3.SeqSort(z3.BitVecSort(8))
+
+
+def smt_bytes_value(value: bytes) -> z3.ExprRef:
+    if not value:
+        return z3.Empty(_SMT_BYTES_SORT)
+    return functools.reduce(z3.Concat, [z3.Unit(z3.BitVecVal(b, 8)) for b in value])
+
+
+def smt_byte_value(space: StateSpace, value: object) -> z3.ExprRef:
+    if not isinstance(value, (int, SmtInt)):
+        raise TypeError(f"'{name_of_type(type(value))}' object cannot be interpreted as an integer")
+    if not (0 <= value < 256):
+        raise ValueError('byte must be in range(0, 256)')
+    if isinstance(value, int):
+        return z3.BitVecVal(value, 8)
+    return z3.Int2BV(smt_coerce(value), 8)
+
+
+class SmtBytes(SmtSequence, AbcBytes):
+    def __init__(self, statespace: StateSpace, typ: Type, smtvar: object):
+        assert typ == bytes
+        SmtBackedValue.__init__(self, statespace, typ, smtvar)
+
+    def __init_var__(self, typ, varname):
+        return z3.Const(varname, _SMT_BYTES_SORT)
+
+    def _new(self, smtvar: z3.ExprRef) -> 'SmtBytes':
+        return self.__class__(self.statespace, self.python_type, smtvar)
+
+    def _smt_bytes_arg(self, value: object, description: str) -> z3.ExprRef:
+        if isinstance(value, SmtBytes):
+            return value.var
+        if isinstance(value, (bytes, bytearray)):
+            return smt_bytes_value(value)
+        raise TypeError(f'{description}, not {name_of_type(type(value))}')
+
+    def __bytes__(self):
+        # (model strings hold one character per byte)
+        return self.statespace.find_model_value(self.var).encode('latin-1')
+
+    def __copy__(self):
+        return self._new(self.var)
+
+    def __repr__(self):
+        return repr(self.python_type(self.__bytes__()))
+
+    def __hash__(self):
+        return hash(self.__bytes__())
+
+    def __eq__(self, other):
+        if not isinstance(other, (bytes, bytearray, SmtBytes)):
+            return False
+        return SmtBool(self.statespace, bool, self.var == self._smt_bytes_arg(other, ''))
+
+    def _cmp_op(self, other, op):
+        smt_other = self._smt_bytes_arg(other, "comparison requires a bytes-like object")
+        return SmtBool(self.statespace, bool, op(self.var, smt_other))
+
+    def __lt__(self, other):
+        return self._cmp_op(other, operator.lt)
+
+    def __le__(self, other):
+        return self._cmp_op(other, operator.le)
+
+    def __gt__(self, other):
+        return self._cmp_op(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._cmp_op(other, operator.ge)
+
+    def __add__(self, other):
+        return self._new(z3.Concat(self.var, self._smt_bytes_arg(
+            other, "can't concat to bytes; a bytes-like object is required")))
+
+    def __radd__(self, other):
+        smt_other = self._smt_bytes_arg(other, "can't concat to bytes; a bytes-like object is required")
+        ret_type = bytearray if isinstance(other, bytearray) else bytes
+        return _PYTYPE_TO_WRAPPER_TYPE[ret_type](self.statespace, ret_type, z3.Concat(smt_other, self.var))
+
+    def __mul__(self, count):
+        if not isinstance(count, (int, SmtInt)):
+            raise TypeError(f"can't multiply sequence by non-int of type '{name_of_type(type(count))}'")
+        return self._new(functools.reduce(z3.Concat, [self.var] * max(0, realize(count)),
+                                          z3.Empty(_SMT_BYTES_SORT)))
+
+    def __rmul__(self, count):
+        return self.__mul__(count)
+
+    def __getitem__(self, i):
+        idx_or_pair = process_slice_vs_symbolic_len(self.statespace, i, z3.Length(self.var))
+        if isinstance(idx_or_pair, tuple):
+            (start, stop) = idx_or_pair
+            return self._new(z3.Extract(self.var, start, stop - start))
+        return SmtInt(self.statespace, int, z3.BV2Int(self.var[idx_or_pair]))
+
+    def __contains__(self, item):
+        if isinstance(item, (int, SmtInt)):
+            smt_item = z3.Unit(smt_byte_value(self.statespace, item))
+        else:
+            smt_item = self._smt_bytes_arg(item, 'a bytes-like object is required')
+        return SmtBool(self.statespace, bool, z3.Contains(self.var, smt_item))
+
+    def _smt_affix_arg(self, value: object, method_name: str) -> z3.ExprRef:
+        return self._smt_bytes_arg(value, f'{method_name} first arg must be bytes or a tuple of bytes')
+
+    def startswith(self, prefix, start=None, end=None):
+        return self._affix_test(prefix, start, end, z3.PrefixOf, 'startswith')
+
+    def endswith(self, suffix, start=None, end=None):
+        return self._affix_test(suffix, start, end, z3.SuffixOf, 'endswith')
+
+    def _smt_sub_arg(self, sub) -> z3.ExprRef:
+        if isinstance(sub, (int, SmtInt)):
+            return z3.Unit(smt_byte_value(self.statespace, sub))
+        return self._smt_bytes_arg(sub, 'argument should be integer or bytes-like object')
+
+    def find(self, sub, start=None, end=None):
+        smt_sub = self._smt_sub_arg(sub)
+        (smt_start, smt_end) = self._smt_bounds(start, end)
+        return SmtInt(self.statespace, int,
+                      z3.IndexOf(z3.Extract(self.var, 0, smt_end), smt_sub, smt_start))
+
+    def index(self, sub, start=None, end=None):
+        idx = self.find(sub, start, end)
+        if idx == -1:
+            raise ValueError('subsection not found')
+        return idx
+
+    def decode(self, encoding='utf-8', errors='strict'):
+        codec = _SYMBOLIC_CODECS.get(encoding.lower().replace('_', '-'))
+        if codec == 'iso8859-1' or (codec in ('ascii', 'utf-8') and self.statespace.choose_possible(
+                z3.InRe(self.var, z3.Star(_SMT_ASCII_CHAR)), favor_true=True)):
+            return SmtStr(self.statespace, str, self.var)
+        return self.__bytes__().decode(encoding, errors)
+
+
+class SmtByteArray(SmtBytes, collections.abc.MutableSequence):
+    def __init__(self, statespace: StateSpace, typ: Type, smtvar: object):
+        assert typ == bytearray
+        SmtBackedValue.__init__(self, statespace, typ, smtvar)
+
+    __hash__ = None  # type: ignore
+    data = property(lambda s: bytearray(s.__bytes__()))
+    fromhex = bytearray.fromhex
+
+    def __setitem__(self, i, value):
+        smt_len = z3.Length(self.var)
+        idx_or_pair = process_slice_vs_symbolic_len(self.statespace, i, smt_len)
+        if isinstance(idx_or_pair, tuple):
+            (start, stop) = idx_or_pair
+            # (as in Python, a slice that ends before it starts is empty)
+            stop = z3.If(stop < start, start, stop)
+            if is_iterable(value) and not isinstance(value, (bytes, bytearray, SmtBytes, str, SmtStr)):
+                replacement = functools.reduce(
+                    z3.Concat, [z3.Unit(smt_byte_value(self.statespace, v)) for v in value],
+                    z3.Empty(_SMT_BYTES_SORT))
+            else:
+                replacement = self._smt_bytes_arg(value, 'can assign only bytes, buffers, or iterables of ints in range(0, 256)')
+        else:
+            (start, stop) = (idx_or_pair, idx_or_pair + 1)
+            replacement = z3.Unit(smt_byte_value(self.statespace, value))
+        self.var = z3.Concat(z3.Extract(self.var, 0, start), replacement,
+                             z3.Extract(self.var, stop, smt_len - stop))
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            self.__setitem__(i, b'')
+            return
+        smt_len = z3.Length(self.var)
+        idx = process_slice_vs_symbolic_len(self.statespace, i, smt_len)
+        self.var = z3.Concat(z3.Extract(self.var, 0, idx), z3.Extract(self.var, idx + 1, smt_len - idx - 1))
+
+    def insert(self, i, value):
+        smt_len = z3.Length(self.var)
+        smt_byte = z3.Unit(smt_byte_value(self.statespace, value))
+        smt_i = smt_coerce(i)
+        idx = z3.If(smt_i < 0, z3.If(smt_len + smt_i < 0, 0, smt_len + smt_i),
+                    z3.If(smt_i > smt_len, smt_len, smt_i))
+        self.var = z3.Concat(z3.Extract(self.var, 0, idx), smt_byte,
+                             z3.Extract(self.var, idx, smt_len - idx))
+
+    def append(self, value):
+        self.var = z3.Concat(self.var, z3.Unit(smt_byte_value(self.statespace, value)))
+
+    def extend(self, values):
+        if isinstance(values, (bytes, bytearray, SmtBytes)):
+            self.var = z3.Concat(self.var, self._smt_bytes_arg(values, ''))
+        else:
+            for value in values:
+                self.append(value)
+
+    def __iadd__(self, other):
+        self.var = z3.Concat(self.var, self._smt_bytes_arg(
+            other, "can't concat to bytearray; a bytes-like object is required"))
+        return self
+
+    def clear(self):
+        self.var = z3.Empty(_SMT_BYTES_SORT)
+
+    def copy(self):
+        return self.__copy__()
 
 
 _CACHED_TYPE_ENUMS: Dict[FrozenSet[type], z3.SortRef] = {}
@@ -1581,10 +2330,8 @@ class SmtUnion:
         self.pytypes = list(pytypes)
 
     def __call__(self, statespace, pytype, varname):
-        for typ in self.pytypes[:-1]:
-            if statespace.smt_fork():
-                return proxy_for_type(typ, statespace, varname)
-        return proxy_for_type(self.pytypes[-1], statespace, varname)
+        typ = self.pytypes[statespace.choose_index(len(self.pytypes))]
+        return proxy_for_type(typ, statespace, varname)
 
 
 class SmtProxyMarker:
@@ -1638,13 +2385,11 @@ def choose_type(space: StateSpace, from_type: Type) -> Type:
     # preference for false when forking:
     if not subtypes or not space.smt_fork():
         return from_type
-    for subtype in subtypes[:-1]:
-        if not space.smt_fork():
-            return choose_type(space, subtype)
-    return choose_type(space, subtypes[-1])
+    return choose_type(space, subtypes[space.choose_index(len(subtypes))])
 
 
 _SIMPLE_PROXIES: MutableMapping[object, Callable] = {}
+_PATCH_REGISTRATIONS: MutableMapping[Tuple[str, str], Callable] = {}  # (module name, function name) -> patch
 
 _RESOLVED_FNS: Set[IdentityWrapper[Callable]] = set()
 def get_resolved_signature(fn: Callable) -> inspect.Signature:
@@ -1753,6 +2498,21 @@ def register_type(typ: Type,
             f'Only origin types may be registered, not "{typ}": try "{origin_of(typ)}" instead.'
     _SIMPLE_PROXIES[typ] = creator
 
+def register_patch(orig_fn: Callable, patched_fn: Callable,
+                   module: Optional[types.ModuleType] = None) -> None:
+    '''
+    Replaces a module-level function while symbolic execution is running.
+
+    The patch is installed under the original's name in its defining module
+    (or in `module`, for functions that callers look up through a module that
+    re-exports them), so it only affects calls that look the function up
+    through that module.
+    '''
+    module_name = orig_fn.__module__ if module is None else module.__name__
+    assert getattr(sys.modules.get(module_name), orig_fn.__name__, None) is orig_fn, \
+            f'Only module-level functions may be patched, not "{orig_fn}".'
+    _PATCH_REGISTRATIONS[(module_name, orig_fn.__name__)] = patched_fn
+
 def proxy_for_type(typ: Type, space: StateSpace, varname: str,
                    meet_class_invariants=True,
                    allow_subtypes=False) -> object:
@@ -1767,10 +2527,7 @@ def proxy_for_type(typ: Type, space: StateSpace, varname: str,
                          for (idx, t) in enumerate(typ.__args__))
     elif isinstance(typ, type) and issubclass(typ, enum.Enum):
         enum_values = list(typ)  # type:ignore
-        for enum_value in enum_values[:-1]:
-            if space.smt_fork():
-                return enum_value
-        return enum_values[-1]
+        return enum_values[space.choose_index(len(enum_values))]
     elif isinstance(origin, type) and issubclass(origin, Mapping):
         if hasattr(typ, '__args__'):
             args = typ.__args__
@@ -1865,7 +2622,12 @@ class AnalysisOptions:
     per_condition_timeout: float = 1.5
     deadline: float = float('NaN')
     per_path_timeout: float = 0.75
+    search_strategy: str = 'random'  # a key of statespace.SEARCH_STRATEGIES
+    per_condition_fuzz_timeout: float = 0.0  # concrete fuzzing before symbolic (0 disables)
+    corpus_dir: Optional[str] = None  # where to save counterexamples for replay
     stats: Optional[collections.Counter] = None
+    # When this returns True, analysis stops by raising AnalysisCancelled:
+    is_cancelled: Optional[Callable[[], bool]] = None
 
     def incr(self, key: str):
         if self.stats is not None:
@@ -1937,15 +2699,19 @@ def analyze_class(cls: type, options: AnalysisOptions = _DEFAULT_OPTIONS) -> Lis
     class_conditions = get_class_conditions(cls)
     for method, conditions in class_conditions.methods.items():
         if conditions.has_any():
-            cur_messages = analyze_function(getattr(cls, method),
-                                            options=options,
-                                            self_type=cls)
-            clamper = message_class_clamper(cls)
-            messages.extend(map(clamper, cur_messages))
+            messages.extend(analyze_method(cls, method, options))
 
     return messages.get()
 
 
+def analyze_method(cls: type, method_name: str, options: AnalysisOptions = _DEFAULT_OPTIONS) -> List[AnalysisMessage]:
+    cur_messages = analyze_function(getattr(cls, method_name),
+                                    options=options,
+                                    self_type=cls)
+    clamper = message_class_clamper(cls)
+    return list(map(clamper, cur_messages))
+
+
 def analyze_function(fn: Callable,
                      options: AnalysisOptions = _DEFAULT_OPTIONS,
                      self_type: Optional[type] = None) -> List[AnalysisMessage]:
@@ -1981,11 +2747,33 @@ def analyze_single_condition(fn: Callable,
     debug('Analyzing postcondition: "', conditions.post[0].expr_source, '"')
     debug('assuming preconditions: ', ','.join(
         [p.expr_source for p in conditions.pre]))
-    options.deadline = time.time() + options.per_condition_timeout
-
-    analysis = analyze_calltree(fn, options, conditions)
-
     (condition,) = conditions.post
+    fn_name = fn.__module__ + '.' + fn.__qualname__
+    corpus = CounterexampleCorpus(options.corpus_dir) if options.corpus_dir else None
+    analysis: Optional[CallTreeAnalysis] = None
+    if corpus is not None:
+        counterexample = corpus.get(fn_name, condition.expr_source)
+        if counterexample is not None:
+            replay_analysis = replay_counterexample(fn, options, conditions, counterexample)
+            if replay_analysis.verification_status is VerificationStatus.REFUTED:
+                analysis = replay_analysis
+            else:
+                debug('Saved counterexample no longer applies; removing it')
+                corpus.remove(fn_name, condition.expr_source)
+    if analysis is None and options.per_condition_fuzz_timeout > 0:
+        fuzz_analysis = fuzz_calltree(fn, options, conditions)
+        if fuzz_analysis.verification_status is VerificationStatus.REFUTED:
+            analysis = fuzz_analysis
+    if analysis is None:
+        options.deadline = time.time() + options.per_condition_timeout
+        analysis = analyze_calltree(fn, options, conditions)
+
+    if corpus is not None:
+        for message in analysis.messages:
+            if message.counterexample is not None:
+                corpus.put(fn_name, condition.expr_source, message.counterexample)
+                break
+
     if analysis.verification_status is VerificationStatus.UNKNOWN:
         addl_ctx = ' ' + condition.addl_context if condition.addl_context else ''
         message = 'I cannot confirm this' + addl_ctx
@@ -2130,6 +2918,8 @@ def analyze_calltree(fn: Callable,
     failing_precondition_reason: str = ''
     num_confirmed_paths = 0
 
+    search_strategy = SEARCH_STRATEGIES[options.search_strategy]()
+
     cur_space: List[StateSpace] = [cast(StateSpace, None)]
     short_circuit = ShortCircuitingContext(lambda: cur_space[0])
     _ = get_subclass_map()  # ensure loaded
@@ -2148,16 +2938,21 @@ def analyze_calltree(fn: Callable,
             if start > options.deadline:
                 debug('Exceeded condition timeout, stopping')
                 break
+            if options.is_cancelled is not None and options.is_cancelled():
+                raise AnalysisCancelled
             options.incr('num_paths')
             debug('iteration ', i)
             space = TrackingStateSpace(execution_deadline=start + options.per_path_timeout,
                                        model_check_timeout=options.per_path_timeout / 2,
-                                       search_root=search_root)
+                                       search_root=search_root,
+                                       search_strategy=search_strategy,
+                                       is_cancelled=options.is_cancelled)
             cur_space[0] = space
             try:
                 # The real work happens here!:
-                call_analysis = attempt_call(
-                    conditions, space, fn, short_circuit, enforced_conditions)
+                with search_strategy.tracing(fn):
+                    call_analysis = attempt_call(
+                        conditions, space, fn, short_circuit, enforced_conditions)
                 if failing_precondition is not None:
                     cur_precondition = call_analysis.failing_precondition
                     if cur_precondition is None:
@@ -2178,7 +2973,10 @@ def analyze_calltree(fn: Callable,
             status = call_analysis.verification_status
             if status == VerificationStatus.CONFIRMED:
                 num_confirmed_paths += 1
+            if options.stats is not None:
+                options.stats.update(space.stats)
             top_analysis, space_exhausted = space.bubble_status(call_analysis)
+            search_strategy.path_finished(space)
             overall_status = top_analysis.verification_status if top_analysis else None
             debug('Iter complete', overall_status.name if overall_status else 'None',
                   'exhausted=', space_exhausted)
@@ -2215,9 +3013,165 @@ def analyze_calltree(fn: Callable,
                             num_confirmed_paths=num_confirmed_paths)
 
 
+@contextlib.contextmanager
+def concrete_deadline(deadline: float) -> Iterator[None]:
+    '''
+    Raises PathTimeout inside (traced) code that is still running past the deadline.
+    '''
+    def tracer(frame, event, arg):
+        if time.time() > deadline:
+            raise PathTimeout
+        return tracer
+    previous_trace = sys.gettrace()
+    sys.settrace(tracer)
+    try:
+        yield None
+    finally:
+        sys.settrace(previous_trace)
+
+
+def fuzz_buffer(rand: random.Random, size: int = 256) -> bytearray:
+    '''
+    Makes input bytes for the type_handlers unpackers. Buffers are biased
+    towards zeros (which unpack to 0, '', [], False, etc) so that the trivial
+    inputs are tried early and often.
+    '''
+    density = rand.random() ** 2
+    return bytearray(rand.randrange(256) if rand.random() < density else 0
+                     for _ in range(size))
+
+
+def analyze_concrete_calls(fn: Callable,
+                           options: AnalysisOptions,
+                           conditions: Conditions,
+                           deadline: float,
+                           make_inputs: Callable[[EnforcedConditions],
+                                                 Iterator[Optional[inspect.BoundArguments]]]
+                           ) -> CallTreeAnalysis:
+    '''
+    Calls the function with each of the concrete arguments from `make_inputs`
+    (None for an input that could not be made) until the deadline passes or a
+    counterexample is found. Concrete calls can never confirm a condition.
+    '''
+    rand = random.Random(fn.__qualname__)
+    cur_space: List[StateSpace] = [cast(StateSpace, None)]
+    short_circuit = ShortCircuitingContext(lambda: cur_space[0])
+    enforced_conditions = EnforcedConditions(fn_globals(fn), contracted_builtins.__dict__)
+    with enforced_conditions, enforced_conditions.disabled_enforcement():
+        for bound_args in make_inputs(enforced_conditions):
+            if time.time() > deadline:
+                break
+            if options.is_cancelled is not None and options.is_cancelled():
+                raise AnalysisCancelled
+            if bound_args is None:
+                continue
+            space = ConcreteStateSpace(model_check_timeout=options.per_path_timeout / 2, rand=rand)
+            cur_space[0] = space
+            try:
+                with concrete_deadline(time.time() + options.per_path_timeout):
+                    call_analysis = attempt_call(conditions, space, fn, short_circuit,
+                                                 enforced_conditions, bound_args)
+            except (UnexploredPath, IgnoreAttempt) as e:
+                debug('Skipping concrete input: ', name_of_type(type(e)), e)
+                continue
+            if call_analysis.verification_status is VerificationStatus.REFUTED:
+                messages = [replace(m, test_fn=fn.__qualname__,
+                                    condition_src=conditions.post[0].expr_source)
+                            for m in call_analysis.messages]
+                debug('Concrete call found a counterexample')
+                return CallTreeAnalysis(messages=messages,
+                                        verification_status=VerificationStatus.REFUTED)
+    return CallTreeAnalysis(messages=[], verification_status=VerificationStatus.UNKNOWN)
+
+
+def fuzz_calltree(fn: Callable,
+                  options: AnalysisOptions,
+                  conditions: Conditions) -> CallTreeAnalysis:
+    '''
+    Calls the function with concrete, randomly generated arguments until
+    `options.per_condition_fuzz_timeout` passes or a counterexample is found.
+    No symbolic values are involved, so this is much cheaper per input than
+    `analyze_calltree`.
+    '''
+    debug('Begin fuzzing ', fn.__name__)
+    rand = random.Random(fn.__qualname__)
+    sig = conditions.sig
+
+    def make_inputs(enforced_conditions: EnforcedConditions) -> Iterator[Optional[inspect.BoundArguments]]:
+        while True:
+            options.incr('num_fuzz_inputs')
+            try:
+                with enforced_conditions.enabled_enforcement():
+                    args, kwargs = unpack_signature(sig, make_reader(fuzz_buffer(rand)))
+                yield sig.bind(*args, **kwargs)
+            except (InputNotUnpackableError, TypeError) as e:
+                debug('Unable to create fuzzing input: ', e)
+                yield None
+    deadline = time.time() + options.per_condition_fuzz_timeout
+    return analyze_concrete_calls(fn, options, conditions, deadline, make_inputs)
+
+
+def replay_counterexample(fn: Callable,
+                          options: AnalysisOptions,
+                          conditions: Conditions,
+                          counterexample: str) -> CallTreeAnalysis:
+    '''
+    Concretely re-runs a counterexample, as saved in `AnalysisMessage.counterexample`.
+    Counterexamples are read back from the corpus directory, so they are only
+    parsed as literals, and never evaluated.
+    '''
+    debug('Replaying counterexample for ', fn.__name__, ': ', counterexample)
+
+    def make_inputs(enforced_conditions: EnforcedConditions) -> Iterator[Optional[inspect.BoundArguments]]:
+        try:
+            bound_args = conditions.sig.bind(**ast.literal_eval(counterexample))
+        except Exception as e:
+            debug('Unable to recreate counterexample: ', repr(e))
+            yield None
+            return
+        yield bound_args
+    deadline = time.time() + options.per_condition_timeout
+    return analyze_concrete_calls(fn, options, conditions, deadline, make_inputs)
+
+
+def repr_arguments(bound_args: inspect.BoundArguments) -> Dict[str, str]:
+    reprs: Dict[str, str] = {}
+    for argname, argval in list(bound_args.arguments.items()):
+        try:
+            repr_str = repr(argval)
+        except Exception as e:
+            if isinstance(e, IgnoreAttempt):
+                raise
+            debug(f'Exception attempting to repr input "{argname}": {repr(e)}')
+            repr_str = _UNABLE_TO_REPR
+        reprs[argname] = repr_str
+    return reprs
+
+
+def counterexample_from_reprs(arg_reprs: Mapping[str, str]) -> Optional[str]:
+    '''
+    Renders the arguments as source for a dictionary literal. Returns None
+    when some argument's repr is not a literal, because those cannot be
+    recreated safely. (see replay_counterexample)
+
+    >>> counterexample_from_reprs({'x': '0', 's': "'a'"})
+    "{'x': 0, 's': 'a'}"
+    >>> counterexample_from_reprs({'x': '<Foo object at 0x7f00>'}) is None
+    True
+    '''
+    if _UNABLE_TO_REPR in arg_reprs.values():
+        return None
+    counterexample = '{' + ', '.join(repr(k) + ': ' + v for k, v in arg_reprs.items()) + '}'
+    try:
+        ast.literal_eval(counterexample)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return counterexample
+
+
 def get_input_description(statespace: StateSpace,
                           fn_name: str,
-                          bound_args: inspect.BoundArguments,
+                          arg_reprs: Mapping[str, str],
                           return_val: object = _MISSING,
                           addl_context: str = '') -> str:
     debug('get_input_description: return_val: ', type(return_val))
@@ -2232,16 +3186,7 @@ def get_input_description(statespace: StateSpace,
             repr_str = _UNABLE_TO_REPR
         if repr_str != 'None':
             call_desc = call_desc + ' (which returns ' + repr_str + ')'
-    messages: List[str] = []
-    for argname, argval in list(bound_args.arguments.items()):
-        try:
-            repr_str = repr(argval)
-        except Exception as e:
-            if isinstance(e, IgnoreAttempt):
-                raise
-            debug(f'Exception attempting to repr input "{argname}": {repr(e)}')
-            repr_str = _UNABLE_TO_REPR
-        messages.append(argname + ' = ' + repr_str)
+    messages = [argname + ' = ' + repr_str for argname, repr_str in arg_reprs.items()]
     call_desc = fn_name + '(' + ', '.join(messages) + ')' + call_desc
 
     if addl_context:
@@ -2303,8 +3248,10 @@ def attempt_call(conditions: Conditions,
                  space: StateSpace,
                  fn: Callable,
                  short_circuit: ShortCircuitingContext,
-                 enforced_conditions: EnforcedConditions) -> CallAnalysis:
-    bound_args = gen_args(conditions.sig, space)
+                 enforced_conditions: EnforcedConditions,
+                 bound_args: Optional[inspect.BoundArguments] = None) -> CallAnalysis:
+    if bound_args is None:
+        bound_args = gen_args(conditions.sig, space)
 
     code_obj = fn.__code__
     fn_filename, fn_start_lineno = (
@@ -2372,11 +3319,13 @@ def attempt_call(conditions: Conditions,
         detail = name_of_type(type(e)) + ': ' + str(e)
         frame_filename, frame_lineno = frame_summary_for_fn(tb, fn)
         debug('exception while evaluating function body:', detail, frame_filename, 'line', frame_lineno)
-        detail += ' ' + get_input_description(space, fn.__name__, original_args, _MISSING)
+        arg_reprs = repr_arguments(original_args)
+        detail += ' ' + get_input_description(space, fn.__name__, arg_reprs, _MISSING)
         return CallAnalysis(VerificationStatus.REFUTED,
                             [AnalysisMessage(MessageType.EXEC_ERR,
                                              *locate_msg(detail, frame_filename, frame_lineno),
-                                             ''.join(tb.format()))])
+                                             ''.join(tb.format()),
+                                             counterexample=counterexample_from_reprs(arg_reprs))])
 
     for argname, argval in bound_args.arguments.items():
         if (conditions.mutable_args is not None and
@@ -2402,23 +3351,27 @@ def attempt_call(conditions: Conditions,
         return efilter.analysis
     elif efilter.user_exc is not None:
         (e, tb) = efilter.user_exc
+        arg_reprs = repr_arguments(original_args)
         detail = repr(e) + ' ' + get_input_description(space, fn.__name__,
-                                                       original_args, __return__, post_condition.addl_context)
+                                                       arg_reprs, __return__, post_condition.addl_context)
         debug('exception while calling postcondition:', detail)
         failures = [AnalysisMessage(MessageType.POST_ERR,
                                     *locate_msg(detail, post_condition.filename, post_condition.line),
-                                    ''.join(tb.format()))]
+                                    ''.join(tb.format()),
+                                    counterexample=counterexample_from_reprs(arg_reprs))]
         return CallAnalysis(VerificationStatus.REFUTED, failures)
     if isok:
         debug('Confirmed.')
         return CallAnalysis(VerificationStatus.CONFIRMED)
     else:
+        arg_reprs = repr_arguments(original_args)
         detail = 'false ' + \
                  get_input_description(
-                     space, fn.__name__, original_args, __return__, post_condition.addl_context)
+                     space, fn.__name__, arg_reprs, __return__, post_condition.addl_context)
         debug(detail)
         failures = [AnalysisMessage(MessageType.POST_FAIL,
-                                    *locate_msg(detail, post_condition.filename, post_condition.line), '')]
+                                    *locate_msg(detail, post_condition.filename, post_condition.line), '',
+                                    counterexample=counterexample_from_reprs(arg_reprs))]
         return CallAnalysis(VerificationStatus.REFUTED, failures)
 
 
@@ -2428,6 +3381,8 @@ _PYTYPE_TO_WRAPPER_TYPE = {
     int: SmtInt,
     float: SmtFloat,
     str: SmtStr,
+    bytes: SmtBytes,
+    bytearray: SmtByteArray,
     list: SmtList,
     dict: SmtDict,
     set: SmtMutableSet,
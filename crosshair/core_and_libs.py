@@ -1,10 +1,12 @@
 from crosshair.core import analyze_function
 from crosshair.core import analyze_any
 from crosshair.core import analyze_class
+from crosshair.core import analyze_method
 from crosshair.core import analyze_module
 from crosshair.core import analyzable_members
 from crosshair.core import AnalysisMessage
 from crosshair.core import AnalysisOptions
+from crosshair.core import MessageCollector
 from crosshair.core import MessageType
 from crosshair.core import exception_line_in_file
 
@@ -3,14 +3,19 @@ import copy
 import dataclasses
 import enum
 import math
+import os
 import sys
+import tempfile
+import time
 import unittest
 from typing import *
 
 from crosshair.core import make_fake_object
 from crosshair.core import SmtFloat
 from crosshair.core import SmtInt
+from crosshair.core import SmtDict
 from crosshair.core import SmtList
+from crosshair.core import SmtMutableSet
 from crosshair.core import crosshair_type_for_python_type
 from crosshair.core_and_libs import *
 import crosshair.examples.arith
@@ -22,12 +27,9 @@ from crosshair.test_util import check_post_err
 from crosshair.test_util import check_fail
 from crosshair.test_util import check_unknown
 from crosshair.test_util import check_messages
-from crosshair.util import set_debug
-from crosshair.statespace import SimpleStateSpace
-
-
-
-
+from crosshair.util import set_debug, AnalysisCancelled, CrosshairInternal
+from crosshair.corpus import CounterexampleCorpus
+from crosshair.statespace import SimpleStateSpace, SinglePathNode, TrackingStateSpace
 
 
 #
@@ -255,6 +257,27 @@ class BooleanTest(unittest.TestCase):
             return a or b or c or d
         self.assertEqual(*check_ok(f))
 
+    def test_bool_bitwise_ok(self) -> None:
+        def f(a: bool, b: bool) -> Tuple[bool, bool]:
+            ''' post: _ == ((a and b), (a or b)) '''
+            return (a & b, a | b)
+        self.assertEqual(*check_ok(f))
+
+    def test_bool_bitwise_with_int_fail(self) -> None:
+        def f(a: bool, n: int) -> int:
+            ''' post: _ != 5 '''
+            return a | n
+        self.assertEqual(*check_fail(f))
+
+    def test_bool_bitwise_with_int_ok(self) -> None:
+        def f(a: bool, n: int) -> int:
+            '''
+            pre: 0 <= n < 4
+            post: 0 <= _ <= 1
+            '''
+            return a & n
+        self.assertEqual(*check_ok(f))
+
 
 class NumbersTest(unittest.TestCase):
 
@@ -317,6 +340,30 @@ class NumbersTest(unittest.TestCase):
             return (a + b) // 2
         self.assertEqual(*check_ok(f))
 
+    def test_numbers_not_equal_ok(self) -> None:
+        def f(i: int, x: float) -> bool:
+            '''
+            pre: i < x
+            post: _
+            '''
+            return i != x
+        self.assertEqual(*check_ok(f))
+
+    def test_int_floordiv_negative_ok(self) -> None:
+        def f(a: int) -> int:
+            '''
+            pre: a < 0
+            post: _ * 7 <= a < _ * 7 + 7
+            '''
+            return a // 7
+        self.assertEqual(*check_ok(f))
+
+    def test_int_mod_negative_divisor_ok(self) -> None:
+        def f(a: int) -> int:
+            ''' post: -7 < _ <= 0 '''
+            return a % -7
+        self.assertEqual(*check_ok(f))
+
     def test_int_bitwise_fail(self) -> None:
         def f(a: int, b: int) -> int:
             '''
@@ -484,7 +531,105 @@ class StringsTest(unittest.TestCase):
             post: True
             '''
             return fmt % ()
-        self.assertEqual(*check_unknown(f))
+        self.assertEqual(*check_ok(f))
+
+    def test_percent_format_int_fail(self) -> None:
+        def f(fmt: str, n: int) -> str:
+            '''
+            pre: fmt.startswith('n=%d')
+            post: _ != 'n=42'
+            '''
+            return fmt % n
+        self.assertEqual(*check_fail(f))
+
+    def test_format_fail(self) -> None:
+        def f(fmt: str, s: str) -> str:
+            '''
+            pre: fmt == '<{}>'
+            post: _ != '<x>'
+            '''
+            return fmt.format(s)
+        self.assertEqual(*check_fail(f))
+
+    def test_startswith_endswith_ok(self) -> None:
+        def f(s: str) -> str:
+            ''' post: _.startswith('x') and _.endswith('y') '''
+            return 'x' + s + 'y'
+        self.assertEqual(*check_ok(f))
+
+    def test_find_with_start_ok(self) -> None:
+        def f(s: str) -> int:
+            ''' post: _ == -1 or (_ >= 1 and s[_] == ':') '''
+            return s.find(':', 1)
+        self.assertEqual(*check_ok(f))
+
+    def test_index_err(self) -> None:
+        def f(s: str) -> int:
+            ''' post: True '''
+            return s.index('a')
+        self.assertEqual(*check_exec_err(f))
+
+    def test_count_fail(self) -> None:
+        def f(s: str) -> int:
+            ''' post: _ < 2 '''
+            return s.count('ab')
+        self.assertEqual(*check_fail(f))
+
+    def test_replace_fail(self) -> None:
+        def f(s: str) -> str:
+            ''' post: _ != 'xy;z' '''
+            return s.replace(':', ';', 1)
+        self.assertEqual(*check_fail(f))
+
+    def test_split_fail(self) -> None:
+        def f(s: str) -> List[str]:
+            ''' post: len(_) <= 3 '''
+            return s.split(',')
+        self.assertEqual(*check_fail(f))
+
+    def test_strip_fail(self) -> None:
+        def f(s: str) -> str:
+            ''' post: len(_) == len(s) '''
+            return s.lstrip('ab')
+        self.assertEqual(*check_fail(f))
+
+    def test_latin1_argument_fail(self) -> None:
+        def f(s: str) -> str:
+            ''' post: not _.startswith('xy') '''
+            return s.replace('a', '\xe9')
+        self.assertEqual(*check_fail(f))
+
+    def test_latin1_argument_found_fail(self) -> None:
+        def f(s: str) -> bool:
+            ''' post: not _ '''
+            return '\xe9' in s
+        self.assertEqual(*check_fail(f))
+
+    def test_argument_beyond_latin1_ok(self) -> None:
+        def f(s: str) -> str:
+            ''' post: _ == s '''
+            if s.startswith('\ufeff'):
+                return ''
+            return s.replace('\u2603', 'x')
+        self.assertEqual(*check_ok(f))
+
+    def test_upper_fail(self) -> None:
+        def f(s: str) -> str:
+            ''' post: _ != 'AB' '''
+            return s.upper()
+        self.assertEqual(*check_fail(f))
+
+    def test_isdigit_fail(self) -> None:
+        def f(s: str) -> bool:
+            ''' post: implies(_, len(s) < 3) '''
+            return s.isdigit()
+        self.assertEqual(*check_fail(f))
+
+    def test_join_with_symbolic_separator_fail(self) -> None:
+        def f(sep: str) -> str:
+            ''' post: _ != 'a--b' '''
+            return sep.join(['a', 'b'])
+        self.assertEqual(*check_fail(f))
 
     def test_join_ok(self) -> None:
         def f(items: List[str]) -> str:
@@ -517,6 +662,124 @@ class StringsTest(unittest.TestCase):
         self.assertEqual(*check_unknown(f))
 
 
+class BytesTest(unittest.TestCase):
+
+    def test_concatenate_ok(self) -> None:
+        def f(b: bytes) -> bytes:
+            ''' post: len(_) == len(b) + 2 '''
+            return b'<' + b + b'>'
+        self.assertEqual(*check_ok(f))
+
+    def test_index_fail(self) -> None:
+        def f(b: bytes) -> int:
+            ''' post: _ != 200 '''
+            return b[1] if len(b) > 1 else 0
+        self.assertEqual(*check_fail(f))
+
+    def test_slice_fail(self) -> None:
+        def f(b: bytes) -> bytes:
+            ''' post: _ != b'ab' '''
+            return b[1:3]
+        self.assertEqual(*check_fail(f))
+
+    def test_find_ok(self) -> None:
+        def f(b: bytes) -> int:
+            ''' post: _ == -1 or b[_] == 10 '''
+            return b.find(b'\n')
+        self.assertEqual(*check_ok(f))
+
+    def test_startswith_fail(self) -> None:
+        def f(b: bytes) -> bool:
+            ''' post: _ '''
+            return b.startswith(b'GET')
+        self.assertEqual(*check_fail(f))
+
+    def test_decode_fail(self) -> None:
+        def f(b: bytes) -> str:
+            ''' post: _ != 'hi' '''
+            return b.decode('ascii')
+        self.assertEqual(*check_fail(f))
+
+    def test_int_to_bytes_fail(self) -> None:
+        def f(n: int) -> bytes:
+            '''
+            pre: 0 <= n < 65536
+            post: _ != b'ab'
+            '''
+            return n.to_bytes(2, 'big')
+        self.assertEqual(*check_fail(f))
+
+    def test_int_to_bytes_overflow_err(self) -> None:
+        def f(n: int) -> bytes:
+            ''' post: True '''
+            return n.to_bytes(1, 'little')
+        self.assertEqual(*check_exec_err(f))
+
+    def test_bytes_are_not_str_ok(self) -> None:
+        def f(b: bytes, s: str) -> bool:
+            ''' post: not _ '''
+            return b == s
+        self.assertEqual(*check_ok(f))
+
+    def test_bytearray_append_fail(self) -> None:
+        def f(b: bytearray) -> bytearray:
+            ''' post: _ != bytearray(b'ab') '''
+            b.append(98)
+            return b
+        self.assertEqual(*check_fail(f))
+
+    def test_bytearray_del_backwards_slice_ok(self) -> None:
+        def f(b: bytearray) -> bytearray:
+            '''
+            pre: len(b) == 3
+            post: len(_) == 3
+            '''
+            del b[2:1]
+            return b
+        self.assertEqual(*check_ok(f))
+
+    def test_bytearray_set_backwards_slice_ok(self) -> None:
+        def f(b: bytearray) -> bytearray:
+            '''
+            pre: len(b) == 3
+            post: len(_) == 4 and _[2] == ord('X')
+            '''
+            b[2:1] = b'X'
+            return b
+        self.assertEqual(*check_ok(f))
+
+    def test_bytearray_set_slice_to_ints_fail(self) -> None:
+        def f(b: bytearray) -> bytearray:
+            ''' post: _ != bytearray(b'Ax') '''
+            b[0:1] = [65]
+            return b
+        self.assertEqual(*check_fail(f))
+
+    def test_realized_method_fail(self) -> None:
+        def f(b: bytes) -> bytes:
+            ''' post: len(_) > 0 '''
+            return b.strip()
+        self.assertEqual(*check_fail(f))
+
+    def test_realized_methods_unknown(self) -> None:
+        def f(b: bytes) -> List[bytes]:
+            ''' post: len(_) <= len(b) + 1 '''
+            return b.lower().replace(b',', b'.').split(b'.')
+        self.assertEqual(*check_unknown(f))
+
+    def test_hex_unknown(self) -> None:
+        def f(b: bytes) -> str:
+            ''' post: len(_) == 2 * len(b) '''
+            return b.hex()
+        self.assertEqual(*check_unknown(f))
+
+    def test_bytearray_realized_method_unknown(self) -> None:
+        def f(b: bytearray) -> bytearray:
+            ''' post: isinstance(_, bytearray) '''
+            return b.upper()
+        self.assertEqual(*check_unknown(f))
+
+
 class TuplesTest(unittest.TestCase):
 
     def test_tuple_range_intersection_fail(self) -> None:
@@ -792,6 +1055,47 @@ class ListsTest(unittest.TestCase):
             l.reverse()
         self.assertEqual(*check_ok(f))
 
+    def test_equality_without_forks(self) -> None:
+        def f(l: List[int]) -> bool:
+            ''' post: not _ '''
+            return l == [1, 2, 3]
+        stats: collections.Counter = collections.Counter()
+        messages = analyze_function(f, AnalysisOptions(stats=stats))
+        self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+        self.assertGreater(stats['sequence_eq:unrolled'], 0)
+        self.assertEqual(stats['sequence_eq:elementwise'], 0)
+
+    def test_containment_without_quantifiers(self) -> None:
+        def f(l: List[int]) -> bool:
+            '''
+            pre: len(l) < 4
+            post: not _
+            '''
+            return 7 in l
+        stats: collections.Counter = collections.Counter()
+        messages = analyze_function(f, AnalysisOptions(stats=stats))
+        self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+        self.assertGreater(stats['sequence_contains:unrolled'], 0)
+        self.assertEqual(stats['sequence_contains:quantified'], 0)
+
+    def test_reverse_unbounded_ok(self) -> None:
+        def f(l: List[int]) -> None:
+            '''
+            post[l]: l[0] == 42
+            '''
+            l.append(42)
+            l.reverse()
+        self.assertEqual(*check_ok(f))
+
+    def test_append_in_loop_ok(self) -> None:
+        def f(l: List[int]) -> None:
+            '''
+            post[l]: l[-1] == 49
+            '''
+            for i in range(50):
+                l.append(i)
+        self.assertEqual(*check_ok(f))
+
     def test_comparison_type_error(self) -> None:
         def f(a: List[Set], b: str):
             ''' post: True '''
@@ -866,6 +1170,32 @@ class DictionariesTest(unittest.TestCase):
             return list(a.__iter__())
         self.assertEqual(*check_ok(f))
 
+    def test_dict_iter_long_fail(self) -> None:
+        def f(a: Dict[int, str]) -> int:
+            '''
+            post: _ != 6
+            '''
+            return len(list(a))
+        self.assertEqual(*check_fail(f))
+
+    def test_dict_iter_decides_length_at_once(self) -> None:
+        space = TrackingStateSpace(time.time() + 10.0, 1.0, SinglePathNode(True))
+        d = SmtDict(space, Dict[int, int], 'd')
+        space.add(d.var[1] < 3)
+        keys = [k for k in d]
+        self.assertLess(len(keys), 3)
+        # (one choice for the length, and one to reconcile it with the contents)
+        self.assertEqual(len(space.choices_made), 2)
+
+    def test_dict_iter_is_lazy(self) -> None:
+        space = TrackingStateSpace(time.time() + 10.0, 1.0, SinglePathNode(True))
+        d = SmtDict(space, Dict[int, int], 'd')
+        space.add(d.var[1] > 100)
+        key = next(iter(d))
+        # (one choice, among the first few lengths; the rest are not decided yet)
+        self.assertEqual(len(space.choices_made), 1)
+        self.assertIn(key, d)
+
     def test_dict_to_string_ok(self) -> None:
         def f(a: Dict[int, str]) -> str:
             '''
@@ -1039,6 +1369,27 @@ class SetsTest(unittest.TestCase):
             return s1 >= s2
         self.assertEqual(*check_ok(f))
 
+    def test_iter_long_fail(self) -> None:
+        def f(a: Set[int]) -> int:
+            '''
+            post: _ != 6
+            '''
+            return sum(1 for _ in a)
+        self.assertEqual(*check_fail(f))
+
+    def test_iter_decides_length_at_once(self) -> None:
+        space = TrackingStateSpace(time.time() + 10.0, 1.0, SinglePathNode(True))
+        s = SmtMutableSet(space, Set[int], 's')
+        space.add(s.var[1] < 3)
+        self.assertLess(len([k for k in s]), 3)
+        self.assertEqual(len(space.choices_made), 2)
+
+    def test_iter_is_lazy(self) -> None:
+        space = TrackingStateSpace(time.time() + 10.0, 1.0, SinglePathNode(True))
+        s = SmtMutableSet(space, Set[int], 's')
+        space.add(s.var[1] > 100)
+        self.assertIn(next(iter(s)), s)
+
     def test_set_numeric_promotion(self) -> None:
         def f(i: int, s: Set[float]) -> bool:
             '''
@@ -1117,6 +1468,12 @@ class EnumsTest(unittest.TestCase):
             return Color.RED in colors and Color.BLUE in colors
         self.assertEqual(*check_fail(f))
 
+    def test_enum_values_exhausted_ok(self) -> None:
+        def f(color: Color) -> int:
+            ''' post: 0 <= _ <= 2 '''
+            return color.value
+        self.assertEqual(*check_ok(f))
+
 
 class ObjectsTest(unittest.TestCase):
 
@@ -1180,7 +1537,7 @@ class ObjectsTest(unittest.TestCase):
         messages = analyze_class(Pokeable)
         self.assertEqual(*check_messages(messages,
                                          state=MessageType.POST_FAIL,
-                                         line=50,
+                                         line=52,
                                          column=0))
 
     def test_person_class(self) -> None:
@@ -1461,6 +1818,18 @@ class BehaviorsTest(unittest.TestCase):
             return isinstance(n, Pokeable)
         self.assertEqual(*check_fail(f))
 
+    def test_wide_union_fail(self) -> None:
+        def f(x: Union[int, str, float, Color, Pokeable, None]) -> bool:
+            ''' post: _ '''
+            return not isinstance(x, Pokeable)
+        self.assertEqual(*check_fail(f))
+
+    def test_wide_union_ok(self) -> None:
+        def f(x: Union[int, str, float, Color, Pokeable, None]) -> bool:
+            ''' post: _ '''
+            return x is None or isinstance(x, (int, str, float, Color, Pokeable))
+        self.assertEqual(*check_ok(f))
+
     def test_implicit_heapref_conversions(self) -> None:
         def f(foo: List[List]) -> None:
             '''
@@ -1589,6 +1958,171 @@ class BehaviorsTest(unittest.TestCase):
                 return -i if i < 0 else i
         self.assertEqual(*check_exec_err(f, 'NotDeterministic'))
 
+class SearchStrategyTest(unittest.TestCase):
+
+    def test_coverage_guided_fail(self) -> None:
+        def f(a: int, b: int, c: int) -> int:
+            ''' post: _ != 3 '''
+            if a > 10:
+                if b > a:
+                    if c == b + 1:
+                        return 3
+            return 0
+        options = AnalysisOptions(search_strategy='coverage')
+        messages = analyze_function(f, options)
+        self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+
+    def test_coverage_guided_ok(self) -> None:
+        def f(x: Union[int, str]) -> bool:
+            ''' post: _ '''
+            if isinstance(x, int):
+                return x == x
+            return len(x) >= 0
+        options = AnalysisOptions(search_strategy='coverage')
+        self.assertEqual(analyze_function(f, options), [])
+
+
+class FuzzingTest(unittest.TestCase):
+
+    def test_fuzzing_finds_trivial_counterexample(self) -> None:
+        def f(x: int, s: str) -> float:
+            ''' post: True '''
+            return len(s) / x
+        stats: collections.Counter = collections.Counter()
+        options = AnalysisOptions(per_condition_fuzz_timeout=1.0, stats=stats)
+        messages = analyze_function(f, options)
+        self.assertEqual([m.state for m in messages], [MessageType.EXEC_ERR])
+        self.assertIn('ZeroDivisionError', messages[0].message)
+        self.assertGreater(stats['num_fuzz_inputs'], 0)
+        self.assertEqual(stats['num_paths'], 0)
+
+    def test_fuzzing_survivors_are_analyzed_symbolically(self) -> None:
+        def f(x: int) -> int:
+            ''' post: _ != 1234567 '''
+            return x
+        stats: collections.Counter = collections.Counter()
+        options = AnalysisOptions(per_condition_fuzz_timeout=0.2, stats=stats)
+        messages = analyze_function(f, options)
+        self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+        self.assertGreater(stats['num_paths'], 0)
+
+    def test_fuzzing_respects_preconditions(self) -> None:
+        def f(x: int) -> int:
+            '''
+            pre: x != 0
+            post: True
+            '''
+            return 10 // x
+        options = AnalysisOptions(per_condition_fuzz_timeout=0.2)
+        self.assertEqual(analyze_function(f, options), [])
+
+    def test_fuzzing_times_out_long_calls(self) -> None:
+        def f(x: int) -> int:
+            ''' post: True '''
+            while x > 0:
+                x -= 1
+            return x
+        options = AnalysisOptions(per_condition_fuzz_timeout=0.5,
+                                  per_path_timeout=0.1,
+                                  per_condition_timeout=0.5)
+        self.assertEqual([m.state for m in analyze_function(f, options)],
+                         [MessageType.CANNOT_CONFIRM])
+
+    def test_fuzzing_does_not_hide_internal_errors(self) -> None:
+        def f(x: int) -> int:
+            ''' post: True '''
+            if type(x) is int:  # (only when called with a fuzzed input)
+                raise CrosshairInternal('broken')
+            return x
+        options = AnalysisOptions(per_condition_fuzz_timeout=0.5)
+        with self.assertRaises(CrosshairInternal):
+            analyze_function(f, options)
+
+
+class CorpusTest(unittest.TestCase):
+
+    def test_counterexample_is_saved_and_replayed(self) -> None:
+        fixed = [False]
+
+        def f(x: int) -> int:
+            ''' post: _ != 42 '''
+            return 0 if fixed[0] else x
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # (a generous timeout; the first run must find the counterexample)
+            messages = analyze_function(f, AnalysisOptions(corpus_dir=tmpdir, per_condition_timeout=10.0))
+            self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+            stats: collections.Counter = collections.Counter()
+            replayed = analyze_function(f, AnalysisOptions(corpus_dir=tmpdir, stats=stats))
+            self.assertEqual([m.message for m in replayed], [m.message for m in messages])
+            self.assertEqual(stats['num_paths'], 0)
+
+            fixed[0] = True
+            self.assertEqual(analyze_function(f, AnalysisOptions(corpus_dir=tmpdir)), [])
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_counterexample_arguments(self) -> None:
+        def f(x: List[int]) -> int:
+            ''' post: _ != 3 '''
+            return len(x)
+        messages = analyze_function(f)
+        self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+        self.assertEqual(len(eval(messages[0].counterexample)['x']), 3)
+
+    def test_unreplayable_counterexample_is_not_saved(self) -> None:
+        def f(c: Cat) -> int:
+            ''' post: _ != 1 '''
+            return c.size()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            messages = analyze_function(f, AnalysisOptions(corpus_dir=tmpdir))
+            self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+            self.assertEqual([m.counterexample for m in messages], [None])
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_saved_counterexample_is_not_evaluated(self) -> None:
+        def f(x: int) -> int:
+            ''' post: _ != 0 '''
+            return x
+        fn_name = f.__module__ + '.' + f.__qualname__
+        with tempfile.TemporaryDirectory() as tmpdir:
+            CounterexampleCorpus(tmpdir).put(fn_name, '_ != 0', "{'x': int('0')}")
+            stats: collections.Counter = collections.Counter()
+            messages = analyze_function(f, AnalysisOptions(corpus_dir=tmpdir, stats=stats))
+            self.assertEqual([m.state for m in messages], [MessageType.POST_FAIL])
+            self.assertGreater(stats['num_paths'], 0)  # (found symbolically, not replayed)
+
+
+class CancellationTest(unittest.TestCase):
+
+    def test_cancellation_stops_symbolic_analysis(self) -> None:
+        def f(x: int) -> int:
+            ''' post: _ >= 0 '''
+            try:
+                return x if x > 0 else 0
+            except Exception:  # (user code cannot swallow cancellation)
+                return 0
+        checks = [0]
+
+        def is_cancelled() -> bool:
+            checks[0] += 1
+            return checks[0] > 3
+        stats: collections.Counter = collections.Counter()
+        options = AnalysisOptions(per_condition_timeout=10.0, is_cancelled=is_cancelled, stats=stats)
+        with self.assertRaises(AnalysisCancelled):
+            analyze_function(f, options)
+        self.assertLessEqual(stats['num_paths'], 3)
+
+    def test_cancellation_stops_fuzzing(self) -> None:
+        def f(x: int) -> int:
+            ''' post: True '''
+            return x
+        options = AnalysisOptions(per_condition_fuzz_timeout=10.0,
+                                  is_cancelled=lambda: True)
+        with self.assertRaises(AnalysisCancelled):
+            analyze_function(f, options)
+
+
 class ContractedBuiltinsTest(unittest.TestCase):
 
     def TODO_test_print_ok(self) -> None:
@@ -0,0 +1,72 @@
+'''
+Remembers counterexamples across runs, so that they can be quickly re-checked
+with concrete execution before doing any symbolic analysis.
+
+Each (function, condition) pair gets its own JSON file in the corpus
+directory, holding the arguments of its most recent counterexample, as a
+dictionary literal. (counterexamples whose arguments are not literals are not
+saved; they could not be recreated without evaluating arbitrary code)
+
+>>> import tempfile
+>>> with tempfile.TemporaryDirectory() as tmpdir:
+...   corpus = CounterexampleCorpus(tmpdir)
+...   corpus.put('mod.fn', '_ > 0', "{'x': 0}")
+...   found = corpus.get('mod.fn', '_ > 0')
+...   corpus.remove('mod.fn', '_ > 0')
+...   (found, corpus.get('mod.fn', '_ > 0'))
+("{'x': 0}", None)
+
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Optional
+
+from crosshair.util import debug
+
+_ENCODING = 'utf-8'
+
+
+class CounterexampleCorpus:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, fn_name: str, condition_src: str) -> str:
+        key = json.dumps([fn_name, condition_src]).encode(_ENCODING)
+        return os.path.join(self.directory,
+                            hashlib.sha256(key).hexdigest()[:32] + '.json')
+
+    def get(self, fn_name: str, condition_src: str) -> Optional[str]:
+        path = self._path(fn_name, condition_src)
+        try:
+            with open(path, encoding=_ENCODING) as fh:
+                entry = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            debug(f'WARNING: unable to read corpus file "{path}": {e}')
+            return None
+        if entry.get('function') != fn_name or entry.get('condition') != condition_src:
+            return None  # (a hash collision)
+        return entry.get('arguments')
+
+    def put(self, fn_name: str, condition_src: str, arguments: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {'function': fn_name, 'condition': condition_src, 'arguments': arguments}
+        # Write to a temporary file first, so that readers never see a partial entry:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with open(fd, 'w', encoding=_ENCODING) as fh:
+                json.dump(entry, fh)
+            os.replace(tmp_path, self._path(fn_name, condition_src))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def remove(self, fn_name: str, condition_src: str) -> None:
+        try:
+            os.unlink(self._path(fn_name, condition_src))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,399 @@
+'''
+Spreads analysis over several machines.
+
+A Coordinator hands out work items (one top-level function or class of one
+file each) to workers that connect over TCP, and collects their results.
+Workers analyze each item the same way that `watch` workers do.
+Work from workers that disconnect, or that stop sending heartbeats, is
+handed out again. (workers stop sending heartbeats when an item runs far
+past its timeouts, and then give up on it)
+
+The protocol is newline-delimited JSON (like the results server in
+localhost_comms). Workers speak first, with {"request": "work"} (possibly
+alongside a "result" for the previous item) or {"heartbeat": true}.
+The first message must also carry the coordinator's shared secret, as
+"token"; connections without it are dropped.
+The coordinator answers work requests with {"item": {...}}, {"wait": seconds}
+(when everything remaining is already assigned), or {"done": true}.
+Filenames are sent relative to a root directory, so that workers may have
+the code checked out at a different location. Workers refuse filenames that
+are not under their root, and only accept the analysis options that are
+safe to take from another machine. (see _WIRE_OPTIONS)
+'''
+
+import collections
+import dataclasses
+import hmac
+import json
+import math
+import os
+import os.path
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import *
+from typing import BinaryIO
+
+from crosshair.core import AnalysisMessage, AnalysisOptions, MessageCollector, MessageType
+from crosshair.statespace import SEARCH_STRATEGIES
+from crosshair.util import debug
+
+_ENCODING = 'utf-8'
+
+# The options that workers accept from the coordinator, and their types.
+# (others either do not make sense in another process, or are unsafe to take
+# from the network, like corpus_dir)
+_WIRE_OPTIONS: Dict[str, Tuple[type, ...]] = {
+    'per_condition_timeout': (int, float),
+    'per_path_timeout': (int, float),
+    'per_condition_fuzz_timeout': (int, float),
+    'search_strategy': (str,),
+}
+
+WorkItem = Tuple[str, str]  # (filename relative to the root, member name)
+WorkerOutput = Tuple[str, str, int, Counter[str], List[AnalysisMessage]]
+# Analyzes (filename, ((member name, generation),), options, deadline), putting
+# a WorkerOutput for each member on the given output:
+AnalyzeFn = Callable[[Tuple[str, Tuple[Tuple[str, int], ...], AnalysisOptions, float], Any], None]
+
+
+def _send(wfile: BinaryIO, obj: object) -> None:
+    wfile.write(json.dumps(obj).encode(_ENCODING) + b'\n')
+    wfile.flush()
+
+
+def options_to_json(options: AnalysisOptions) -> Dict[str, object]:
+    '''
+    >>> options_to_json(AnalysisOptions(per_condition_timeout=3.0))['per_condition_timeout']
+    3.0
+    '''
+    return {name: getattr(options, name) for name in _WIRE_OPTIONS}
+
+
+def options_from_json(obj: Mapping[str, object]) -> AnalysisOptions:
+    '''
+    Makes options from what the coordinator sent, ignoring anything unexpected.
+
+    >>> options = options_from_json({'per_condition_timeout': 3.0, 'corpus_dir': '/tmp'})
+    >>> (options.per_condition_timeout, options.corpus_dir)
+    (3.0, None)
+    >>> options_from_json({'search_strategy': 'bogus'}).search_strategy
+    'random'
+    '''
+    options = AnalysisOptions()
+    for name, value in obj.items():
+        types = _WIRE_OPTIONS.get(name)
+        if types is None or not isinstance(value, types) or isinstance(value, bool):
+            debug('Ignoring analysis option from the coordinator:', name)
+            continue
+        if name == 'search_strategy' and value not in SEARCH_STRATEGIES:
+            debug('Ignoring unknown search strategy from the coordinator:', value)
+            continue
+        setattr(options, name, value)
+    return options
+
+
+def item_path(root: str, filename: str) -> Optional[str]:
+    '''
+    Locates a work item's file under the root, if it is under the root at all.
+
+    >>> item_path('/root', 'a/b.py')
+    '/root/a/b.py'
+    >>> item_path('/root', '/etc/b.py')
+    >>> item_path('/root', 'a/../../b.py')
+    '''
+    if os.path.isabs(filename) or os.pardir in filename.replace(os.sep, '/').split('/'):
+        return None
+    return os.path.join(root, filename)
+
+
+def item_timeout(options: AnalysisOptions, min_timeout: float = 10.0) -> float:
+    '''
+    How long a worker may spend on one work item. (like a `watch` worker)
+
+    >>> item_timeout(AnalysisOptions(per_condition_timeout=3.0))
+    60.0
+    '''
+    return max(min_timeout, options.per_condition_timeout * 20.0)
+
+
+def relocate_message(message: AnalysisMessage, from_root: str, to_root: str) -> AnalysisMessage:
+    '''
+    Re-roots the message's filename, if it is a path under `from_root`.
+
+    >>> message = AnalysisMessage(MessageType.POST_FAIL, '', '/a/b.py', 1, 0, '')
+    >>> relocate_message(message, '/a', '/c').filename
+    '/c/b.py'
+    >>> relocate_message(message, '/x', '/c').filename
+    '/a/b.py'
+    >>> relocate_message(dataclasses.replace(message, filename='<string>'), '/a', '/c').filename
+    '<string>'
+    '''
+    if not os.path.isabs(message.filename):
+        return message  # (e.g. "<frozen importlib._bootstrap>")
+    relative = os.path.relpath(message.filename, from_root)
+    if relative.startswith(os.pardir):
+        return message
+    return dataclasses.replace(message, filename=os.path.join(to_root, relative))
+
+
+class _WorkerConnection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.assigned: Set[int] = set()
+        self.last_heard = time.time()
+
+
+class _WorkRequestHandler(socketserver.StreamRequestHandler):
+    server: '_CoordinatorServer'
+
+    def handle(self) -> None:
+        coordinator = self.server.coordinator
+        connection = _WorkerConnection(self.request)
+        coordinator._connected(connection)
+        try:
+            for line_number, line in enumerate(self.rfile):
+                request = json.loads(line.decode(_ENCODING))
+                if line_number == 0 and not coordinator._authorized(request):
+                    debug('Dropping worker connection without the right token')
+                    return
+                coordinator._heard_from(connection)
+                if 'result' in request:
+                    coordinator._complete(connection, request['result'])
+                if request.get('request') == 'work':
+                    _send(self.wfile, coordinator._next_assignment(connection))
+        except (OSError, ValueError) as e:
+            debug(f'Lost worker connection: {e}')
+        finally:
+            coordinator._disconnected(connection)
+
+
+class _CoordinatorServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    coordinator: 'Coordinator'
+
+
+class Coordinator:
+    '''
+    Serves the given work items, starting when `start()` is called. `wait()`
+    returns once every item is done (or has failed too many times).
+    Only workers that know the `token` are served; a random one is made up
+    when none is given.
+    '''
+    def __init__(self,
+                 root: str,
+                 items: Sequence[WorkItem],
+                 options: AnalysisOptions,
+                 address: Tuple[str, int] = ('127.0.0.1', 0),
+                 lease_timeout: float = 30.0,
+                 max_attempts: int = 3,
+                 token: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.token = secrets.token_hex(16) if token is None else token
+        self.items = list(items)
+        self._options = options_to_json(options)
+        self._lease_timeout = lease_timeout
+        self._max_attempts = max_attempts
+        self._lock = threading.Condition()
+        self._queue: Deque[int] = collections.deque(range(len(self.items)))
+        self._attempts: Counter[int] = collections.Counter()
+        self._connections: Set[_WorkerConnection] = set()
+        self._results: Dict[int, List[AnalysisMessage]] = {}
+        self.stats: Counter[str] = collections.Counter()
+        self.abandoned: List[WorkItem] = []
+        self._server = _CoordinatorServer(address, _WorkRequestHandler)
+        self._server.coordinator = self
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return cast(Tuple[str, int], self._server.server_address[:2])
+
+    def _finished(self) -> bool:
+        return len(self._results) + len(self.abandoned) >= len(self.items)
+
+    def _connected(self, connection: _WorkerConnection) -> None:
+        with self._lock:
+            self._connections.add(connection)
+
+    def _authorized(self, request: Mapping[str, object]) -> bool:
+        token = request.get('token')
+        return isinstance(token, str) and hmac.compare_digest(
+            token.encode(_ENCODING), self.token.encode(_ENCODING))
+
+    def _heard_from(self, connection: _WorkerConnection) -> None:
+        connection.last_heard = time.time()
+
+    def _release(self, connection: _WorkerConnection) -> None:
+        ''' Puts the connection's unfinished items back in the queue. (lock held) '''
+        for item_id in sorted(connection.assigned):
+            if item_id in self._results:
+                continue
+            self._attempts[item_id] += 1
+            if self._attempts[item_id] >= self._max_attempts:
+                debug('Giving up on work item after repeated failures', self.items[item_id])
+                self.abandoned.append(self.items[item_id])
+            else:
+                debug('Reassigning work item', self.items[item_id])
+                self._queue.appendleft(item_id)
+        connection.assigned.clear()
+        self._lock.notify_all()
+
+    def _disconnected(self, connection: _WorkerConnection) -> None:
+        with self._lock:
+            self._connections.discard(connection)
+            self._release(connection)
+
+    def _next_assignment(self, connection: _WorkerConnection) -> Dict[str, object]:
+        with self._lock:
+            if self._finished():
+                return {'done': True}
+            if not self._queue:
+                return {'wait': 1.0}
+            item_id = self._queue.popleft()
+            connection.assigned.add(item_id)
+            filename, member = self.items[item_id]
+            return {'item': {'id': item_id, 'filename': filename, 'member': member,
+                             'options': self._options}}
+
+    def _complete(self, connection: _WorkerConnection, result: Mapping[str, Any]) -> None:
+        item_id = result['id']
+        messages = [relocate_message(AnalysisMessage.fromJSON(m), result['root'], self.root)
+                    for m in result['messages']]
+        with self._lock:
+            connection.assigned.discard(item_id)
+            if item_id in self._results:
+                return  # (it was reassigned, and someone else finished first)
+            self._results[item_id] = messages
+            self.stats.update(result['stats'])
+            self._lock.notify_all()
+
+    def _expire_leases(self) -> None:
+        ''' Gives up on workers that we haven't heard from in a while. (lock held) '''
+        cutoff = time.time() - self._lease_timeout
+        for connection in list(self._connections):
+            if connection.assigned and connection.last_heard < cutoff:
+                debug('Worker has gone quiet; reassigning its work')
+                self._connections.discard(connection)
+                self._release(connection)
+                try:
+                    connection.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def wait(self, timeout: float = math.inf) -> bool:
+        ''' Waits for the work to finish, returning False on timeout. '''
+        deadline = time.time() + timeout
+        with self._lock:
+            while not self._finished():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(min(1.0, remaining))
+                self._expire_leases()
+        return True
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def messages(self) -> List[AnalysisMessage]:
+        collector = MessageCollector()
+        for item_id in sorted(self._results.keys()):
+            collector.extend(self._results[item_id])
+        return collector.get()
+
+
+class _ResultList:
+    ''' Stands in for the queue that a pool worker normally reports to. '''
+    def __init__(self) -> None:
+        self.results: List[WorkerOutput] = []
+
+    def put(self, result: WorkerOutput) -> None:
+        self.results.append(result)
+
+
+def run_worker(address: Tuple[str, int], root: str, analyze: AnalyzeFn, token: str,
+               heartbeat_interval: float = 5.0, min_item_timeout: float = 10.0) -> bool:
+    '''
+    Analyzes work items from the coordinator at the given address, until it
+    says that everything is done.
+
+    Returns False if an item ran past its deadline. Analysis of that item is
+    cancelled, and its (partial) results are not sent; the caller should
+    start over in a fresh process, because the analysis may have left this
+    one in a bad state.
+    '''
+    root = os.path.abspath(root)
+    if root not in sys.path:
+        sys.path.insert(0, root)  # (so that we can import the code under analysis)
+    try:
+        sock = socket.create_connection(address)
+    except ConnectionRefusedError:
+        debug('No coordinator is listening at', address)
+        return True
+    with sock, sock.makefile('rwb') as fh:
+        write_lock = threading.Lock()
+
+        def send(obj: object) -> None:
+            with write_lock:
+                _send(cast(BinaryIO, fh), obj)
+
+        stopped = threading.Event()
+        item_deadline = math.inf
+
+        def past_deadline() -> bool:
+            return time.time() > item_deadline
+
+        def send_heartbeats() -> None:
+            while not stopped.wait(heartbeat_interval):
+                if past_deadline():
+                    continue  # (let the lease lapse, so that the item is handed out again)
+                try:
+                    send({'heartbeat': True})
+                except OSError:
+                    return
+        try:
+            send({'request': 'work', 'token': token})
+            threading.Thread(target=send_heartbeats, daemon=True).start()
+            for line in fh:
+                reply = json.loads(line.decode(_ENCODING))
+                if reply.get('done'):
+                    return True
+                if 'wait' in reply:
+                    time.sleep(reply['wait'])
+                    send({'request': 'work'})
+                    continue
+                item = reply['item']
+                options = options_from_json(item['options'])
+                options.is_cancelled = past_deadline
+                filename = item_path(root, item['filename'])
+                stats: Counter[str] = collections.Counter()
+                messages: List[AnalysisMessage] = []
+                if filename is None:
+                    debug('Refusing to analyze a file outside of the root:', item['filename'])
+                else:
+                    output = _ResultList()
+                    item_deadline = time.time() + item_timeout(options, min_item_timeout)
+                    analyze((filename, ((item['member'], 0),), options, item_deadline), output)
+                    if past_deadline():
+                        debug('Giving up on a work item that ran past its deadline:', filename)
+                        return False
+                    item_deadline = math.inf
+                    for (_, _, _, cur_stats, cur_messages) in output.results:
+                        stats.update(cur_stats)
+                        messages.extend(cur_messages)
+                send({'result': {'id': item['id'], 'root': root, 'stats': stats,
+                                 'messages': [m.toJSON() for m in messages]},
+                      'request': 'work'})
+        except OSError as e:
+            debug(f'Lost connection to the coordinator: {e}')
+        finally:
+            stopped.set()
+    return True
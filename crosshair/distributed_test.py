@@ -0,0 +1,196 @@
+import collections
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from crosshair.core_and_libs import AnalysisMessage, AnalysisOptions, MessageType
+from crosshair.distributed import *
+from crosshair.main import analyze_work_item
+
+
+def fake_analyze(item, output) -> None:
+    filename, members, options, _ = item
+    for name, generation in members:
+        line = ord(name[0])  # (messages on the same line would be merged)
+        message = AnalysisMessage(MessageType.POST_FAIL, name, filename, line, 0, '')
+        output.put((filename, name, generation, collections.Counter(num_paths=1), [message]))
+
+
+def request_work(coordinator: Coordinator, token: str) -> socket.socket:
+    sock = socket.create_connection(coordinator.address)
+    sock.sendall(json.dumps({'request': 'work', 'token': token}).encode() + b'\n')
+    return sock
+
+
+def take_item(coordinator: Coordinator) -> socket.socket:
+    ''' Connects like a worker, and takes a work item without finishing it. '''
+    sock = request_work(coordinator, coordinator.token)
+    reply = json.loads(sock.makefile('rb').readline())
+    assert 'item' in reply
+    return sock
+
+
+class CoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        if self.root in sys.path:
+            sys.path.remove(self.root)
+        shutil.rmtree(self.root)
+
+    def run_worker_thread(self, coordinator: Coordinator) -> threading.Thread:
+        thread = threading.Thread(target=run_worker,
+                                  args=(coordinator.address, self.root, fake_analyze, coordinator.token))
+        thread.start()
+        return thread
+
+    def test_work_from_disconnected_worker_is_reassigned(self):
+        coordinator = Coordinator(self.root, [('a.py', 'f'), ('a.py', 'g')], AnalysisOptions())
+        coordinator.start()
+        try:
+            take_item(coordinator).close()
+            thread = self.run_worker_thread(coordinator)
+            self.assertTrue(coordinator.wait(timeout=10.0))
+            thread.join()
+        finally:
+            coordinator.close()
+        self.assertEqual([m.message for m in coordinator.messages()], ['f', 'g'])
+        self.assertEqual({m.filename for m in coordinator.messages()},
+                         {os.path.join(self.root, 'a.py')})
+        self.assertEqual(coordinator.stats['num_paths'], 2)
+        self.assertEqual(coordinator.abandoned, [])
+
+    def test_work_from_silent_worker_is_reassigned(self):
+        coordinator = Coordinator(self.root, [('a.py', 'f')], AnalysisOptions(),
+                                  lease_timeout=0.5)
+        coordinator.start()
+        try:
+            with take_item(coordinator):
+                thread = self.run_worker_thread(coordinator)
+                self.assertTrue(coordinator.wait(timeout=10.0))
+                thread.join()
+        finally:
+            coordinator.close()
+        self.assertEqual([m.message for m in coordinator.messages()], ['f'])
+
+    def test_work_from_stuck_worker_is_reassigned(self):
+        started, unstick = threading.Event(), threading.Event()
+
+        def stuck_analyze(item, output) -> None:
+            started.set()
+            unstick.wait()
+        coordinator = Coordinator(self.root, [('a.py', 'f')], AnalysisOptions(per_condition_timeout=0.01),
+                                  lease_timeout=0.5)
+        coordinator.start()
+        stuck_thread = threading.Thread(target=run_worker,
+                                        args=(coordinator.address, self.root, stuck_analyze, coordinator.token),
+                                        kwargs={'heartbeat_interval': 0.1, 'min_item_timeout': 0.0})
+        stuck_thread.start()
+        try:
+            self.assertTrue(started.wait(timeout=10.0))
+            thread = self.run_worker_thread(coordinator)
+            self.assertTrue(coordinator.wait(timeout=10.0))
+            thread.join()
+        finally:
+            unstick.set()
+            stuck_thread.join()
+            coordinator.close()
+        self.assertEqual([m.message for m in coordinator.messages()], ['f'])
+
+    def test_worker_past_deadline_gives_up(self):
+        def slow_analyze(item, output) -> None:
+            _, _, options, _ = item
+            while not options.is_cancelled():
+                time.sleep(0.01)
+        coordinator = Coordinator(self.root, [('a.py', 'f')], AnalysisOptions(per_condition_timeout=0.01),
+                                  max_attempts=1)
+        coordinator.start()
+        try:
+            finished = run_worker(coordinator.address, self.root, slow_analyze, coordinator.token,
+                                  min_item_timeout=0.0)
+            self.assertTrue(coordinator.wait(timeout=10.0))
+        finally:
+            coordinator.close()
+        self.assertFalse(finished)
+        self.assertEqual(coordinator.messages(), [])
+        self.assertEqual(coordinator.abandoned, [('a.py', 'f')])
+
+    def test_worker_without_token_is_refused(self):
+        coordinator = Coordinator(self.root, [('a.py', 'f')], AnalysisOptions())
+        coordinator.start()
+        try:
+            with request_work(coordinator, 'wrong') as sock:
+                self.assertEqual(sock.makefile('rb').readline(), b'')
+            thread = self.run_worker_thread(coordinator)
+            self.assertTrue(coordinator.wait(timeout=10.0))
+            thread.join()
+        finally:
+            coordinator.close()
+        self.assertEqual([m.message for m in coordinator.messages()], ['f'])
+        self.assertEqual(coordinator.abandoned, [])
+
+    def test_worker_refuses_files_outside_of_root(self):
+        analyzed = []
+        coordinator = Coordinator(self.root, [('../a.py', 'f'), ('a.py', 'g')],
+                                  AnalysisOptions(corpus_dir=self.root))
+        coordinator.start()
+        try:
+            run_worker(coordinator.address, self.root,
+                       lambda item, output: analyzed.append((item[0], item[2].corpus_dir)),
+                       coordinator.token)
+            self.assertTrue(coordinator.wait(timeout=10.0))
+        finally:
+            coordinator.close()
+        self.assertEqual(analyzed, [(os.path.join(self.root, 'a.py'), None)])
+
+    def test_repeatedly_failing_work_is_abandoned(self):
+        coordinator = Coordinator(self.root, [('a.py', 'f')], AnalysisOptions(), max_attempts=2)
+        coordinator.start()
+        try:
+            take_item(coordinator).close()
+            take_item(coordinator).close()
+            self.assertTrue(coordinator.wait(timeout=10.0))
+        finally:
+            coordinator.close()
+        self.assertEqual(coordinator.abandoned, [('a.py', 'f')])
+
+    def test_local_worker_processes(self):
+        with open(os.path.join(self.root, 'distmod.py'), 'w') as fh:
+            fh.write('def f(x: int) -> int:\n'
+                     '    """ post: _ != 5 """\n'
+                     '    return x\n'
+                     'def g(x: int) -> int:\n'
+                     '    """ post: _ == x """\n'
+                     '    return x\n')
+        coordinator = Coordinator(self.root, [('distmod.py', 'f'), ('distmod.py', 'g')],
+                                  AnalysisOptions(per_condition_timeout=1.0))
+        workers = [multiprocessing.Process(target=run_worker,
+                                           args=(coordinator.address, self.root, analyze_work_item,
+                                                 coordinator.token))
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        coordinator.start()
+        try:
+            self.assertTrue(coordinator.wait(timeout=60.0))
+        finally:
+            coordinator.close()
+            for worker in workers:
+                worker.join(10.0)
+        self.assertEqual([(m.state, m.line) for m in coordinator.messages()
+                          if m.state != MessageType.CANNOT_CONFIRM],
+                         [(MessageType.POST_FAIL, 2)])
+        self.assertEqual({m.filename for m in coordinator.messages()},
+                         {os.path.join(self.root, 'distmod.py')})
+
+
+if __name__ == '__main__':
+    unittest.main()
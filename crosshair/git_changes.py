@@ -0,0 +1,188 @@
+'''
+Finds the code that changed since some git revision, so that analysis can
+be limited to it.
+
+Changed lines come from `git diff` (plus files that git does not track yet),
+and are matched against the source line spans of functions, methods, and
+classes.
+'''
+
+import ast
+import inspect
+import os.path
+import re
+import subprocess
+import textwrap
+from typing import *
+
+from crosshair.module_dependencies import referenced_names
+from crosshair.util import debug
+
+ChangedLines = Dict[str, Set[int]]  # (absolute filename -> line numbers in the current version)
+
+_HUNK_HEADER = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+
+class GitError(Exception):
+    pass
+
+
+def parse_unified_diff(diff: str, root: str) -> ChangedLines:
+    '''
+    Finds the changed lines (in their new positions) from a unified diff.
+    For deletions, the lines around the deletion count as changed.
+
+    >>> diff = '\\n'.join([
+    ...   '--- a/pkg/mod.py', '+++ b/pkg/mod.py',
+    ...   '@@ -3,0 +4,2 @@ def f():',
+    ...   '@@ -10 +12,0 @@',
+    ...   '--- a/gone.py', '+++ /dev/null',
+    ...   '@@ -1,5 +0,0 @@'])
+    >>> {f: sorted(lines) for f, lines in parse_unified_diff(diff, '/repo').items()}
+    {'/repo/pkg/mod.py': [4, 5, 12, 13]}
+    '''
+    changed: ChangedLines = {}
+    lines: Optional[Set[int]] = None
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            path = line[4:]
+            if path == '/dev/null':
+                lines = None
+            else:
+                if path.startswith('b/'):
+                    path = path[2:]
+                lines = changed.setdefault(os.path.join(root, path), set())
+            continue
+        match = _HUNK_HEADER.match(line)
+        if match and lines is not None:
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count:
+                lines.update(range(start, start + count))
+            else:
+                lines.update((start, start + 1))
+    return changed
+
+
+def _git(root: str, *args: str) -> str:
+    try:
+        completed = subprocess.run(('git',) + args, cwd=root, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, universal_newlines=True)
+    except FileNotFoundError:
+        raise GitError('Unable to find the git executable')
+    if completed.returncode != 0:
+        raise GitError(completed.stderr.strip() or f'git {args[0]} failed')
+    return completed.stdout
+
+
+def changed_lines(revision: str, directory: str = '.') -> ChangedLines:
+    '''
+    Finds the lines that changed between the given revision and the working
+    tree of the git repository containing `directory`.
+    '''
+    root = os.path.realpath(_git(directory, 'rev-parse', '--show-toplevel').strip())
+    changed = parse_unified_diff(
+        _git(root, 'diff', '--unified=0', '--no-color', '--no-ext-diff', revision, '--'), root)
+    for path in _git(root, 'ls-files', '--others', '--exclude-standard').splitlines():
+        filename = os.path.join(root, path)
+        try:
+            with open(filename, encoding='utf-8', errors='replace') as fh:
+                num_lines = sum(1 for _ in fh)
+        except OSError:
+            continue
+        changed[filename] = set(range(1, num_lines + 1))
+    debug('Changed lines since', revision, 'in', len(changed), 'files')
+    return changed
+
+
+def source_span(fn: Callable) -> Optional[Tuple[str, int, int]]:
+    ''' Returns the file and (inclusive) line range of a function's source, if it can be found. '''
+    try:
+        filename = inspect.getsourcefile(fn)
+        lines, start = inspect.getsourcelines(fn)
+    except (OSError, TypeError):
+        return None
+    if filename is None:
+        return None
+    return (os.path.realpath(filename), start, start + len(lines) - 1)
+
+
+def is_changed(fn: Callable, changed: ChangedLines) -> bool:
+    span = source_span(fn)
+    if span is None:
+        return False
+    filename, start, end = span
+    lines = changed.get(filename)
+    return bool(lines) and any(start <= line <= end for line in cast(Set[int], lines))
+
+
+def class_functions(cls: type) -> Iterator[Callable]:
+    ''' Yields the functions defined in a class body (including those behind properties). '''
+    for member in cls.__dict__.values():
+        if isinstance(member, (staticmethod, classmethod)):
+            member = member.__func__
+        if isinstance(member, property):
+            yield from (f for f in (member.fget, member.fset, member.fdel) if f is not None)
+        elif inspect.isfunction(member):
+            yield member
+
+
+def changed_outside_methods(cls: type, changed: ChangedLines) -> bool:
+    '''
+    Whether a class's source changed anywhere but in the bodies of its
+    methods. (for instance, in the invariants of its docstring)
+    '''
+    span = source_span(cls)
+    if span is None:
+        return False
+    filename, start, end = span
+    lines = {line for line in changed.get(filename, ()) if start <= line <= end}
+    for fn in class_functions(cls):
+        fn_span = source_span(fn)
+        if fn_span is not None and fn_span[0] == filename:
+            lines.difference_update(range(fn_span[1], fn_span[2] + 1))
+    return bool(lines)
+
+
+def function_references(fn: Callable) -> Set[str]:
+    ''' Finds the names that a function's source refers to. '''
+    try:
+        source = textwrap.dedent(inspect.getsource(fn))
+        return referenced_names(ast.parse(source))
+    except (OSError, TypeError, SyntaxError):
+        return set()
+
+
+T = TypeVar('T')
+
+
+def select_changed(candidates: Mapping[T, Callable], changed: ChangedLines,
+                   helpers: Iterable[Callable] = ()) -> Set[T]:
+    '''
+    Picks out the candidates (functions, by key) whose source changed, plus
+    those that call them. (since calls to functions with contracts are
+    short-circuited, a caller's analysis depends on its callees' contracts)
+
+    Callers do run the bodies of `helpers` (other functions, which are not
+    candidates themselves), so candidates are also picked when a helper they
+    call changed, or calls something that changed.
+    '''
+    selected = {key for key, fn in candidates.items() if is_changed(fn, changed)}
+    changed_names = {candidates[key].__name__ for key in selected}
+    unchanged_helpers = []
+    for helper in helpers:
+        if is_changed(helper, changed):
+            changed_names.add(helper.__name__)
+        else:
+            unchanged_helpers.append(helper)
+    while True:
+        affected = [helper for helper in unchanged_helpers
+                    if not changed_names.isdisjoint(function_references(helper))]
+        if not affected:
+            break
+        changed_names.update(helper.__name__ for helper in affected)
+        unchanged_helpers = [helper for helper in unchanged_helpers if helper not in affected]
+    for key, fn in candidates.items():
+        if key not in selected and not changed_names.isdisjoint(function_references(fn)):
+            selected.add(key)
+    return selected
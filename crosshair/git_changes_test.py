@@ -0,0 +1,109 @@
+import importlib
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from crosshair.git_changes import *
+
+
+def write_file(path: str, content: str) -> None:
+    with open(path, 'w') as fh:
+        fh.write(content)
+
+
+@unittest.skipUnless(shutil.which('git'), 'requires git')
+class GitChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.path = os.path.join(self.root, 'changedmod.py')
+        write_file(self.path, ('def f(x):\n'
+                               '    return x\n'
+                               'def g(x):\n'
+                               '    return f(x) + 1\n'
+                               'def h(x):\n'
+                               '    return x * 2\n'))
+        self.git('init', '-q')
+        self.git('add', 'changedmod.py')
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-m', 'initial')
+        sys.path.insert(0, self.root)
+
+    def tearDown(self):
+        sys.path.remove(self.root)
+        sys.modules.pop('changedmod', None)
+        sys.modules.pop('classmod', None)
+        shutil.rmtree(self.root)
+
+    def git(self, *args: str) -> None:
+        subprocess.run(('git',) + args, cwd=self.root, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def candidates(self):
+        module = importlib.import_module('changedmod')
+        return {name: getattr(module, name) for name in ('f', 'g', 'h')}
+
+    def test_nothing_changed(self):
+        changed = changed_lines('HEAD', self.root)
+        self.assertEqual(changed, {})
+        self.assertEqual(select_changed(self.candidates(), changed), set())
+
+    def test_changed_function_and_its_callers(self):
+        write_file(self.path, ('def f(x):\n'
+                               '    return x - 1\n'
+                               'def g(x):\n'
+                               '    return f(x) + 1\n'
+                               'def h(x):\n'
+                               '    return x * 2\n'))
+        changed = changed_lines('HEAD', self.root)
+        self.assertEqual(changed, {self.path: {2}})
+        self.assertEqual(select_changed(self.candidates(), changed), {'f', 'g'})
+
+    def test_changed_helper_without_contracts(self):
+        write_file(self.path, ('def f(x):\n'
+                               '    return x - 1\n'
+                               'def g(x):\n'
+                               '    return f(x) + 1\n'
+                               'def h(x):\n'
+                               '    return x * 2\n'))
+        changed = changed_lines('HEAD', self.root)
+        candidates = self.candidates()
+        helpers = [candidates.pop('f')]
+        self.assertEqual(select_changed(candidates, changed, helpers), {'g'})
+
+    def test_changed_class_invariant(self):
+        path = os.path.join(self.root, 'classmod.py')
+        write_file(path, ('class C:\n'
+                          '    \'\'\' inv: self.x >= 0 \'\'\'\n'
+                          '    def __init__(self):\n'
+                          '        self.x = 0\n'))
+        self.git('add', 'classmod.py')
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-m', 'add class')
+        write_file(path, ('class C:\n'
+                          '    \'\'\' inv: self.x > 0 \'\'\'\n'
+                          '    def __init__(self):\n'
+                          '        self.x = 0\n'))
+        cls = importlib.import_module('classmod').C
+        self.assertTrue(changed_outside_methods(cls, changed_lines('HEAD', self.root)))
+        write_file(path, ('class C:\n'
+                          '    \'\'\' inv: self.x >= 0 \'\'\'\n'
+                          '    def __init__(self):\n'
+                          '        self.x = 1\n'))
+        self.assertFalse(changed_outside_methods(cls, changed_lines('HEAD', self.root)))
+
+    def test_untracked_files_are_entirely_changed(self):
+        other = os.path.join(self.root, 'newmod.py')
+        write_file(other, 'X = 1\nY = 2\n')
+        self.assertEqual(changed_lines('HEAD', self.root), {other: {1, 2}})
+
+    def test_unknown_revision(self):
+        with self.assertRaises(GitError):
+            changed_lines('no-such-revision', self.root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,14 @@
 from crosshair.libimpl import collectionslib
+from crosshair.libimpl import datetimelib
+from crosshair.libimpl import iolib
+from crosshair.libimpl import relib
 from crosshair.libimpl import stdlib
 from crosshair.libimpl import builtinslib
 
 def make_registrations():
     builtinslib.make_registrations()
     collectionslib.make_registrations()
+    datetimelib.make_registrations()
+    iolib.make_registrations()
+    relib.make_registrations()
     stdlib.make_registrations()
-
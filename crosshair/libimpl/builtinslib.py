@@ -1,6 +1,5 @@
 import collections
 import contextlib
-import io
 import re
 import typing
 from typing import *
@@ -44,17 +43,13 @@ def make_registrations():
     register_type(re.Match, lambda p, t=None: p(re.match))  # type: ignore
     
     # Text: (elsewhere - identical to str)
-    register_type(bytes, lambda p: p(ByteString))
-    register_type(bytearray, lambda p: p(ByteString))
-    register_type(memoryview, lambda p: p(ByteString))
+    # bytes and bytearray: (handled natively)
+    register_type(memoryview, lambda p: memoryview(bytes(p(bytes))))
     # AnyStr,  (it's a type var)
     
-    register_type(typing.BinaryIO, lambda p: io.BytesIO(p(ByteString)))
+    # BinaryIO and TextIO: (symbolic streams in iolib)
     # TODO: handle Any/AnyStr with a custom class that accepts str/bytes interchangably?:
     register_type(typing.IO, lambda p, t=Any: p(BinaryIO) if t == 'bytes' else p(TextIO))
-    # TODO: StringIO (and BytesIO) won't accept SmtStr writes.
-    # Consider clean symbolic implementations of these.
-    register_type(typing.TextIO, lambda p: io.StringIO(str(p(str))))
     
     register_type(SupportsAbs, lambda p: p(int))
     register_type(SupportsFloat, lambda p: p(float))
@@ -1,30 +1,391 @@
 import collections
+import copy
 from typing import *
 
 from crosshair import register_type
+from crosshair.core import EmulatedValue
+from crosshair.simplestructs import SimpleDict
 
 T = TypeVar('T')
-class ListBasedDeque:
-    def __init__(self, contents: List[T], maxlen: Optional[int]=None):
+
+
+def _copied(mapping: MutableMapping) -> MutableMapping:
+    if isinstance(mapping, SimpleDict):
+        return SimpleDict(list(mapping.items()))
+    return copy.copy(mapping)
+
+
+class ListBasedDeque(EmulatedValue, collections.abc.MutableSequence, Generic[T]):
+    _emulated_type = collections.deque
+
+    def __init__(self, contents: MutableSequence[T], maxlen: Optional[int] = None):
+        if maxlen is not None and len(contents) > maxlen:
+            contents = contents[len(contents) - maxlen:]
         self._contents = contents
         self._maxlen = maxlen
+
+    @property
+    def maxlen(self) -> Optional[int]:
+        return self._maxlen
+
     def _has_room(self) -> bool:
         maxlen = self._maxlen
         return maxlen is None or len(self._contents) < maxlen
-    def append_left(self, item: T):
-        if self._has_room():
-            self._contents = [item] + self._contents
-    # TODO: implement remainder of deque ...
+
+    def _is_overfull(self) -> bool:
+        maxlen = self._maxlen
+        return maxlen is not None and len(self._contents) > maxlen
+
+    def __len__(self):
+        return len(self._contents)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            raise TypeError("sequence index must be integer, not 'slice'")
+        return self._contents[k]
+
+    def __setitem__(self, k, value):
+        self._contents[k] = value
+
+    def __delitem__(self, k):
+        del self._contents[k]
+
+    def __iter__(self):
+        return iter(self._contents)
+
+    def __contains__(self, item):
+        return item in self._contents
+
+    def __eq__(self, other):
+        if isinstance(other, ListBasedDeque):
+            return self._contents == other._contents
+        if isinstance(other, collections.deque):
+            return self._contents == list(other)
+        return False
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self):
+        if self._maxlen is None:
+            return f'deque({list(self._contents)!r})'
+        return f'deque({list(self._contents)!r}, maxlen={self._maxlen!r})'
+
+    def __copy__(self):
+        return ListBasedDeque(copy.copy(self._contents), self._maxlen)
+
+    copy = __copy__
+
+    def __add__(self, other):
+        if not isinstance(other, (ListBasedDeque, collections.deque)):
+            raise TypeError(f'can only concatenate deque (not "{type(other).__name__}") to deque')
+        ret = self.copy()
+        ret.extend(other)
+        return ret
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def insert(self, index, item):
+        if not self._has_room():
+            raise IndexError('deque already at its maximum size')
+        self._contents.insert(index, item)
+
+    def append(self, item: T) -> None:
+        self._contents.append(item)
+        if self._is_overfull():
+            del self._contents[0]
+
+    def appendleft(self, item: T) -> None:
+        self._contents.insert(0, item)
+        if self._is_overfull():
+            del self._contents[-1]
+
+    def extend(self, items: Iterable[T]) -> None:
+        if self._maxlen is None and items is not self:
+            self._contents.extend(items)
+        else:
+            for item in list(items):
+                self.append(item)
+
+    def extendleft(self, items: Iterable[T]) -> None:
+        for item in list(items):
+            self.appendleft(item)
+
+    def pop(self) -> T:  # type: ignore
+        if not self._contents:
+            raise IndexError('pop from an empty deque')
+        return self._contents.pop()
+
+    def popleft(self) -> T:
+        if not self._contents:
+            raise IndexError('pop from an empty deque')
+        return self._contents.pop(0)
+
+    def clear(self) -> None:
+        self._contents = []
+
+    def count(self, item) -> int:
+        return self._contents.count(item)
+
+    def remove(self, item) -> None:
+        try:
+            self._contents.remove(item)
+        except ValueError:
+            raise ValueError(f'{item!r} is not in deque')
+
+    def reverse(self) -> None:
+        self._contents.reverse()
+
+    def rotate(self, n: int = 1) -> None:
+        length = len(self._contents)
+        if length:
+            split = length - n % length
+            self._contents = self._contents[split:] + self._contents[:split]
+
+
+class DictBasedMapping(EmulatedValue, collections.abc.MutableMapping):
+    '''
+    Wraps another mapping (often a symbolic dict), which holds the contents.
+    '''
+    _emulated_type = dict
+
+    def __init__(self, inner: MutableMapping):
+        self.inner = inner
+
+    def __getitem__(self, k):
+        return self.inner[k]
+
+    def __setitem__(self, k, v):
+        self.inner[k] = v
+
+    def __delitem__(self, k):
+        del self.inner[k]
+
+    def __iter__(self):
+        return iter(self.inner)
+
+    def __len__(self):
+        return len(self.inner)
+
+    def __contains__(self, k):
+        return k in self.inner
+
+    def get(self, k, default=None):
+        return self.inner.get(k, default)
+
+    # (MutableMapping's versions of these would go through any overridden __getitem__)
+    def pop(self, k, *default):
+        return self.inner.pop(k, *default)
+
+    def popitem(self):
+        return self.inner.popitem()
+
+    def setdefault(self, k, default=None):
+        return self.inner.setdefault(k, default)
+
+    def __eq__(self, other):
+        if isinstance(other, DictBasedMapping):
+            other = other.inner
+        return self.inner == other
+
+    __hash__ = None  # type: ignore
+
+    def _repr_contents(self) -> str:
+        return '{' + ', '.join(f'{k!r}: {v!r}' for k, v in self.inner.items()) + '}'
+
+
+class DictBasedCounter(DictBasedMapping):
+    _emulated_type = collections.Counter
+
+    def __getitem__(self, k):
+        inner = self.inner
+        return inner[k] if k in inner else 0
+
+    def __delitem__(self, k):
+        # (unlike dicts, counters ignore missing keys)
+        inner = self.inner
+        if k in inner:
+            del inner[k]
+
+    def __repr__(self):
+        if not self:
+            return 'Counter()'
+        return 'Counter({' + ', '.join(f'{k!r}: {v!r}' for k, v in self.most_common()) + '})'
+
+    def copy(self):
+        return DictBasedCounter(_copied(self.inner))
+
+    __copy__ = copy
+
+    def elements(self) -> Iterator:
+        for elem, count in self.items():
+            idx = 0
+            while idx < count:
+                yield elem
+                idx += 1
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[object, int]]:
+        # (a stable insertion sort, so that the comparisons themselves decide the order)
+        ordered: List[Tuple[object, int]] = []
+        for item in self.items():
+            idx = len(ordered)
+            while idx > 0 and ordered[idx - 1][1] < item[1]:
+                idx -= 1
+            ordered.insert(idx, item)
+        return ordered if n is None else ordered[:n]
+
+    def _add_counts(self, counts: object, sign: int, kwargs: Mapping) -> None:
+        if counts is not None:
+            if isinstance(counts, collections.abc.Mapping):
+                for elem, count in counts.items():
+                    self[elem] = self[elem] + sign * count
+            else:
+                for elem in counts:  # type: ignore
+                    self[elem] = self[elem] + sign
+        if kwargs:
+            self._add_counts(kwargs, sign, {})
+
+    def update(self, counts=None, **kwargs):  # type: ignore
+        self._add_counts(counts, 1, kwargs)
+
+    def subtract(self, counts=None, **kwargs):
+        self._add_counts(counts, -1, kwargs)
+
+    def _combine(self, other, combine: Callable[[int, int], int]) -> 'DictBasedCounter':
+        if not isinstance(other, (DictBasedCounter, collections.Counter)):
+            return NotImplemented
+        result = DictBasedCounter(SimpleDict([]))
+        for elem, count in self.items():
+            newcount = combine(count, other[elem])
+            if newcount > 0:
+                result[elem] = newcount
+        for elem, count in other.items():
+            if elem not in self:
+                newcount = combine(0, count)
+                if newcount > 0:
+                    result[elem] = newcount
+        return result
+
+    def __add__(self, other):
+        return self._combine(other, lambda a, b: a + b)
+
+    def __sub__(self, other):
+        return self._combine(other, lambda a, b: a - b)
+
+    def __or__(self, other):
+        return self._combine(other, lambda a, b: b if a < b else a)
+
+    def __and__(self, other):
+        return self._combine(other, lambda a, b: a if a < b else b)
+
+    def __pos__(self):
+        return self._combine(DictBasedCounter(SimpleDict([])), lambda a, b: a)
+
+    def __neg__(self):
+        return self._combine(DictBasedCounter(SimpleDict([])), lambda a, b: -a)
+
+
+class DictBasedDefaultDict(DictBasedMapping):
+    _emulated_type = collections.defaultdict
+
+    def __init__(self, default_factory: Optional[Callable[[], object]], inner: MutableMapping):
+        DictBasedMapping.__init__(self, inner)
+        self.default_factory = default_factory
+
+    def __getitem__(self, k):
+        inner = self.inner
+        return inner[k] if k in inner else self.__missing__(k)
+
+    def __missing__(self, k):
+        if self.default_factory is None:
+            raise KeyError(k)
+        value = self.default_factory()
+        self.inner[k] = value
+        return value
+
+    def __repr__(self):
+        return f'defaultdict({self.default_factory!r}, {self._repr_contents()})'
+
+    def copy(self):
+        return DictBasedDefaultDict(self.default_factory, _copied(self.inner))
+
+    __copy__ = copy
+
+
+class DictBasedOrderedDict(DictBasedMapping):
+    '''
+    Symbolic dicts do not track the order of insertion, so we switch to a
+    SimpleDict (which does) as soon as the order might be affected.
+    '''
+    _emulated_type = collections.OrderedDict
+
+    def _ordered(self) -> SimpleDict:
+        inner = self.inner
+        if not isinstance(inner, SimpleDict):
+            inner = SimpleDict(list(inner.items()))
+            self.inner = inner
+        return inner
+
+    def __setitem__(self, k, v):
+        if k not in self.inner:
+            self._ordered()
+        self.inner[k] = v
+
+    def setdefault(self, k, default=None):
+        if k not in self.inner:
+            self._ordered()
+        return self.inner.setdefault(k, default)
+
+    def __reversed__(self):
+        return reversed(list(self.inner))
+
+    def __eq__(self, other):
+        if isinstance(other, (DictBasedOrderedDict, collections.OrderedDict)):
+            return list(self.items()) == list(other.items())
+        return DictBasedMapping.__eq__(self, other)
+
+    def __repr__(self):
+        if not self:
+            return 'OrderedDict()'
+        return f'OrderedDict({list(self.items())!r})'
+
+    def copy(self):
+        return DictBasedOrderedDict(_copied(self.inner))
+
+    __copy__ = copy
+
+    def move_to_end(self, k, last=True) -> None:
+        inner = self._ordered()
+        value = inner.pop(k)
+        if last:
+            inner[k] = value
+        else:
+            self.inner = SimpleDict([(k, value)] + list(inner.items()))
+
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError('dictionary is empty')
+        k = list(self.inner)[-1] if last else next(iter(self.inner))
+        return (k, self.pop(k))
+
+
+def make_chain_map(p: Callable, kt=Any, vt=Any) -> collections.ChainMap:
+    chain: collections.ChainMap = collections.ChainMap()
+    # (the maps are looked up lazily, so that the number of them can stay symbolic)
+    maps = p(List[Dict[kt, vt]])
+    if maps:
+        chain.maps = maps
+    return chain
 
 
 def make_registrations():
-    # NOTE: defaultdict could be symbolic (but note the default_factory is changable/stateful):
-    register_type(collections.defaultdict, lambda p, kt=Any, vt=Any: collections.defaultdict(p(Callable[[], vt]), p(Dict[kt, vt]))) # type: ignore
-    register_type(collections.ChainMap, lambda p, kt=Any, vt=Any: collections.ChainMap(*p(Tuple[Dict[kt, vt], ...]))) # type: ignore
+    register_type(collections.defaultdict, lambda p, kt=Any, vt=Any: DictBasedDefaultDict(p(Callable[[], vt]), p(Dict[kt, vt]))) # type: ignore
+    register_type(collections.ChainMap, make_chain_map)
     register_type(collections.abc.Mapping, lambda p, t=Any: p(Dict[t]))  # type: ignore
     register_type(collections.abc.MutableMapping, lambda p, t=Any: p(Dict[t]))  # type: ignore
-    register_type(collections.OrderedDict, lambda p, kt=Any, vt=Any: collections.OrderedDict(p(Dict[kt, vt]))) # type: ignore
-    register_type(collections.Counter, lambda p, t=Any: collections.Counter(p(Dict[t, int]))) # type: ignore
+    register_type(collections.OrderedDict, lambda p, kt=Any, vt=Any: DictBasedOrderedDict(p(Dict[kt, vt]))) # type: ignore
+    register_type(collections.Counter, lambda p, t=Any: DictBasedCounter(p(Dict[t, int]))) # type: ignore
     # TODO: MappingView is missing
     register_type(collections.abc.ItemsView, lambda p, kt=Any, vt=Any: p(Set[Tuple[kt, vt]]))  # type: ignore
     register_type(collections.abc.KeysView, lambda p, t=Any: p(Set[t]))  # type: ignore
@@ -33,9 +394,7 @@ def make_registrations():
     register_type(collections.abc.Container, lambda p, t=Any: p(Tuple[t, ...]))
     register_type(collections.abc.Collection, lambda p, t=Any: p(Tuple[t, ...]))
 
-    register_type(collections.deque, lambda p, t=Any: collections.deque(p(Tuple[t, ...])))
-    # TODO: When ready, use custom deque class instead:
-    # register_type(collections.deque, lambda p, t=Any: ListBasedDeque(p(List[t, ...]))) # type: ignore
+    register_type(collections.deque, lambda p, t=Any: ListBasedDeque(p(List[t]))) # type: ignore
 
     register_type(collections.abc.Iterable, lambda p, t=Any: p(Tuple[t, ...]))
     register_type(collections.abc.Iterator, lambda p, t=Any: iter(p(Iterable[t])))  # type: ignore
@@ -47,5 +406,5 @@ def make_registrations():
 
     register_type(collections.abc.MutableSet, lambda p, t=Any: p(Set[t]))  # type: ignore
 
-    register_type(collections.abc.ByteString, lambda p: bytes(b % 256 for b in p(List[int])))
+    register_type(collections.abc.ByteString, lambda p: p(bytes))
     register_type(collections.abc.Hashable, lambda p: p(int))
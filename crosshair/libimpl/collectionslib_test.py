@@ -1,4 +1,6 @@
+import collections
 import sys
+import typing
 import unittest
 from typing import *
 
@@ -12,29 +14,117 @@ from crosshair.test_util import check_messages
 from crosshair.util import set_debug
 
 class CollectionsLibTests(unittest.TestCase):
-    # Remove these TODO prefixes to enable the tests:
-    def TODO_test_deque_len_ok(self) -> None:
+    def test_deque_len_ok(self) -> None:
         def f(l: Deque[int]) -> Deque[int]:
             '''
             post: len(_) == len(__old__.l) + 1
             '''
             l.append(42)
             return l
-        # Right now, this returns unknown rather than ok, because creation of
-        # the deque forces the list length to become concrete.
         self.assertEqual(*check_ok(f))
 
-    def TODO_test_deque_len_fail(self) -> None:
+    def test_deque_len_fail(self) -> None:
         def f(l: Deque[int]) -> Deque[int]:
             '''
             pre: len(l) > 0
             post: len(l) != 222
             '''
             return l
-        # Right now, this returns unknown rather than fail, because creation of
-        # the deque forces the list length to become concrete.
         self.assertEqual(*check_fail(f))
 
+    def test_deque_rotate_fail(self) -> None:
+        def f(l: Deque[int]) -> int:
+            '''
+            pre: len(l) > 0
+            post: _ != 7
+            '''
+            l.rotate(1)
+            return l.popleft()
+        self.assertEqual(*check_fail(f))
+
+    def test_deque_isinstance_ok(self) -> None:
+        def f(l: Deque[int]) -> bool:
+            ''' post: _ '''
+            return isinstance(l, collections.deque)
+        self.assertEqual(*check_ok(f))
+
+    def test_counter_missing_key_fail(self) -> None:
+        def f(c: Counter[int]) -> int:
+            ''' post: _ != 3 '''
+            return c[5]
+        self.assertEqual(*check_fail(f))
+
+    def test_counter_delete_missing_key_ok(self) -> None:
+        def f(c: Counter[int]) -> int:
+            ''' post: _ == 0 '''
+            del c[5]
+            return c[5]
+        self.assertEqual(*check_ok(f))
+
+    def test_counter_pop_and_setdefault_ok(self) -> None:
+        def f(c: Counter[str]) -> Tuple[int, int]:
+            '''
+            pre: 'x' not in c and 'y' not in c
+            post: _ == (5, 7) and c['y'] == 7
+            '''
+            return (c.pop('x', 5), c.setdefault('y', 7))
+        self.assertEqual(*check_ok(f))
+
+    def test_counter_pop_missing_key_err(self) -> None:
+        def f(c: Counter[str]) -> int:
+            ''' post: True '''
+            return c.pop('z')
+        self.assertEqual(*check_exec_err(f, 'KeyError'))
+
+    def test_counter_update_ok(self) -> None:
+        def f(c: Counter[str]) -> int:
+            ''' post: _ == __old__.c['x'] + 1 '''
+            c.update(['x'])
+            return c['x']
+        self.assertEqual(*check_ok(f))
+
+    def test_defaultdict_default_fail(self) -> None:
+        def f(d: DefaultDict[int, int]) -> int:
+            ''' post: _ != 4 '''
+            return d[3]
+        self.assertEqual(*check_fail(f))
+
+    def test_defaultdict_pop_and_setdefault_ok(self) -> None:
+        def f(d: DefaultDict[str, str]) -> Tuple[str, str]:
+            '''
+            pre: 'x' not in d and 'k' not in d
+            post: _ == ('D', 'V') and 'x' not in d
+            '''
+            return (d.pop('x', 'D'), d.setdefault('k', 'V'))
+        self.assertEqual(*check_ok(f))
+
+    def test_defaultdict_popitem_fail(self) -> None:
+        def f(d: DefaultDict[int, int]) -> Tuple[int, int]:
+            '''
+            pre: len(d) == 1
+            post: _ != (1, 2)
+            '''
+            return d.popitem()
+        self.assertEqual(*check_fail(f))
+
+    def test_ordereddict_move_to_end_ok(self) -> None:
+        def f(d: typing.OrderedDict[int, int]) -> Tuple[int, int]:
+            '''
+            pre: len(d) < 3
+            post: _ == (4, 5)
+            '''
+            d[4] = 5
+            d.move_to_end(4)
+            return d.popitem()
+        self.assertEqual(*check_ok(f))
+
+    def test_ordereddict_len_fail(self) -> None:
+        def f(d: typing.OrderedDict[int, int]) -> int:
+            ''' post: _ != 10 '''
+            return len(d)
+        self.assertEqual(*check_fail(f))
+
+
 if __name__ == '__main__':
     if ('-v' in sys.argv) or ('--verbose' in sys.argv):
         set_debug(True)
@@ -0,0 +1,425 @@
+import datetime
+from typing import *
+
+from crosshair import register_type, realize, IgnoreAttempt
+from crosshair.core import EmulatedValue
+
+_MIN_ORDINAL = datetime.date.min.toordinal()
+_MAX_ORDINAL = datetime.date.max.toordinal()
+_US_PER_SECOND = 1000000
+_US_PER_DAY = 24 * 3600 * _US_PER_SECOND
+_MIN_DELTA_US = datetime.timedelta.min.days * _US_PER_DAY
+_MAX_DELTA_US = (datetime.timedelta.max.days + 1) * _US_PER_DAY - 1
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def civil_from_ordinal(ordinal: int) -> Tuple[int, int, int]:
+    '''
+    Finds the (year, month, day) for a proleptic Gregorian ordinal, using only
+    integer arithmetic, so that it also works with symbolic integers.
+
+    >>> civil_from_ordinal(datetime.date(2000, 2, 29).toordinal())
+    (2000, 2, 29)
+    >>> civil_from_ordinal(datetime.date(1999, 12, 31).toordinal())
+    (1999, 12, 31)
+    '''
+    # (Howard Hinnant's "civil_from_days" algorithm, with years that begin in March,
+    # so that leap days fall at the end of the year)
+    days = ordinal + 305  # (days since March 1st, year 0)
+    era = days // 146097  # (400 year cycles)
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 -
+                   day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_from_march = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * month_from_march + 2) // 5 + 1
+    year = era * 400 + year_of_era
+    if month_from_march < 10:
+        return (year, month_from_march + 3, day)
+    return (year + 1, month_from_march - 9, day)
+
+
+def _is_leap_year(year: int) -> bool:
+    # (with "&" and "|", this stays a single symbolic expression)
+    return (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+
+
+def _is_valid_civil(year: int, month: int, day: int) -> bool:
+    # (the checks are combined with "&" and "|" so that they make a single branch)
+    return ((datetime.MINYEAR <= year) & (year <= datetime.MAXYEAR) &
+            (1 <= month) & (month <= 12) & (1 <= day) &
+            ((day <= 28) |
+             ((day <= 30) & (month != 2)) |
+             ((day == 31) & (month != 2) & (month != 4) & (month != 6) &
+              (month != 9) & (month != 11)) |
+             ((day == 29) & (month == 2) & _is_leap_year(year))))
+
+
+def ordinal_from_civil(year: int, month: int, day: int) -> int:
+    '''
+    The inverse of civil_from_ordinal(), for valid dates.
+
+    >>> ordinal_from_civil(2000, 2, 29) == datetime.date(2000, 2, 29).toordinal()
+    True
+    '''
+    # (this is written without branches, and with the same divisions of the year
+    # that the leap year check uses, which keeps it easy on the solver)
+    is_leap = _is_leap_year(year)
+    days_before_month = sum((month > m) * days for m, days in enumerate(_DAYS_IN_MONTH[:-1], 1))
+    return (365 * (year - 1) + year // 4 - year // 100 + year // 400 - is_leap +
+            days_before_month + ((month > 2) & is_leap) + day)
+
+
+def _civil_date(year: int, month: int, day: int) -> 'SymbolicDate':
+    return SymbolicDate(ordinal_from_civil(year, month, day), (year, month, day))
+
+
+def _delta_microseconds(value: object) -> Optional[int]:
+    if isinstance(value, SymbolicTimeDelta):
+        return value._microseconds
+    if type(value) is datetime.timedelta:
+        return (value.days * 24 * 3600 + value.seconds) * _US_PER_SECOND + value.microseconds  # type: ignore
+    return None
+
+
+def _date_ordinal(value: object) -> Optional[int]:
+    if isinstance(value, SymbolicDate):
+        return value._ordinal
+    if type(value) is datetime.date:
+        return value.toordinal()  # type: ignore
+    return None
+
+
+def _days_delta(days: int) -> 'SymbolicTimeDelta':
+    return SymbolicTimeDelta(days * _US_PER_DAY, (days, 0, 0))
+
+
+class _RealizableValue(EmulatedValue):
+    def _realized(self):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return repr(self._realized())
+
+    def __str__(self):
+        return str(self._realized())
+
+    def __format__(self, format_spec):
+        return format(self._realized(), format_spec)
+
+
+class SymbolicTimeDelta(_RealizableValue):
+    '''
+    A timedelta, as a (possibly symbolic) whole number of microseconds.
+    '''
+    _emulated_type = datetime.timedelta
+    min = datetime.timedelta.min
+    max = datetime.timedelta.max
+    resolution = datetime.timedelta.resolution
+
+    def __init__(self, microseconds: int, fields: Optional[Tuple[int, int, int]] = None):
+        if fields is None and not (_MIN_DELTA_US <= microseconds <= _MAX_DELTA_US):
+            raise OverflowError('timedelta value out of range')
+        self._microseconds = microseconds
+        # (the normalized days, seconds, and microseconds, when they are known
+        # without dividing)
+        self._fields = fields
+
+    def _realized(self) -> datetime.timedelta:
+        return datetime.timedelta(microseconds=realize(self._microseconds))
+
+    @property
+    def days(self) -> int:
+        if self._fields is not None:
+            return self._fields[0]
+        return self._microseconds // _US_PER_DAY
+
+    @property
+    def seconds(self) -> int:
+        if self._fields is not None:
+            return self._fields[1]
+        return (self._microseconds % _US_PER_DAY) // _US_PER_SECOND
+
+    @property
+    def microseconds(self) -> int:
+        if self._fields is not None:
+            return self._fields[2]
+        return self._microseconds % _US_PER_SECOND
+
+    def total_seconds(self) -> float:
+        return self._microseconds / _US_PER_SECOND
+
+    def __bool__(self):
+        return self._microseconds != 0
+
+    def __eq__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        return self._microseconds == other_us
+
+    def __hash__(self):
+        return hash(self._realized())
+
+    def __lt__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        return self._microseconds < other_us
+
+    def __le__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        return self._microseconds <= other_us
+
+    def __gt__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        return self._microseconds > other_us
+
+    def __ge__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        return self._microseconds >= other_us
+
+    def __pos__(self):
+        return self
+
+    def __neg__(self):
+        return SymbolicTimeDelta(-self._microseconds)
+
+    def __abs__(self):
+        return self if self._microseconds >= 0 else -self
+
+    def __add__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is not None:
+            return SymbolicTimeDelta(self._microseconds + other_us)
+        if _date_ordinal(other) is not None:
+            return SymbolicDate(other.toordinal()) + self
+        if isinstance(other, datetime.date):  # (e.g. a datetime)
+            return other + self._realized()
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        return SymbolicTimeDelta(self._microseconds - other_us)
+
+    def __rsub__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is not None:
+            return SymbolicTimeDelta(other_us - self._microseconds)
+        if _date_ordinal(other) is not None:
+            return SymbolicDate(other.toordinal()) - self
+        if isinstance(other, datetime.date):
+            return other - self._realized()
+        return NotImplemented
+
+    def __mul__(self, other):
+        if isinstance(other, int):
+            return SymbolicTimeDelta(self._microseconds * other)
+        if isinstance(other, float):
+            return self._realized() * other
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __floordiv__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is not None:
+            if other_us == 0:
+                raise ZeroDivisionError('integer division or modulo by zero')
+            return self._microseconds // other_us
+        if isinstance(other, int):
+            if other == 0:
+                raise ZeroDivisionError('integer division or modulo by zero')
+            return SymbolicTimeDelta(self._microseconds // other)
+        return NotImplemented
+
+    def __truediv__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is not None:
+            if other_us == 0:
+                raise ZeroDivisionError('division by zero')
+            return self._microseconds / other_us
+        if isinstance(other, (int, float)):
+            return self._realized() / other
+        return NotImplemented
+
+    def __mod__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        if other_us == 0:
+            raise ZeroDivisionError('integer division or modulo by zero')
+        return SymbolicTimeDelta(self._microseconds % other_us)
+
+    def __divmod__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        return (self // other, self % other)
+
+
+class SymbolicDate(_RealizableValue):
+    '''
+    A date, as a (possibly symbolic) proleptic Gregorian ordinal.
+
+    Deriving the year, month, and day from an ordinal is hard on the solver,
+    so dates that start out as a year, month, and day remember them.
+    '''
+    _emulated_type = datetime.date
+    min = datetime.date.min
+    max = datetime.date.max
+    resolution = datetime.date.resolution
+
+    def __init__(self, ordinal: int, civil: Optional[Tuple[int, int, int]] = None):
+        if civil is None and not (_MIN_ORDINAL <= ordinal <= _MAX_ORDINAL):
+            raise OverflowError('date value out of range')
+        self._ordinal = ordinal
+        self._civil = civil
+
+    def _civil_date(self) -> Tuple[int, int, int]:
+        civil = self._civil
+        if civil is None:
+            civil = civil_from_ordinal(self._ordinal)
+            self._civil = civil
+        return civil
+
+    def _realized(self) -> datetime.date:
+        if self._civil is None:
+            return datetime.date.fromordinal(realize(self._ordinal))
+        return datetime.date(*map(realize, self._civil))
+
+    @property
+    def year(self) -> int:
+        return self._civil_date()[0]
+
+    @property
+    def month(self) -> int:
+        return self._civil_date()[1]
+
+    @property
+    def day(self) -> int:
+        return self._civil_date()[2]
+
+    def toordinal(self) -> int:
+        return self._ordinal
+
+    def weekday(self) -> int:
+        return (self._ordinal + 6) % 7
+
+    def isoweekday(self) -> int:
+        return (self._ordinal + 6) % 7 + 1
+
+    def isocalendar(self):
+        return self._realized().isocalendar()
+
+    def isoformat(self) -> str:
+        return self._realized().isoformat()
+
+    def strftime(self, fmt: str) -> str:
+        return self._realized().strftime(fmt)
+
+    def ctime(self) -> str:
+        return self._realized().ctime()
+
+    def timetuple(self):
+        return self._realized().timetuple()
+
+    def replace(self, year=None, month=None, day=None) -> 'SymbolicDate':
+        cur_year, cur_month, cur_day = self._civil_date()
+        year = cur_year if year is None else year
+        month = cur_month if month is None else month
+        day = cur_day if day is None else day
+        if not _is_valid_civil(year, month, day):
+            raise ValueError('invalid date')
+        return _civil_date(year, month, day)
+
+    def __eq__(self, other):
+        other_ordinal = _date_ordinal(other)
+        if other_ordinal is None:
+            return NotImplemented
+        return self._ordinal == other_ordinal
+
+    def __hash__(self):
+        return hash(self._realized())
+
+    def __lt__(self, other):
+        other_ordinal = _date_ordinal(other)
+        if other_ordinal is None:
+            return NotImplemented
+        return self._ordinal < other_ordinal
+
+    def __le__(self, other):
+        other_ordinal = _date_ordinal(other)
+        if other_ordinal is None:
+            return NotImplemented
+        return self._ordinal <= other_ordinal
+
+    def __gt__(self, other):
+        other_ordinal = _date_ordinal(other)
+        if other_ordinal is None:
+            return NotImplemented
+        return self._ordinal > other_ordinal
+
+    def __ge__(self, other):
+        other_ordinal = _date_ordinal(other)
+        if other_ordinal is None:
+            return NotImplemented
+        return self._ordinal >= other_ordinal
+
+    def __add__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is None:
+            return NotImplemented
+        # (like datetime.date, this ignores any fraction of a day)
+        return SymbolicDate(self._ordinal + other.days)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other_us = _delta_microseconds(other)
+        if other_us is not None:
+            # (like datetime.date, this ignores any fraction of a day)
+            return SymbolicDate(self._ordinal - other.days)
+        other_ordinal = _date_ordinal(other)
+        if other_ordinal is not None:
+            return _days_delta(self._ordinal - other_ordinal)
+        return NotImplemented
+
+    def __rsub__(self, other):
+        other_ordinal = _date_ordinal(other)
+        if other_ordinal is None:
+            return NotImplemented
+        return _days_delta(other_ordinal - self._ordinal)
+
+
+def make_registrations():
+
+    def make_date(p: Callable) -> SymbolicDate:
+        year, month, day = p(int), p(int), p(int)
+        if not _is_valid_civil(year, month, day):
+            raise IgnoreAttempt('Invalid date')
+        return _civil_date(year, month, day)
+
+    register_type(datetime.date, make_date)
+
+    def make_timedelta(p: Callable) -> SymbolicTimeDelta:
+        days, seconds, microseconds = p(int), p(int), p(int)
+        # the normalized ranges, per the docs:
+        if not ((datetime.timedelta.min.days <= days) & (days <= datetime.timedelta.max.days) &
+                (0 <= seconds) & (seconds < 3600 * 24) &
+                (0 <= microseconds) & (microseconds < _US_PER_SECOND)):
+            raise IgnoreAttempt('Invalid timedelta')
+        total = (days * 3600 * 24 + seconds) * _US_PER_SECOND + microseconds
+        return SymbolicTimeDelta(total, (days, seconds, microseconds))
+
+    register_type(datetime.timedelta, make_timedelta)
@@ -0,0 +1,106 @@
+import datetime
+import sys
+import unittest
+from typing import *
+
+from crosshair.core_and_libs import *
+from crosshair.test_util import check_ok
+from crosshair.test_util import check_exec_err
+from crosshair.test_util import check_fail
+from crosshair.test_util import check_unknown
+from crosshair.util import set_debug
+
+
+class DatetimeLibTests(unittest.TestCase):
+    def test_date_isinstance_ok(self) -> None:
+        def f(d: datetime.date) -> bool:
+            ''' post: _ '''
+            return isinstance(d, datetime.date)
+        self.assertEqual(*check_ok(f))
+
+    def test_date_month_fail(self) -> None:
+        def f(d: datetime.date) -> int:
+            ''' post: _ != 2 '''
+            return d.month
+        self.assertEqual(*check_fail(f))
+
+    def test_leap_day_fail(self) -> None:
+        def f(d: datetime.date) -> bool:
+            ''' post: not _ '''
+            return d.month == 2 and d.day == 29 and d.year > 2100
+        self.assertEqual(*check_fail(f))
+
+    def test_date_plus_timedelta_ok(self) -> None:
+        def f(start: datetime.date, t: datetime.timedelta) -> datetime.date:
+            '''
+            pre: datetime.timedelta(0) <= t <= datetime.timedelta(days=100)
+            pre: start < datetime.date(2100, 1, 1)
+            post: _ >= start
+            '''
+            return start + t
+        self.assertEqual(*check_ok(f))
+
+    def test_date_overflow_err(self) -> None:
+        def f(d: datetime.date) -> datetime.date:
+            ''' post: _ > d '''
+            return d + datetime.timedelta(days=1)
+        self.assertEqual(*check_exec_err(f, 'OverflowError'))
+
+    def test_date_difference_fail(self) -> None:
+        def f(start: datetime.date, t: datetime.timedelta) -> int:
+            '''
+            pre: datetime.timedelta(0) <= t <= datetime.timedelta(days=100)
+            pre: start < datetime.date(2100, 1, 1)
+            post: _ != 31
+            '''
+            return ((start + t) - start).days
+        self.assertEqual(*check_fail(f))
+
+    def test_date_minus_partial_day_ok(self) -> None:
+        def f(d: datetime.date) -> datetime.date:
+            '''
+            pre: d > datetime.date(2000, 1, 1)
+            post: _ == d
+            '''
+            return d - datetime.timedelta(hours=1)
+        self.assertEqual(*check_ok(f))
+
+    def test_concrete_date_minus_partial_day_ok(self) -> None:
+        def f(t: datetime.timedelta) -> datetime.date:
+            '''
+            pre: datetime.timedelta(0) < t < datetime.timedelta(days=1)
+            post: _ == datetime.date(2020, 1, 2)
+            '''
+            return datetime.date(2020, 1, 2) - t
+        self.assertEqual(*check_ok(f))
+
+    def test_date_passed_to_c_function_unknown(self) -> None:
+        def f(d: datetime.date) -> datetime.datetime:
+            ''' post: _.date() == d '''
+            return datetime.datetime.combine(d, datetime.time())
+        self.assertEqual(*check_unknown(f))
+
+    def test_date_replace_ok(self) -> None:
+        def f(d: datetime.date) -> datetime.date:
+            ''' post: _.day == 1 '''
+            return d.replace(day=1)
+        self.assertEqual(*check_ok(f))
+
+    def test_timedelta_abs_ok(self) -> None:
+        def f(t: datetime.timedelta) -> datetime.timedelta:
+            ''' post: _ >= datetime.timedelta(0) '''
+            return abs(t)
+        self.assertEqual(*check_ok(f))
+
+    def test_timedelta_sum_fail(self) -> None:
+        def f(a: datetime.timedelta, b: datetime.timedelta) -> datetime.timedelta:
+            ''' post: _ != datetime.timedelta(seconds=90) '''
+            return a + b
+        self.assertEqual(*check_fail(f))
+
+
+if __name__ == '__main__':
+    if ('-v' in sys.argv) or ('--verbose' in sys.argv):
+        set_debug(True)
+    else:
+        unittest.main()
@@ -0,0 +1,312 @@
+import csv
+import io
+import json
+import typing
+from typing import *
+
+import z3  # type: ignore
+
+from crosshair import realize, register_patch, register_type
+from crosshair.core import EmulatedValue, SmtBytes, SmtInt, SmtStr, name_of_type, smt_bytes_value
+from crosshair.util import CrosshairUnsupported
+
+# (strings and bytes share a z3 sort; one character per byte)
+_NEWLINE = smt_bytes_value(b'\n')
+_PADDING = z3.Star(z3.Re(smt_bytes_value(b'\x00')))
+
+
+class _SymbolicIO(EmulatedValue):
+    '''
+    Shared logic for in-memory streams over a symbolic buffer.
+
+    The buffer and the stream position are both symbolic, and reads, writes,
+    and seeks are expressed directly over them, so that consuming a stream
+    does not fork on (or realize) its contents.
+    '''
+    _emulated_type: type
+
+    def __init__(self, buffer: Union[SmtStr, SmtBytes]):
+        self._buffer = buffer
+        self._pos = SmtInt(buffer.statespace, int, z3.IntVal(0))
+        self._closed = False
+
+    def __repr__(self):
+        # (shows the contents, which is more helpful in counterexamples)
+        return f'{name_of_type(self._emulated_type)}({self._buffer!r})'
+
+    def _wrap(self, smtvar: z3.ExprRef) -> Union[SmtStr, SmtBytes]:
+        raise NotImplementedError
+
+    def _smt_data(self, value: object) -> z3.ExprRef:
+        raise NotImplementedError
+
+    def _check_open(self) -> None:
+        if self._closed:
+            raise ValueError('I/O operation on closed file.')
+
+    def _smt_index(self, value: object) -> z3.ExprRef:
+        if isinstance(value, SmtInt):
+            return value.var
+        if isinstance(value, int):
+            return z3.IntVal(value)
+        raise TypeError(f"'{name_of_type(type(value))}' object cannot be interpreted as an integer")
+
+    def _smt_size(self, size: object) -> Optional[z3.ExprRef]:
+        if size is None:
+            return None
+        if not isinstance(size, (int, SmtInt)):
+            raise TypeError(f"argument should be integer or None, not '{name_of_type(type(size))}'")
+        return self._smt_index(size)
+
+    def _take(self, count: z3.ExprRef) -> Union[SmtStr, SmtBytes]:
+        # (z3 clips the extraction at the end of the buffer, and gives an empty
+        # sequence for negative counts or positions past the end)
+        taken = z3.Extract(self._buffer.var, self._pos.var, count)
+        self._pos = SmtInt(self._buffer.statespace, int, self._pos.var + z3.Length(taken))
+        return self._wrap(taken)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        self._closed = True
+
+    def __enter__(self):
+        self._check_open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        self._check_open()
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def readable(self) -> bool:
+        self._check_open()
+        return True
+
+    def writable(self) -> bool:
+        self._check_open()
+        return True
+
+    def seekable(self) -> bool:
+        self._check_open()
+        return True
+
+    def isatty(self) -> bool:
+        self._check_open()
+        return False
+
+    def flush(self) -> None:
+        self._check_open()
+
+    def fileno(self) -> int:
+        raise io.UnsupportedOperation('fileno')
+
+    def getvalue(self):
+        self._check_open()
+        return self._wrap(self._buffer.var)
+
+    def tell(self) -> int:
+        self._check_open()
+        return self._pos
+
+    def read(self, size: Optional[int] = -1):
+        self._check_open()
+        remaining = z3.Length(self._buffer.var) - self._pos.var
+        smt_size = self._smt_size(size)
+        if smt_size is None:
+            return self._take(remaining)
+        return self._take(z3.If(smt_size < 0, remaining, smt_size))
+
+    def readline(self, size: Optional[int] = -1):
+        self._check_open()
+        buffer, pos = self._buffer.var, self._pos.var
+        newline_idx = z3.IndexOf(buffer, _NEWLINE, pos)
+        count = z3.If(newline_idx < 0, z3.Length(buffer) - pos, newline_idx + 1 - pos)
+        smt_size = self._smt_size(size)
+        if smt_size is not None:
+            count = z3.If(z3.And(0 <= smt_size, smt_size < count), smt_size, count)
+        return self._take(count)
+
+    def readlines(self, hint: Optional[int] = -1) -> list:
+        self._check_open()
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if hint is not None and 0 < hint <= total:
+                break
+        return lines
+
+    def write(self, data) -> int:
+        self._check_open()
+        smt_data = self._smt_data(data)
+        space = self._buffer.statespace
+        buffer, pos = self._buffer.var, self._pos.var
+        buffer_len = z3.Length(buffer)
+        # Writing past the end fills the gap with NUL characters:
+        padding = z3.Const('iopadding' + space.uniq(), buffer.sort())
+        space.add(z3.Length(padding) == z3.If(pos > buffer_len, pos - buffer_len, 0))
+        space.add(z3.InRe(padding, _PADDING))
+        end = pos + z3.Length(smt_data)
+        self._buffer = self._wrap(z3.Concat(
+            z3.Extract(buffer, 0, pos), padding, smt_data,
+            z3.Extract(buffer, end, buffer_len - end)))
+        self._pos = SmtInt(space, int, end)
+        return SmtInt(space, int, z3.Length(smt_data))
+
+    def writelines(self, lines: Iterable) -> None:
+        self._check_open()
+        for line in lines:
+            self.write(line)
+
+    def _truncate(self, size: Optional[int], negative_message: str) -> int:
+        self._check_open()
+        if size is None:
+            size = self._pos
+        smt_size = self._smt_index(size)
+        if size < 0:
+            raise ValueError(negative_message.format(size))
+        self._buffer = self._wrap(z3.Extract(self._buffer.var, 0, smt_size))
+        return size
+
+    def _seek_to(self, position: int) -> int:
+        self._pos = SmtInt(self._buffer.statespace, int, self._smt_index(position))
+        return self._pos
+
+
+class SymbolicStringIO(_SymbolicIO):
+    '''
+    An io.StringIO over a symbolic string.
+
+    Lines always end with "\\n" (as in a StringIO constructed with the default
+    newline argument).
+    '''
+    _emulated_type = io.StringIO
+    encoding = None
+    errors = None
+    newlines = None
+    line_buffering = False
+
+    def __init__(self, initial_value: SmtStr):
+        _SymbolicIO.__init__(self, initial_value)
+
+    def _wrap(self, smtvar: z3.ExprRef) -> SmtStr:
+        return SmtStr(self._buffer.statespace, str, smtvar)
+
+    def _smt_data(self, value: object) -> z3.ExprRef:
+        if isinstance(value, SmtStr):
+            return value.var
+        if isinstance(value, str):
+            try:
+                return smt_bytes_value(value.encode('latin-1'))
+            except UnicodeEncodeError:
+                raise CrosshairUnsupported('Symbolic strings only hold the first 256 code points')
+        raise TypeError(f"string argument expected, got '{name_of_type(type(value))}'")
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        self._check_open()
+        self._smt_index(pos)  # (for the type check)
+        if whence == io.SEEK_SET:
+            if pos < 0:
+                raise ValueError(f'Negative seek position {pos}')
+            return self._seek_to(pos)
+        if whence == io.SEEK_CUR:
+            if pos != 0:
+                raise OSError("Can't do nonzero cur-relative seeks")
+            return self._pos
+        if whence == io.SEEK_END:
+            if pos != 0:
+                raise OSError("Can't do nonzero end-relative seeks")
+            return self._seek_to(SmtInt(self._buffer.statespace, int, z3.Length(self._buffer.var)))
+        raise ValueError(f'Invalid whence ({whence}, should be 0, 1 or 2)')
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        return self._truncate(size, 'Negative size value {}')
+
+
+class SymbolicBytesIO(_SymbolicIO):
+    '''
+    An io.BytesIO over symbolic bytes.
+    '''
+    _emulated_type = io.BytesIO
+
+    def __init__(self, initial_bytes: SmtBytes):
+        _SymbolicIO.__init__(self, initial_bytes)
+
+    def _wrap(self, smtvar: z3.ExprRef) -> SmtBytes:
+        return SmtBytes(self._buffer.statespace, bytes, smtvar)
+
+    def _smt_data(self, value: object) -> z3.ExprRef:
+        if isinstance(value, SmtBytes):
+            return value.var
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return smt_bytes_value(bytes(value))
+        raise TypeError(f"a bytes-like object is required, not '{name_of_type(type(value))}'")
+
+    def read1(self, size: Optional[int] = -1):
+        return self.read(size)
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        self._check_open()
+        self._smt_index(pos)  # (for the type check)
+        if whence == io.SEEK_SET:
+            if pos < 0:
+                raise ValueError(f'negative seek value {pos}')
+            return self._seek_to(pos)
+        if whence == io.SEEK_CUR:
+            target = self._pos + pos
+        elif whence == io.SEEK_END:
+            target = SmtInt(self._buffer.statespace, int, z3.Length(self._buffer.var)) + pos
+        else:
+            raise ValueError(f'invalid whence ({whence}, should be 0, 1 or 2)')
+        # (relative seeks stop at the start of the stream)
+        return self._seek_to(SmtInt(self._buffer.statespace, int,
+                                    z3.If(target.var < 0, 0, target.var)))
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        return self._truncate(size, 'negative size value {}')
+
+
+def make_string_io(initial_value: str) -> io.StringIO:
+    if isinstance(initial_value, SmtStr):
+        return cast(io.StringIO, SymbolicStringIO(initial_value))
+    return io.StringIO(initial_value)
+
+
+def make_bytes_io(initial_bytes: bytes) -> io.BytesIO:
+    if isinstance(initial_bytes, SmtBytes):
+        return cast(io.BytesIO, SymbolicBytesIO(initial_bytes))
+    return io.BytesIO(initial_bytes)
+
+
+# Consumers of text that are implemented in C require real strings:
+_ORIGINAL_CSV_READER = csv.reader
+_ORIGINAL_JSON_LOADS = json.loads
+
+
+def _csv_reader(csvfile, *a, **kw):
+    return _ORIGINAL_CSV_READER(map(realize, csvfile), *a, **kw)
+
+
+def _json_loads(s, **kw):
+    return _ORIGINAL_JSON_LOADS(realize(s), **kw)
+
+
+def make_registrations():
+    register_patch(csv.reader, _csv_reader, module=csv)
+    register_patch(json.loads, _json_loads)  # (json.load() reads the stream and calls this)
+    register_type(io.StringIO, lambda p: make_string_io(p(str)))
+    register_type(io.BytesIO, lambda p: make_bytes_io(p(bytes)))
+    register_type(typing.TextIO, lambda p: make_string_io(p(str)))
+    register_type(typing.BinaryIO, lambda p: make_bytes_io(p(bytes)))
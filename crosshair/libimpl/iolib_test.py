@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import sys
+import unittest
+from typing import *
+from typing import BinaryIO, TextIO
+
+from crosshair.core_and_libs import *
+from crosshair.test_util import check_ok
+from crosshair.test_util import check_exec_err
+from crosshair.test_util import check_fail
+from crosshair.util import set_debug
+
+
+class StringIOTests(unittest.TestCase):
+    def test_readline_fail(self) -> None:
+        def f(stream: TextIO) -> str:
+            ''' post: not _.startswith('id,') '''
+            return stream.readline()
+        self.assertEqual(*check_fail(f))
+
+    def test_iteration_fail(self) -> None:
+        def f(stream: TextIO) -> int:
+            ''' post: _ < 2 '''
+            return sum(1 for line in stream)
+        self.assertEqual(*check_fail(f))
+
+    def test_header_check_err(self) -> None:
+        def f(stream: TextIO) -> List[str]:
+            ''' post: True '''
+            if not stream.readline().startswith('id,'):
+                raise ValueError('missing header')
+            return stream.readlines()
+        self.assertEqual(*check_exec_err(f, 'ValueError'))
+
+    def test_seek_and_read_ok(self) -> None:
+        def f(stream: io.StringIO) -> str:
+            ''' post: _ == stream.getvalue() '''
+            stream.seek(0)
+            return stream.read()
+        self.assertEqual(*check_ok(f))
+
+    def test_write_at_end_fail(self) -> None:
+        def f(stream: TextIO) -> str:
+            ''' post: _.startswith('x') '''
+            stream.seek(0, io.SEEK_END)
+            stream.write('x')
+            stream.seek(0)
+            return stream.read()
+        self.assertEqual(*check_fail(f))
+
+    def test_write_bytes_err(self) -> None:
+        def f(stream: TextIO) -> int:
+            ''' post: True '''
+            return stream.write(b'x')  # type: ignore
+        self.assertEqual(*check_exec_err(f, 'TypeError'))
+
+    def test_isinstance_ok(self) -> None:
+        def f(stream: TextIO) -> bool:
+            ''' post: _ '''
+            return isinstance(stream, io.StringIO) and isinstance(stream, io.TextIOBase)
+        self.assertEqual(*check_ok(f))
+
+    def test_csv_reader_fail(self) -> None:
+        def f(stream: TextIO) -> List[List[str]]:
+            '''
+            pre: chr(0) not in stream.getvalue()
+            post: len(_) < 2
+            '''
+            return list(csv.reader(stream))
+        self.assertEqual(*check_fail(f))
+
+    def test_csv_dict_reader_fail(self) -> None:
+        def f(stream: TextIO) -> List[Dict[str, str]]:
+            '''
+            pre: chr(0) not in stream.getvalue()
+            post: not _
+            '''
+            return list(csv.DictReader(stream, fieldnames=['a']))
+        self.assertEqual(*check_fail(f))
+
+    def test_json_load_err(self) -> None:
+        def f(stream: TextIO) -> object:
+            ''' post: True '''
+            return json.load(stream)
+        self.assertEqual(*check_exec_err(f, 'JSONDecodeError'))
+
+
+class BytesIOTests(unittest.TestCase):
+    def test_read_size_ok(self) -> None:
+        def f(stream: BinaryIO) -> bytes:
+            ''' post: len(_) <= 4 '''
+            return stream.read(4)
+        self.assertEqual(*check_ok(f))
+
+    def test_relative_seek_fail(self) -> None:
+        def f(stream: BinaryIO) -> bytes:
+            ''' post: _ != b'ab' '''
+            stream.seek(-2, io.SEEK_END)
+            return stream.read()
+        self.assertEqual(*check_fail(f))
+
+    def test_write_str_err(self) -> None:
+        def f(stream: io.BytesIO) -> int:
+            ''' post: True '''
+            return stream.write('x')  # type: ignore
+        self.assertEqual(*check_exec_err(f, 'TypeError'))
+
+
+if __name__ == '__main__':
+    if ('-v' in sys.argv) or ('--verbose' in sys.argv):
+        set_debug(True)
+    unittest.main()
@@ -0,0 +1,482 @@
+import functools
+import re
+import sre_compile
+import sre_parse
+from sre_constants import ANY, AT, AT_BEGINNING, AT_BEGINNING_STRING, AT_END, AT_END_STRING
+from sre_constants import BRANCH, IN, LITERAL, MAX_REPEAT, MAXREPEAT, MIN_REPEAT, NOT_LITERAL, SUBPATTERN
+from typing import *
+
+import z3  # type: ignore
+
+from crosshair import realize, register_patch
+from crosshair.core import EmulatedValue, SmtStr, smt_str_value
+
+# z3 characters are bytes, which symbolic strings use for the first 256 code
+# points; patterns are translated over exactly those characters.
+_ALPHABET = frozenset(range(256))
+
+# Complements and example strings come from a DFA; patterns needing more
+# states than this leave the complement to z3 (which is much slower at it):
+_MAX_AUTOMATON_STATES = 300
+
+# Patterns are first translated into a small tree of tuples:
+#   ('chars', codepoints)                   one character from a frozenset
+#   ('cat', [nodes])                        concatenation (empty for "")
+#   ('alt', [nodes])                        alternation
+#   ('repeat', node, min_count, max_count)  max_count is None when unbounded
+_Node = Tuple[Any, ...]
+_EPSILON: _Node = ('cat', [])
+_NOTHING: _Node = ('chars', frozenset())
+_ANY_STRING: _Node = ('repeat', ('chars', _ALPHABET), 0, None)
+_SINGLE_CHAR_OPS = (ANY, IN, LITERAL, NOT_LITERAL)
+
+
+class _UnsupportedRegex(Exception):
+    pass
+
+
+def _char_set(item: Tuple[object, object], flags: int) -> FrozenSet[int]:
+    if item[0] is LITERAL and not flags & re.IGNORECASE:
+        return frozenset([item[1]]) & _ALPHABET
+    # Let the regular expression engine tell us which characters the item
+    # accepts; this covers categories, negation and case-insensitivity exactly.
+    state = sre_parse.State()
+    state.flags = flags
+    matcher = sre_compile.compile(sre_parse.SubPattern(state, [item]), flags)
+    return frozenset(i for i in _ALPHABET if matcher.fullmatch(chr(i)))
+
+
+def _translate(parsed: Iterable[Tuple[object, Any]], flags: int) -> _Node:
+    nodes = []
+    for (op, arg) in parsed:
+        if op in _SINGLE_CHAR_OPS:
+            nodes.append(('chars', _char_set((op, arg), flags)))
+        elif op is SUBPATTERN:
+            (_group, add_flags, del_flags, subpattern) = arg
+            if add_flags or del_flags:
+                raise _UnsupportedRegex('scoped flags')
+            nodes.append(_translate(subpattern, flags))
+        elif op is BRANCH:
+            (_, branches) = arg
+            nodes.append(('alt', [_translate(b, flags) for b in branches]))
+        elif op is MAX_REPEAT or op is MIN_REPEAT:
+            # (greediness affects which match is found, but not whether there is one)
+            (min_count, max_count, subpattern) = arg
+            nodes.append(('repeat', _translate(subpattern, flags), min_count,
+                          None if max_count == MAXREPEAT else max_count))
+        else:
+            # Anchors within the pattern, lookarounds, and backreferences:
+            raise _UnsupportedRegex(str(op))
+    return ('cat', nodes)
+
+
+@functools.lru_cache()
+def _language(pattern: str, flags: int, method_name: str) -> Optional[_Node]:
+    # The strings on which the `re` method succeeds, or None if unsupported.
+    subpattern = sre_parse.parse(pattern, flags)
+    flags = subpattern.state.flags  # (including any inline flags)
+    parsed = list(subpattern)
+    anchored = bool(parsed) and parsed[0] in ((AT, AT_BEGINNING), (AT, AT_BEGINNING_STRING))
+    if anchored:
+        parsed = parsed[1:]
+    end_anchor = None
+    if parsed and parsed[-1] in ((AT, AT_END), (AT, AT_END_STRING)):
+        end_anchor = parsed[-1][1]
+        parsed = parsed[:-1]
+    if (anchored or end_anchor is not None) and flags & re.MULTILINE:
+        return None
+    try:
+        body = _translate(parsed, flags)
+    except _UnsupportedRegex:
+        return None
+    if method_name == 'fullmatch':
+        return body
+    if end_anchor is AT_END:
+        # "$" also matches just before a trailing newline
+        body = ('cat', [body, ('repeat', ('chars', frozenset([ord('\n')])), 0, 1)])
+    elif end_anchor is not AT_END_STRING:
+        body = ('cat', [body, _ANY_STRING])
+    if method_name == 'search' and not anchored:
+        body = ('cat', [_ANY_STRING, body])
+    return body
+
+
+@functools.lru_cache(maxsize=None)
+def _smt_char(codepoint: int) -> z3.SeqRef:
+    return smt_str_value(chr(codepoint))
+
+
+def _smt_char_class(codepoints: FrozenSet[int]) -> z3.ReRef:
+    runs: List[List[int]] = []
+    for codepoint in sorted(codepoints):
+        if runs and runs[-1][-1] + 1 == codepoint:
+            runs[-1].append(codepoint)
+        else:
+            runs.append([codepoint])
+    if not runs:
+        return z3.Empty(z3.ReSort(z3.StringSort()))
+    parts = [z3.Re(_smt_char(run[0])) if len(run) == 1 else
+             z3.Range(_smt_char(run[0]), _smt_char(run[-1]))
+             for run in runs]
+    return parts[0] if len(parts) == 1 else z3.Union(*parts)
+
+
+def _to_smt(node: _Node) -> z3.ReRef:
+    kind = node[0]
+    if kind == 'chars':
+        return _smt_char_class(node[1])
+    if kind == 'alt':
+        parts = [_to_smt(n) for n in node[1]]
+        return parts[0] if len(parts) == 1 else z3.Union(*parts)
+    if kind == 'repeat':
+        (_, body, min_count, max_count) = node
+        if node == _ANY_STRING:
+            return z3.Full(z3.ReSort(z3.StringSort()))
+        smt_body = _to_smt(body)
+        if max_count is None:
+            if min_count == 0:
+                return z3.Star(smt_body)
+            if min_count == 1:
+                return z3.Plus(smt_body)
+            return z3.Concat(z3.Loop(smt_body, min_count, min_count), z3.Star(smt_body))
+        if max_count == 0:
+            return z3.Re(z3.StringVal(''))
+        if (min_count, max_count) == (0, 1):
+            return z3.Option(smt_body)
+        return z3.Loop(smt_body, min_count, max_count)
+    # Concatenation; runs of plain ASCII characters become string literals:
+    parts: List[z3.ReRef] = []
+    literal: List[str] = []
+    for child in node[1]:
+        if child[0] == 'chars' and len(child[1]) == 1 and min(child[1]) < 128:
+            literal.append(chr(min(child[1])))
+            continue
+        if literal:
+            parts.append(z3.Re(z3.StringVal(''.join(literal))))
+            literal.clear()
+        parts.append(_to_smt(child))
+    if literal or not parts:
+        parts.append(z3.Re(z3.StringVal(''.join(literal))))
+    return parts[0] if len(parts) == 1 else z3.Concat(*parts)
+
+
+class _Nfa:
+    def __init__(self):
+        self.moves: List[List[Tuple[FrozenSet[int], int]]] = []
+        self.empty_moves: List[List[int]] = []
+
+    def new_state(self) -> int:
+        if len(self.moves) >= _MAX_AUTOMATON_STATES:
+            raise _UnsupportedRegex('automaton is too large')
+        self.moves.append([])
+        self.empty_moves.append([])
+        return len(self.moves) - 1
+
+    def build(self, node: _Node, start: int) -> int:
+        ''' Adds states that accept `node` from `start`; returns the final one. '''
+        kind = node[0]
+        if kind == 'chars':
+            end = self.new_state()
+            self.moves[start].append((node[1], end))
+            return end
+        if kind == 'cat':
+            for child in node[1]:
+                start = self.build(child, start)
+            return start
+        end = self.new_state()
+        if kind == 'alt':
+            for child in node[1]:
+                branch_start = self.new_state()
+                self.empty_moves[start].append(branch_start)
+                self.empty_moves[self.build(child, branch_start)].append(end)
+            return end
+        (_, body, min_count, max_count) = node
+        for _ in range(min_count):
+            start = self.build(body, start)
+        if max_count is None:
+            loop = self.new_state()
+            self.empty_moves[start].append(loop)
+            self.empty_moves[self.build(body, loop)].append(loop)
+            self.empty_moves[loop].append(end)
+            return end
+        for _ in range(max_count - min_count):
+            self.empty_moves[start].append(end)
+            start = self.build(body, start)
+        self.empty_moves[start].append(end)
+        return end
+
+    def closure(self, states: Iterable[int]) -> FrozenSet[int]:
+        reached = set(states)
+        pending = list(reached)
+        while pending:
+            for state in self.empty_moves[pending.pop()]:
+                if state not in reached:
+                    reached.add(state)
+                    pending.append(state)
+        return frozenset(reached)
+
+
+def _minterms(nfa: _Nfa) -> List[FrozenSet[int]]:
+    # The coarsest partition of the alphabet that every transition respects.
+    classes = [_ALPHABET]
+    for moves in nfa.moves:
+        for (chars, _) in moves:
+            classes = [part for cls in classes for part in (cls & chars, cls - chars) if part]
+    return classes
+
+
+def _cat(*nodes: _Node) -> _Node:
+    parts: List[_Node] = []
+    for node in nodes:
+        parts.extend(node[1] if node[0] == 'cat' else [node])
+    return parts[0] if len(parts) == 1 else ('cat', parts)
+
+
+def _alt(left: Optional[_Node], right: _Node) -> _Node:
+    if left is None:
+        return right
+    if left[0] == 'chars' and right[0] == 'chars':
+        return ('chars', left[1] | right[1])
+    return ('alt', (left[1] if left[0] == 'alt' else [left]) + (right[1] if right[0] == 'alt' else [right]))
+
+
+class _Dfa(NamedTuple):
+    # The characters leading from each state to each of its successors
+    # (state 0 is the start state):
+    moves: List[Dict[int, FrozenSet[int]]]
+    accepting: List[bool]
+
+
+def _determinize(language: _Node) -> Optional[_Dfa]:
+    '''
+    Builds a complete DFA for the language, or returns None when it would be
+    too large.
+    '''
+    nfa = _Nfa()
+    try:
+        start = nfa.new_state()
+        final = nfa.build(language, start)
+    except _UnsupportedRegex:
+        return None
+    minterms = _minterms(nfa)
+    # Subset construction; the empty set of NFA states is the dead state:
+    initial = nfa.closure([start])
+    dfa_states = {initial: 0}
+    dfa_moves: List[Dict[int, FrozenSet[int]]] = []
+    pending = [initial]
+    while pending:
+        current = pending.pop(0)
+        moves: Dict[int, FrozenSet[int]] = {}
+        for minterm in minterms:
+            ch = min(minterm)
+            target = nfa.closure(dst for state in sorted(current)
+                                 for (chars, dst) in nfa.moves[state] if ch in chars)
+            if target not in dfa_states:
+                if len(dfa_states) >= _MAX_AUTOMATON_STATES:
+                    return None
+                dfa_states[target] = len(dfa_states)
+                pending.append(target)
+            target_idx = dfa_states[target]
+            moves[target_idx] = moves.get(target_idx, frozenset()) | minterm
+        dfa_moves.append(moves)
+    return _Dfa(dfa_moves, [final in subset for subset in dfa_states])
+
+
+@functools.lru_cache()
+def _automaton(pattern: str, flags: int, method_name: str) -> Optional[_Dfa]:
+    language = _language(pattern, flags, method_name)
+    return None if language is None else _determinize(language)
+
+
+def _complement(dfa: _Dfa) -> _Node:
+    '''
+    Describes the strings that the DFA rejects.
+    '''
+    # Eliminate states from the (complemented) DFA until a single expression
+    # labels the edge between new start and accept states:
+    num_states = len(dfa.moves)
+    new_start, new_accept = num_states, num_states + 1
+    edges: Dict[Tuple[int, int], _Node] = {(new_start, 0): _EPSILON}
+    for (idx, moves) in enumerate(dfa.moves):
+        for (target_idx, chars) in moves.items():
+            edges[(idx, target_idx)] = ('chars', chars)
+        if not dfa.accepting[idx]:
+            edges[(idx, new_accept)] = _EPSILON
+    remaining = list(range(num_states))
+    while remaining:
+        def cost(state: int) -> int:
+            return (sum(1 for (_, dst) in edges if dst == state) *
+                    sum(1 for (src, _) in edges if src == state))
+        state = min(remaining, key=cost)
+        remaining.remove(state)
+        loop = edges.pop((state, state), None)
+        incoming = [(src, edges.pop((src, dst))) for (src, dst) in list(edges) if dst == state]
+        outgoing = [(dst, edges.pop((src, dst))) for (src, dst) in list(edges) if src == state]
+        for (src, into) in incoming:
+            for (dst, out_of) in outgoing:
+                path = _cat(into, out_of) if loop is None else _cat(into, ('repeat', loop, 0, None), out_of)
+                edges[(src, dst)] = _alt(edges.get((src, dst)), path)
+    return edges.get((new_start, new_accept), _NOTHING)
+
+
+def _example_char(chars: FrozenSet[int]) -> int:
+    # (prefer letters and digits, which make for readable counterexamples)
+    return min(chars, key=lambda c: (not (c < 128 and chr(c).isalnum()), c))
+
+
+def _examples(dfa: _Dfa, accepted: bool, count: int) -> List[str]:
+    '''
+    Finds up to `count` of the shortest strings that the DFA accepts (or rejects).
+    '''
+    found: List[str] = []
+    pending = [(0, '')]
+    for _ in range(_MAX_AUTOMATON_STATES):
+        if not pending or len(found) >= count:
+            break
+        (state, prefix) = pending.pop(0)
+        if dfa.accepting[state] == accepted:
+            found.append(prefix)
+        for (target, chars) in dfa.moves[state].items():
+            pending.append((target, prefix + chr(_example_char(chars))))
+    return found
+
+
+@functools.lru_cache()
+def smt_regex(pattern: str, flags: int, method_name: str) -> Optional[z3.ReRef]:
+    '''
+    Describes the strings that the `re` method succeeds on, as a z3 regular
+    expression. Returns None when the pattern uses unsupported features.
+
+    >>> smt_regex('a+', 0, 'fullmatch')
+    Plus(Re("a"))
+    >>> smt_regex('(a)\\\\1', 0, 'fullmatch') is None
+    True
+    '''
+    language = _language(pattern, flags, method_name)
+    return None if language is None else _to_smt(language)
+
+
+@functools.lru_cache()
+def smt_regex_complement(pattern: str, flags: int, method_name: str) -> Optional[z3.ReRef]:
+    '''
+    Like smt_regex(), but for the strings the method fails on.
+
+    z3 is far better at deciding membership than non-membership, so
+    we complement the expression ourselves when we can.
+    '''
+    dfa = _automaton(pattern, flags, method_name)
+    return None if dfa is None else _to_smt(_complement(dfa))
+
+
+@functools.lru_cache()
+def regex_examples(pattern: str, flags: int, method_name: str) -> List[str]:
+    '''
+    Lists a few short strings that the `re` method succeeds on, followed by a
+    few that it fails on.
+
+    >>> regex_examples('[a-c]+=', 0, 'fullmatch')
+    ['a=', 'aa=', '', 'a']
+    '''
+    dfa = _automaton(pattern, flags, method_name)
+    if dfa is None:
+        return []
+    return _examples(dfa, True, 2) + _examples(dfa, False, 2)
+
+
+class SymbolicMatch(EmulatedValue):
+    '''
+    A successful match of a concrete pattern against a symbolic string.
+
+    Producing a match does not realize the string. Only the extent of a
+    fullmatch is known symbolically, though; other details (groups, for
+    instance) come from a real match against the realized string.
+    '''
+    _emulated_type = re.Match
+
+    def __init__(self, method_name: str, pattern: 're.Pattern[str]', string: SmtStr):
+        self._method_name = method_name
+        self.re = pattern
+        self.string = string
+        self.pos = 0
+        self.endpos = len(string)
+        self._match: Optional['re.Match[str]'] = None
+
+    def _realized(self) -> 're.Match[str]':
+        if self._match is None:
+            self._match = getattr(self.re, self._method_name)(realize(self.string))
+            assert self._match is not None
+        return self._match
+
+    def __getattr__(self, name):
+        # (only for the attributes of real matches; other probes shouldn't realize anything)
+        if name.startswith('_') or not hasattr(re.Match, name):
+            raise AttributeError(name)
+        return getattr(self._realized(), name)
+
+    def __getitem__(self, group):
+        return self.group(group)
+
+    def __repr__(self):
+        return repr(self._realized())
+
+    def group(self, *groups):
+        if self._method_name == 'fullmatch' and groups in ((), (0,)):
+            return self.string
+        return self._realized().group(*groups)
+
+    def start(self, group=0):
+        if self._method_name == 'fullmatch' and group == 0:
+            return 0
+        return self._realized().start(group)
+
+    def end(self, group=0):
+        if self._method_name == 'fullmatch' and group == 0:
+            return self.endpos
+        return self._realized().end(group)
+
+    def span(self, group=0):
+        return (self.start(group), self.end(group))
+
+
+def _make_matcher(method_name: str) -> Callable:
+    original = getattr(re, method_name)
+
+    def matcher(pattern, string, flags=0):
+        if isinstance(string, SmtStr):
+            space = string.statespace
+            pattern = realize(pattern)
+            with space.framework():
+                # (translations are cached; they must not make decisions on the path)
+                compiled = re.compile(pattern, flags)
+                regex, complement, examples = None, None, []
+                if isinstance(compiled.pattern, str):
+                    regex = smt_regex(compiled.pattern, compiled.flags, method_name)
+                    complement = smt_regex_complement(compiled.pattern, compiled.flags, method_name)
+                    examples = regex_examples(compiled.pattern, compiled.flags, method_name)
+            if regex is not None:
+                # (asking z3 the same question again can be very slow; reuse the answer)
+                memo_key = ('re', method_name, compiled, string.var.get_id())
+                matched = space.memo.get(memo_key)
+                if matched is None:
+                    # Only assert (positive) memberships, whichever way the match goes:
+                    matched = z3.Bool('rematch' + space.uniq())
+                    space.add(z3.Implies(matched, z3.InRe(string.var, regex)))
+                    space.add(z3.Implies(z3.Not(matched), z3.Not(z3.InRe(string.var, regex))
+                                         if complement is None else
+                                         z3.InRe(string.var, complement)))
+                    space.memo[memo_key] = matched
+                    # Searching for strings in (or out of) a regular language can
+                    # be slow; concrete examples make models much easier to find:
+                    space.hint(*[string.var == smt_str_value(example) for example in examples])
+                if space.smt_fork(matched):
+                    return SymbolicMatch(method_name, compiled, string)
+                return None
+            string = realize(string)
+        return original(pattern, string, flags)
+    functools.update_wrapper(matcher, original)
+    return matcher
+
+
+def make_registrations():
+    for method_name in ('match', 'fullmatch', 'search'):
+        register_patch(getattr(re, method_name), _make_matcher(method_name))
@@ -0,0 +1,81 @@
+import re
+import sys
+import unittest
+from typing import *
+
+from crosshair.core_and_libs import *
+from crosshair.test_util import check_ok
+from crosshair.test_util import check_exec_err
+from crosshair.test_util import check_fail
+from crosshair.util import set_debug
+
+
+class RegularExpressionTests(unittest.TestCase):
+    def test_fullmatch_fail(self) -> None:
+        def f(s: str) -> bool:
+            ''' post: not _ '''
+            return bool(re.fullmatch(r'[a-z]+@[a-z]+\.com', s))
+        self.assertEqual(*check_fail(f))
+
+    def test_fullmatch_guard_ok(self) -> None:
+        def f(s: str) -> str:
+            r'''
+            pre: re.fullmatch(r'\d+', s)
+            post: not _.startswith('-')
+            '''
+            return s
+        self.assertEqual(*check_ok(f))
+
+    def test_match_rejects_err(self) -> None:
+        def f(s: str) -> str:
+            ''' post: True '''
+            if not re.match('[A-Z]', s):
+                raise ValueError('must start with an uppercase letter')
+            return s
+        self.assertEqual(*check_exec_err(f, 'ValueError'))
+
+    def test_search_fail(self) -> None:
+        def f(s: str) -> bool:
+            '''
+            pre: len(s) < 6
+            post: not _
+            '''
+            return re.search(r'ab+c$', s) is not None
+        self.assertEqual(*check_fail(f))
+
+    def test_match_isinstance_ok(self) -> None:
+        def f(s: str) -> bool:
+            '''
+            pre: s.startswith('a')
+            post: _
+            '''
+            return isinstance(re.match('a', s), re.Match)
+        self.assertEqual(*check_ok(f))
+
+    def test_fullmatch_group_ok(self) -> None:
+        def f(s: str) -> str:
+            '''
+            pre: re.fullmatch('x*', s)
+            post: _ == s
+            '''
+            match = re.fullmatch('x*', s)
+            assert match is not None
+            return match.group(0)
+        self.assertEqual(*check_ok(f))
+
+    def test_match_group_fail(self) -> None:
+        def f(s: str) -> str:
+            r'''
+            pre: re.match(r'(\w+)=', s)
+            post: _.endswith('=')
+            '''
+            match = re.match(r'(\w+)=', s)
+            assert match is not None
+            return match.group(1)
+        self.assertEqual(*check_fail(f))
+
+
+if __name__ == '__main__':
+    if ('-v' in sys.argv) or ('--verbose' in sys.argv):
+        set_debug(True)
+    unittest.main()
@@ -9,17 +9,35 @@ on the same machine. (left as files in the system's tempdir)
 >>> list(read_states())
 []
 
+A running `watch` also serves its current results over a Unix domain socket
+(where those are available), through a ResultsServer. Clients can query the
+messages for specific files, or subscribe to a stream of changes.
+The protocol is newline-delimited JSON in both directions.
+
+>>> with ResultsServer() as server:
+...   server.update([{'filename': '/a.py', 'line': 3}, {'filename': '/b.py', 'line': 1}])
+...   list(query_results(['/a.py']))
+[{'filename': '/a.py', 'line': 3}]
+
 '''
 
 import glob
+import json
+import os
 import os.path
+import queue
+import socket
+import socketserver
 import tempfile
-from typing import cast, IO, Iterable, Optional, Tuple
+import threading
+from typing import cast, Any, Dict, IO, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 from crosshair.util import debug
 
 _PREFIX = 'CrossHair_'
+_SOCKET_PREFIX = 'CrossHairResults_'
 _ENCODING = 'utf-8'
+_QUERY_TIMEOUT = 5.0  # (seconds to wait on a results server before giving up on it)
 
 class StateUpdater:
     '''
@@ -66,5 +84,227 @@ def read_states() -> Iterable[Tuple[str, str]]:
             continue
 
 
+def unix_sockets_available() -> bool:
+    return hasattr(socket, 'AF_UNIX')
+
+
+MessageJson = Mapping[str, Any]  # (as produced by AnalysisMessage.toJSON())
+_MessageKey = Tuple[str, int]
+
+
+def _message_key(message: MessageJson) -> _MessageKey:
+    return (message['filename'], message['line'])
+
+
+def _send(wfile: IO[bytes], obj: object) -> None:
+    wfile.write(json.dumps(obj).encode(_ENCODING) + b'\n')
+    wfile.flush()
+
+
+class _ResultsRequestHandler(socketserver.StreamRequestHandler):
+    server: '_ResultsSocketServer'
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode(_ENCODING))
+            except ValueError:
+                _send(self.wfile, {'error': 'unable to parse request'})
+                continue
+            kind = request.get('request')
+            if kind == 'messages':
+                _send(self.wfile, {'messages': self.server.results.messages_for(
+                    request.get('files', ()))})
+            elif kind == 'subscribe':
+                self.stream_events()
+                return
+            else:
+                _send(self.wfile, {'error': f'unknown request: {kind!r}'})
+
+    def stream_events(self) -> None:
+        events = self.server.results.subscribe()
+        try:
+            while True:
+                event = events.get()
+                if event is None:  # (the server is shutting down)
+                    return
+                _send(self.wfile, event)
+        except OSError:
+            debug('Results subscriber disconnected')
+        finally:
+            self.server.results.unsubscribe(events)
+
+
+class _ResultsSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    results: 'ResultsServer'
+
+
+class ResultsServer:
+    '''
+    Holds the latest analysis messages (at most one per file and line), and
+    serves them to other processes.
+
+    Requests:
+      {"request": "messages", "files": [...]} is answered with
+      {"messages": [...]}, holding the messages for just those files.
+      {"request": "subscribe"} is answered with an "add" event for every
+      current message, then a "ready" event, and then "add" and "remove"
+      events as messages change, until the connection closes. Events look like
+      {"event": "add", "message": {...}}.
+
+    Where Unix domain sockets are not available, full snapshots of the
+    messages are left in state files instead. (see StateUpdater)
+    '''
+    socket_path: Optional[str] = None
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._messages: Dict[str, Dict[int, MessageJson]] = {}  # filename -> line -> message
+        self._subscribers: List[queue.Queue] = []
+        self._server: Optional[_ResultsSocketServer] = None
+        self._fallback: Optional[StateUpdater] = None
+        if not unix_sockets_available():
+            self._fallback = StateUpdater()
+            return
+        socket_path = os.path.join(tempfile.gettempdir(),
+                                   f'{_SOCKET_PREFIX}{os.getpid()}.sock')
+        if os.path.exists(socket_path):  # (left over from a dead process with our pid)
+            os.unlink(socket_path)
+        server = _ResultsSocketServer(socket_path, _ResultsRequestHandler)
+        server.results = self
+        self._server = server
+        self.socket_path = socket_path
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def update(self, messages: Iterable[MessageJson]) -> None:
+        ''' Replaces the current messages, notifying subscribers of the differences. '''
+        new_messages = {_message_key(m): m for m in messages}
+        if self._fallback is not None:
+            self._fallback.update(json.dumps({
+                'version': 1, 'messages': list(new_messages.values())}))
+            return
+        with self._lock:
+            events = []
+            for filename, by_line in self._messages.items():
+                for line, message in by_line.items():
+                    new_message = new_messages.get((filename, line))
+                    if new_message != message:
+                        events.append({'event': 'remove', 'message': message})
+            updated: Dict[str, Dict[int, MessageJson]] = {}
+            for (filename, line), message in new_messages.items():
+                updated.setdefault(filename, {})[line] = message
+                if self._messages.get(filename, {}).get(line) != message:
+                    events.append({'event': 'add', 'message': message})
+            self._messages = updated
+            for subscriber in self._subscribers:
+                for event in events:
+                    subscriber.put(event)
+
+    def messages_for(self, filenames: Iterable[str]) -> List[MessageJson]:
+        with self._lock:
+            return [message for filename in filenames
+                    for message in self._messages.get(filename, {}).values()]
+
+    def subscribe(self) -> queue.Queue:
+        events: queue.Queue = queue.Queue()
+        with self._lock:
+            for by_line in self._messages.values():
+                for message in by_line.values():
+                    events.put({'event': 'add', 'message': message})
+            events.put({'event': 'ready'})
+            self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events: queue.Queue) -> None:
+        with self._lock:
+            if events in self._subscribers:
+                self._subscribers.remove(events)
+
+    def close(self) -> None:
+        if self._fallback is not None:
+            self._fallback.__exit__(None, None, None)
+        server = self._server
+        if server is None:
+            return
+        self._server = None
+        server.shutdown()
+        server.server_close()
+        with self._lock:
+            for subscriber in self._subscribers:
+                subscriber.put(None)
+        try:
+            os.unlink(cast(str, self.socket_path))
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> 'ResultsServer':
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def results_socket_paths() -> List[str]:
+    return glob.glob(os.path.join(tempfile.gettempdir(), _SOCKET_PREFIX + '*.sock'))
+
+
+def _connect(socket_path: str, timeout: Optional[float] = None) -> Optional[socket.socket]:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except ConnectionRefusedError:
+        # Nothing is listening; the server must have died without cleaning up:
+        debug(f'Removing stale results socket "{socket_path}"')
+        sock.close()
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+        return None
+    except OSError as e:
+        debug(f'Unable to connect to "{socket_path}": {e}')
+        sock.close()
+        return None
+    return sock
+
+
+def query_results(filenames: Iterable[str],
+                  timeout: float = _QUERY_TIMEOUT) -> Iterator[MessageJson]:
+    '''
+    Yields the messages for the given (absolute) filenames, from every
+    running results server. Servers that do not answer within the timeout
+    are skipped.
+    '''
+    filenames = list(filenames)
+    if not unix_sockets_available():
+        wanted = set(filenames)
+        for _, content in read_states():
+            for message in json.loads(content)['messages']:
+                if message['filename'] in wanted:
+                    yield message
+        return
+    for socket_path in results_socket_paths():
+        sock = _connect(socket_path, timeout)
+        if sock is None:
+            continue
+        try:
+            with sock, sock.makefile('rwb') as fh:
+                _send(fh, {'request': 'messages', 'files': filenames})
+                response = json.loads(fh.readline().decode(_ENCODING))
+        except socket.timeout:
+            debug(f'No response from "{socket_path}" after {timeout} seconds; skipping it')
+            continue
+        yield from response.get('messages', ())
 
 
+def subscribe_results(socket_path: str) -> Iterator[Mapping[str, Any]]:
+    ''' Yields events from the given results server, until it goes away. '''
+    sock = _connect(socket_path)
+    if sock is None:
+        return
+    with sock, sock.makefile('rwb') as fh:
+        _send(fh, {'request': 'subscribe'})
+        for line in fh:
+            yield json.loads(line.decode(_ENCODING))
@@ -0,0 +1,56 @@
+import os.path
+import socket
+import tempfile
+import unittest
+from typing import cast
+
+from crosshair.localhost_comms import *
+
+
+def message(filename: str, line: int, text: str = 'failed') -> dict:
+    return {'filename': filename, 'line': line, 'message': text}
+
+
+@unittest.skipUnless(unix_sockets_available(), 'requires Unix domain sockets')
+class ResultsServerTest(unittest.TestCase):
+
+    def test_query_by_file(self):
+        with ResultsServer() as server:
+            server.update([message('/a.py', 1), message('/a.py', 5), message('/b.py', 2)])
+            self.assertEqual(list(query_results(['/a.py'])),
+                             [message('/a.py', 1), message('/a.py', 5)])
+            self.assertEqual(list(query_results(['/c.py'])), [])
+            server.update([message('/b.py', 2)])
+            self.assertEqual(list(query_results(['/a.py', '/b.py'])), [message('/b.py', 2)])
+
+    def test_unresponsive_server_is_skipped(self):
+        socket_path = os.path.join(tempfile.gettempdir(), f'CrossHairResults_unresponsive{os.getpid()}.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(socket_path)
+            listener.listen(1)  # (but never accept or answer)
+            with ResultsServer() as server:
+                server.update([message('/a.py', 1)])
+                self.assertEqual(list(query_results(['/a.py'], timeout=0.2)), [message('/a.py', 1)])
+        finally:
+            listener.close()
+            os.unlink(socket_path)
+
+    def test_subscribers_get_changes(self):
+        with ResultsServer() as server:
+            server.update([message('/a.py', 1), message('/a.py', 2)])
+            events = subscribe_results(cast(str, server.socket_path))
+            initial = [next(events) for _ in range(3)]
+            self.assertEqual(initial[-1], {'event': 'ready'})
+            self.assertCountEqual([e['message']['line'] for e in initial[:2]], [1, 2])
+            server.update([message('/a.py', 1), message('/a.py', 2, 'different')])
+            self.assertEqual(next(events), {'event': 'remove', 'message': message('/a.py', 2)})
+            self.assertEqual(next(events), {'event': 'add', 'message': message('/a.py', 2, 'different')})
+            server.update([])
+            self.assertCountEqual([next(events)['message']['line'] for _ in range(2)], [1, 2])
+        self.assertEqual(list(events), [])  # (the stream ends with the server)
+        self.assertFalse(os.path.exists(cast(str, server.socket_path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+'''
+The pieces of the Language Server Protocol that `crosshair lsp` needs:
+JSON-RPC message framing over a pair of byte streams, and conversions
+between our messages and LSP diagnostics.
+
+>>> uri = path_to_uri('/tmp/some file.py')
+>>> uri
+'file:///tmp/some%20file.py'
+>>> uri_to_path(uri)
+'/tmp/some file.py'
+
+'''
+
+import json
+import pathlib
+import queue
+import threading
+import urllib.parse
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+from crosshair.util import debug
+
+_ENCODING = 'utf-8'
+
+# Error codes, from the specification:
+METHOD_NOT_FOUND = -32601
+SERVER_NOT_INITIALIZED = -32002
+
+# Diagnostic severities:
+SEVERITY_ERROR = 1
+
+JsonObject = Dict[str, Any]
+
+
+def path_to_uri(path: str) -> str:
+    return pathlib.Path(path).as_uri()
+
+
+def uri_to_path(uri: str) -> str:
+    parsed = urllib.parse.urlparse(uri)
+    if parsed.scheme != 'file':
+        raise ValueError(f'Unsupported URI: "{uri}"')
+    return urllib.parse.unquote(parsed.path)
+
+
+def make_diagnostic(line: int, column: int, line_length: int, text: str) -> JsonObject:
+    '''
+    Makes a diagnostic covering the rest of the given (1-based) line.
+
+    >>> make_diagnostic(3, 4, 20, 'false when calling f(x=0)')['range']
+    {'start': {'line': 2, 'character': 4}, 'end': {'line': 2, 'character': 20}}
+    '''
+    position = {'line': max(0, line - 1), 'character': column}
+    end = {'line': position['line'], 'character': max(column, line_length)}
+    return {'range': {'start': position, 'end': end},
+            'severity': SEVERITY_ERROR,
+            'source': 'crosshair',
+            'message': text}
+
+
+def read_message(stream: BinaryIO) -> Optional[JsonObject]:
+    '''
+    Reads one framed message, returning None at the end of the stream.
+
+    >>> import io
+    >>> body = b'{"method": "exit"}'
+    >>> read_message(io.BytesIO(b'Content-Length: %d\\r\\n\\r\\n%s' % (len(body), body)))
+    {'method': 'exit'}
+    '''
+    content_length = None
+    while True:
+        header = stream.readline()
+        if not header:
+            return None
+        header = header.strip()
+        if not header:
+            break
+        name, _, value = header.decode('ascii').partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value)
+    if content_length is None:
+        raise ValueError('Message is missing a Content-Length header')
+    body = b''
+    while len(body) < content_length:  # (unbuffered streams may return less)
+        chunk = stream.read(content_length - len(body))
+        if not chunk:
+            return None
+        body += chunk
+    return json.loads(body.decode(_ENCODING))
+
+
+def write_message(stream: BinaryIO, message: JsonObject) -> None:
+    body = json.dumps(message).encode(_ENCODING)
+    stream.write(b'Content-Length: %d\r\n\r\n' % len(body))
+    stream.write(body)
+    stream.flush()
+
+
+class LanguageServerConnection:
+    '''
+    Reads client messages on a background thread, so that they can be
+    handled between bits of other work; see `next_message`.
+    '''
+    def __init__(self, instream: BinaryIO, outstream: BinaryIO):
+        self._outstream = outstream
+        self._write_lock = threading.Lock()
+        self._incoming: queue.Queue = queue.Queue()
+        self.closed = False
+        threading.Thread(target=self._read_loop, args=(instream,), daemon=True).start()
+
+    def _read_loop(self, instream: BinaryIO) -> None:
+        try:
+            while True:
+                message = read_message(instream)
+                if message is None:
+                    break
+                self._incoming.put(message)
+        except (OSError, ValueError) as e:
+            debug(f'Unable to read from the language client: {e}')
+        self._incoming.put(None)
+
+    def next_message(self, timeout: float) -> Optional[JsonObject]:
+        '''
+        Waits (up to `timeout` seconds) for a message from the client.
+        Returns None on timeout, and sets `closed` when the client goes away.
+        '''
+        if self.closed:
+            return None
+        try:
+            message = self._incoming.get(timeout=timeout) if timeout > 0 else self._incoming.get_nowait()
+        except queue.Empty:
+            return None
+        if message is None:
+            self.closed = True
+        return message
+
+    def send(self, message: JsonObject) -> None:
+        message = {'jsonrpc': '2.0', **message}
+        with self._write_lock:
+            write_message(self._outstream, message)
+
+    def respond(self, request_id: Union[int, str], result: object) -> None:
+        self.send({'id': request_id, 'result': result})
+
+    def respond_error(self, request_id: Union[int, str], code: int, text: str) -> None:
+        self.send({'id': request_id, 'error': {'code': code, 'message': text}})
+
+    def notify(self, method: str, params: JsonObject) -> None:
+        self.send({'method': method, 'params': params})
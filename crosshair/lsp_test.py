@@ -0,0 +1,41 @@
+import io
+import os
+import unittest
+
+from crosshair.lsp import *
+
+
+def encoded(*messages: JsonObject) -> bytes:
+    out = io.BytesIO()
+    for message in messages:
+        write_message(out, message)
+    return out.getvalue()
+
+
+class ConnectionTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        messages = [{'id': 1, 'method': 'initialize', 'params': {'text': 'héllo'}},
+                    {'method': 'initialized', 'params': {}}]
+        stream = io.BytesIO(encoded(*messages))
+        self.assertEqual([read_message(stream), read_message(stream)], messages)
+        self.assertIsNone(read_message(stream))
+
+    def test_connection(self):
+        read_fd, write_fd = os.pipe()
+        out = io.BytesIO()
+        with os.fdopen(read_fd, 'rb') as instream, os.fdopen(write_fd, 'wb') as client:
+            connection = LanguageServerConnection(instream, out)
+            self.assertIsNone(connection.next_message(timeout=0.0))
+            client.write(encoded({'id': 7, 'method': 'shutdown'}))
+            client.flush()
+            self.assertEqual(connection.next_message(timeout=5.0), {'id': 7, 'method': 'shutdown'})
+            connection.respond(7, None)
+        self.assertIsNone(connection.next_message(timeout=5.0))
+        self.assertTrue(connection.closed)
+        self.assertEqual(read_message(io.BytesIO(out.getvalue())),
+                         {'jsonrpc': '2.0', 'id': 7, 'result': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,16 @@
 import argparse
 import collections
+import contextlib
 import dataclasses
 import enum
 import heapq
 import importlib
 import importlib.util
 import inspect
-import json
 import linecache
 import multiprocessing
 import multiprocessing.queues
+import multiprocessing.synchronize
 import os
 import os.path
 import queue
@@ -18,45 +19,110 @@ import signal
 import sys
 import time
 import traceback
+import types
 from typing import *
+from typing import BinaryIO
 
-from crosshair.localhost_comms import StateUpdater, read_states
-from crosshair.core_and_libs import AnalysisMessage, AnalysisOptions, MessageType, analyzable_members, analyze_module, analyze_any, exception_line_in_file
-from crosshair.util import debug, extract_module_from_file, set_debug, CrosshairInternal, load_by_qualname, NotFound, ErrorDuringImport
+from crosshair.change_detection import make_change_detector, mtime, walk_files
+from crosshair.condition_parser import get_class_conditions
+from crosshair.distributed import Coordinator, WorkItem, run_worker
+from crosshair.git_changes import ChangedLines, GitError, changed_lines, changed_outside_methods
+from crosshair.git_changes import class_functions, select_changed
+from crosshair.localhost_comms import ResultsServer, query_results
+from crosshair.lsp import JsonObject, LanguageServerConnection, METHOD_NOT_FOUND, SERVER_NOT_INITIALIZED, make_diagnostic, path_to_uri, uri_to_path
+from crosshair.module_dependencies import DependencyGraph, MODULE_LEVEL, summarize_members
+from crosshair.core_and_libs import AnalysisMessage, AnalysisOptions, MessageCollector, MessageType, analyzable_members, analyze_module, analyze_any, analyze_method, exception_line_in_file
+from crosshair.statespace import SEARCH_STRATEGIES
+from crosshair.util import debug, extract_module_from_file, set_debug, AnalysisCancelled, CrosshairInternal, load_by_qualname, NotFound, ErrorDuringImport
 from crosshair.libimpl import make_registrations
 
 make_registrations()
 
+def positive_int(text: str) -> int:
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1 (got {value})')
+    return value
+
+
+def host_and_port(text: str) -> Tuple[str, int]:
+    '''
+    >>> host_and_port('example.com:8080')
+    ('example.com', 8080)
+    >>> host_and_port(':8080')
+    ('127.0.0.1', 8080)
+    '''
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise argparse.ArgumentTypeError(f'expected HOST:PORT (got "{text}")')
+    return (host or '127.0.0.1', int(port))
+
+
 def command_line_parser() -> argparse.ArgumentParser:
     common = argparse.ArgumentParser(add_help=False)
     common.add_argument('--verbose', '-v', action='store_true')
     common.add_argument('--per_path_timeout', type=float)
     common.add_argument('--per_condition_timeout', type=float)
+    common.add_argument('--search_strategy', choices=sorted(SEARCH_STRATEGIES.keys()),
+                        help='how to choose among unexplored branches')
+    common.add_argument('--per_condition_fuzz_timeout', type=float,
+                        help='seconds of concrete fuzzing to try before symbolic analysis')
+    common.add_argument('--corpus_dir', type=str,
+                        help='directory for saving counterexamples, to re-check them first on later runs')
     parser = argparse.ArgumentParser(description='CrossHair Analysis Tool')
     subparsers = parser.add_subparsers(help='sub-command help', dest='action')
     check_parser = subparsers.add_parser(
         'check', help='Analyze one or more files', parents=[common])
     check_parser.add_argument('files', metavar='F', type=str, nargs='+',
                               help='files or fully qualified modules, classes, or functions')
+    check_parser.add_argument('--jobs', '-j', type=positive_int, default=1,
+                              help='number of worker processes to analyze with')
+    check_parser.add_argument('--changed_since', metavar='REVISION', type=str,
+                              help='only analyze functions that changed (or that call functions that '
+                              'changed) since the given git revision')
     watch_parser = subparsers.add_parser(
         'watch', help='Continuously watch and analyze files', parents=[common])
     watch_parser.add_argument('files', metavar='F', type=str, nargs='+',
                               help='files or directories to analyze')
+    lsp_parser = subparsers.add_parser(
+        'lsp', help='Run a language server (over stdin/stdout) that reports results to an editor',
+        parents=[common])
+    lsp_parser.add_argument('files', metavar='F', type=str, nargs='*',
+                            help='files or directories to analyze (defaults to the workspace)')
+    coordinate_parser = subparsers.add_parser(
+        'coordinate', help='Hand out analysis of files to `worker` processes, possibly on other machines',
+        parents=[common])
+    coordinate_parser.add_argument('files', metavar='F', type=str, nargs='+',
+                                   help='files or directories to analyze')
+    coordinate_parser.add_argument('--listen', type=host_and_port, default=('127.0.0.1', 0),
+                                   help='the HOST:PORT to accept workers on (only this machine, by default)')
+    coordinate_parser.add_argument('--token', type=str, default=os.environ.get('CROSSHAIR_TOKEN'),
+                                   help='the secret that workers must present (defaults to $CROSSHAIR_TOKEN, '
+                                   'or a random one that is printed at startup)')
+    coordinate_parser.add_argument('--root', type=str, default='.',
+                                   help='the directory that workers\' --root corresponds to')
+    coordinate_parser.add_argument('--local_workers', type=int, default=0,
+                                   help='number of worker processes to also run on this machine')
+    worker_parser = subparsers.add_parser(
+        'worker', help='Analyze the work handed out by a `coordinate` process', parents=[common])
+    worker_parser.add_argument('coordinator', type=host_and_port,
+                               help='the HOST:PORT of the coordinator')
+    worker_parser.add_argument('--root', type=str, default='.',
+                               help='the directory holding the code to analyze')
+    worker_parser.add_argument('--token', type=str, default=os.environ.get('CROSSHAIR_TOKEN'),
+                               help='the coordinator\'s secret (defaults to $CROSSHAIR_TOKEN)')
+    worker_parser.add_argument('--processes', type=positive_int, default=max(1, multiprocessing.cpu_count() - 1),
+                               help='number of worker processes to run')
     showresults_parser = subparsers.add_parser(
         'showresults', help='Display results from a currently running `watch` command', parents=[common])
     showresults_parser.add_argument('files', metavar='F', type=str, nargs='+',
                                     help='files or directories to analyze')
     return parser
 
-def mtime(path: str) -> Optional[float]:
-    try:
-        return os.stat(path).st_mtime
-    except FileNotFoundError:
-        return None
-
 def process_level_options(command_line_args: argparse.Namespace) -> AnalysisOptions:
     options = AnalysisOptions()
-    for optname in ('per_path_timeout', 'per_condition_timeout'):
+    for optname in ('per_path_timeout', 'per_condition_timeout', 'search_strategy',
+                    'per_condition_fuzz_timeout', 'corpus_dir'):
         arg_val = getattr(command_line_args, optname)
         if arg_val is not None:
             setattr(options, optname, arg_val)
@@ -68,16 +134,23 @@ class WatchedMember:
     qual_name: str
     content_hash: int
     last_modified: float
+    line: int
+    references: FrozenSet[str]
 
     def get_member(self):
         return load_by_qualname(self.qual_name)
 
-    def __init__(self, qual_name: str, body: str) -> None:
+    def __init__(self, qual_name: str, body: str, line: int = 0,
+                 references: FrozenSet[str] = frozenset()) -> None:
         self.qual_name = qual_name
         self.content_hash = hash(body)
         self.last_modified = time.time()
+        self.line = line
+        self.references = references
 
     def consider_new(self, new_version: 'WatchedMember') -> bool:
+        self.line = new_version.line
+        self.references = new_version.references
         if self.content_hash != new_version.content_hash:
             self.content_hash = new_version.content_hash
             self.last_modified = time.time()
@@ -85,49 +158,90 @@ class WatchedMember:
         return False
 
 
+MemberKey = Tuple[str, str]  # (filename, member name)
 WorkItemInput = Tuple[str, # (filename)
+                      Tuple[Tuple[str, int], ...], # (member names and their generations)
                       AnalysisOptions, float]  # (float is a deadline)
-WorkItemOutput = Tuple[WatchedMember, Counter[str], List[AnalysisMessage]]
+WorkItemOutput = Tuple[str, str, int, Counter[str], List[AnalysisMessage]]
 
 
-def pool_worker_main(item: WorkItemInput, output: multiprocessing.queues.Queue) -> None:
+def background_process_setup() -> None:
+    ''' Prepares a worker process, once, before it analyzes anything. '''
+    # TODO figure out a more reliable way to suppress this. Redirect output?
+    # Ignore ctrl-c in workers to reduce noisy tracebacks (the parent will kill us):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if hasattr(os, 'nice'): # analysis should run at a low priority
+        os.nice(10)
+
+
+def analyze_work_item(item: WorkItemInput, output: Any) -> None:
+    '''
+    Analyzes the given members of one file, putting a WorkItemOutput on
+    `output` for each. Stops early (quietly) if the options say that the work
+    was cancelled.
+    '''
+    filename, members, options, deadline = item
+    _, module_name = extract_module_from_file(filename)
+    try:
+        module = load_by_qualname(module_name)
+    except NotFound:
+        return
+    except ErrorDuringImport as e:
+        orig, frame = e.args
+        message = AnalysisMessage(MessageType.IMPORT_ERR, str(orig), frame.filename, frame.lineno, 0, '')
+        for member_name, generation in members:
+            output.put((filename, member_name, generation, Counter(), [message]))
+        debug(f'Not analyzing "{filename}" because import failed: {e}')
+        return
+    analyzable = dict(analyzable_members(module))
     try:
-        # TODO figure out a more reliable way to suppress this. Redirect output?
-        # Ignore ctrl-c in workers to reduce noisy tracebacks (the parent will kill us):
-        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for member_name, generation in members:
+            if options.is_cancelled is not None and options.is_cancelled():
+                return
+            stats: Counter[str] = Counter()
+            member = analyzable.get(member_name)
+            messages = analyze_any(member, dataclasses.replace(options, stats=stats)) if member else []
+            output.put((filename, member_name, generation, stats, messages))
+    except AnalysisCancelled:
+        debug(f'Stopped analyzing "{filename}" because the work was cancelled')
+
 
-        if hasattr(os, 'nice'): # analysis should run at a low priority
-            os.nice(10)
+def pool_worker_main(item: WorkItemInput, output: multiprocessing.queues.Queue,
+                     cancel_event: Optional[multiprocessing.synchronize.Event] = None) -> None:
+    filename = item[0]
+    try:
+        background_process_setup()
         set_debug(False)
-        filename, options, deadline = item
-        stats: Counter[str] = Counter()
-        options.stats = stats
-        _, module_name = extract_module_from_file(filename)
-        try:
-            module = load_by_qualname(module_name)
-        except NotFound:
-            return
-        except ErrorDuringImport as e:
-            orig, frame = e.args
-            message = AnalysisMessage(MessageType.IMPORT_ERR, str(orig), frame.filename, frame.lineno, 0, '')
-            output.put((filename, stats, [message]))
-            debug(f'Not analyzing "{filename}" because import failed: {e}')
-            return
-        messages = analyze_any(module, options)
-        output.put((filename, stats, messages))
+        if cancel_event is not None:
+            item = (item[0], item[1], dataclasses.replace(item[2], is_cancelled=cancel_event.is_set), item[3])
+        analyze_work_item(item, output)
     except BaseException as e:
         raise CrosshairInternal(
             'Worker failed while analyzing ' + filename) from e
 
 
+def remote_worker_main(address: Tuple[str, int], root: str, token: str) -> None:
+    ''' Runs in a process of its own, analyzing work from a coordinator. '''
+    background_process_setup()
+    if not run_worker(address, root, analyze_work_item, token):
+        sys.exit(1)  # (an item overran; `worker` starts a fresh process for us)
+
+
+# How long a cancelled worker has to notice, before we kill it:
+_CANCELLATION_GRACE_PERIOD = 2.0
+
+
 class Pool:
-    _workers: List[Tuple[multiprocessing.Process, WorkItemInput]]
+    _workers: List[Tuple[multiprocessing.Process, WorkItemInput, multiprocessing.synchronize.Event]]
+    _cancelled: List[Tuple[multiprocessing.Process, float]]  # (worker, time to kill it)
     _work: List[WorkItemInput]
     _results: multiprocessing.queues.Queue
     _max_processes: int
 
     def __init__(self, max_processes: int) -> None:
         self._workers = []
+        self._cancelled = []
         self._work = []
         self._results = multiprocessing.Queue()
         self._max_processes = max_processes
@@ -135,24 +249,54 @@ class Pool:
     def _spawn_workers(self):
         work_list = self._work
         workers = self._workers
-        while work_list and len(self._workers) < self._max_processes:
+        # (cancelled workers that are still winding down count against our limit)
+        while work_list and len(workers) + len(self._cancelled) < self._max_processes:
             work_item = work_list.pop()
+            cancel_event = multiprocessing.Event()
             process = multiprocessing.Process(
-                target=pool_worker_main, args=(work_item, self._results))
-            workers.append((process, work_item))
+                target=pool_worker_main, args=(work_item, self._results, cancel_event))
+            workers.append((process, work_item, cancel_event))
             process.start()
 
+    def _stop_worker(self, worker: multiprocessing.Process) -> None:
+        worker.terminate()
+        worker.join(0.5)
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+
     def _prune_workers(self, curtime):
-        for worker, item in self._workers:
-            (_, _, deadline) = item
+        for worker, item, _ in self._workers:
+            (_, _, _, deadline) = item
             if worker.is_alive() and curtime > deadline:
                 debug('Killing worker over deadline', worker)
-                worker.terminate()
-                time.sleep(0.5)
-                if worker.is_alive():
-                    worker.kill()
-                    worker.join()
-        self._workers = [(w, i) for w, i in self._workers if w.is_alive()]
+                self._stop_worker(worker)
+        for worker, kill_time in self._cancelled:
+            if worker.is_alive() and curtime > kill_time:
+                debug('Killing worker that did not stop when cancelled', worker)
+                self._stop_worker(worker)
+        self._workers = [w for w in self._workers if w[0].is_alive()]
+        self._cancelled = [c for c in self._cancelled if c[0].is_alive()]
+
+    def cancel(self, should_cancel: Callable[[WorkItemInput], bool]) -> List[WorkItemInput]:
+        '''
+        Drops matching queued work, and asks workers running matching work to
+        stop. Workers on unaffected work are left alone.
+        '''
+        cancelled = [item for item in self._work if should_cancel(item)]
+        self._work = [item for item in self._work if not should_cancel(item)]
+        kill_time = time.time() + _CANCELLATION_GRACE_PERIOD
+        remaining = []
+        for worker, item, cancel_event in self._workers:
+            if should_cancel(item) and worker.is_alive():
+                debug('Cancelling worker for invalidated work', item[0])
+                cancel_event.set()
+                self._cancelled.append((worker, kill_time))
+                cancelled.append(item)
+            else:
+                remaining.append((worker, item, cancel_event))
+        self._workers = remaining
+        return cancelled
 
     def terminate(self):
         self._prune_workers(float('+inf'))
@@ -169,6 +313,11 @@ class Pool:
     def submit(self, item: WorkItemInput) -> None:
         self._work.append(item)
 
+    def prioritize(self, should_prioritize: Callable[[WorkItemInput], bool]) -> None:
+        ''' Makes queued work that matches start before other queued work. '''
+        # (work is taken from the end of the list; sorting is stable)
+        self._work.sort(key=should_prioritize)
+
     def has_result(self):
         return not self._results.empty()
 
@@ -203,125 +352,248 @@ def walk_paths(paths: Iterable[str]) -> Iterable[str]:
         if not os.path.exists(name):
             print(f'Watch path "{name}" does not exist.', file=sys.stderr)
             sys.exit(1)
-        if os.path.isdir(name):
-            for (dirpath, dirs, files) in os.walk(name):
-                for curfile in files:
-                    if analyzable_filename(curfile):
-                        yield os.path.join(dirpath, curfile)
-        else:
-            yield name
+        yield from walk_files([name], analyzable_filename)
+
+_INITIAL_CONDITION_TIMEOUT = 0.5
+
 
 class Watcher:
     _paths: Set[str]
     _pool: Pool
     _modtimes: Dict[str, float]
     _options: AnalysisOptions
-    _next_file_check: float = 0.0
     _change_flag: bool = False
 
-    def __init__(self, options: AnalysisOptions, files: Iterable[str], state_updater: StateUpdater):
+    def __init__(self, options: AnalysisOptions, files: Iterable[str], results_server: ResultsServer):
         self._paths = set(files)
-        self._state_updater = state_updater
+        self._results_server = results_server
         self._pool = self.startpool()
-        self._modtimes = {}
         self._options = options
-        _ = list(walk_paths(self._paths)) # just to force an exit if we can't find a path
+        self._change_detector = make_change_detector(self._paths)
+        # (walk_paths will also force an exit if we can't find a path)
+        self._modtimes = {os.path.abspath(f): cast(float, mtime(f))
+                          for f in walk_paths(self._paths)}
+        self._dependencies = DependencyGraph()
+        self._members: Dict[str, Dict[str, WatchedMember]] = {}
+        for filename in self._modtimes:
+            self._dependencies.update(filename)
+            self._members[filename] = self.read_members(filename)
+        # Each member's analysis starts with a short condition timeout that
+        # doubles for every pass that completes without changes:
+        self._condition_timeouts: Dict[MemberKey, float] = {}
+        # Results from before a member's last invalidation are discarded:
+        self._generations: Counter[MemberKey] = Counter()
+        self._pending: Set[MemberKey] = set()
+        self._member_messages: Dict[MemberKey, List[AnalysisMessage]] = {}
+        # Files that the user is looking at; these are analyzed first:
+        self._priority_files: Set[str] = set()
 
     def startpool(self) -> Pool:
-        return Pool(multiprocessing.cpu_count() - 1)
-
-    def run_iteration(self,
-                      max_condition_timeout=0.5) -> Iterator[
-                          Tuple[Counter[str], List[AnalysisMessage]]]:
-        debug(f'starting pass '
-              f'with a condition timeout of {max_condition_timeout}')
-        debug('Files:', self._modtimes.keys())
-        pool = self._pool
-        for filename in self._modtimes.keys():
-            worker_timeout = max(10.0, max_condition_timeout * 20.0)
+        return Pool(max(1, multiprocessing.cpu_count() - 1))
+
+    def read_members(self, filename: str) -> Dict[str, WatchedMember]:
+        _, module_name = extract_module_from_file(filename)
+        try:
+            with open(filename, encoding='utf-8') as fh:
+                source = fh.read()
+        except FileNotFoundError:
+            return {}
+        try:
+            summaries = summarize_members(source)
+        except (SyntaxError, ValueError):
+            # Let a worker report the problem when it tries to import the module:
+            return {MODULE_LEVEL: WatchedMember(module_name, source)}
+        return {name: WatchedMember(module_name + '.' + name, summary.body,
+                                    summary.line, summary.references)
+                for name, summary in summaries.items()}
+
+    def member_keys(self) -> Iterator[MemberKey]:
+        for filename, members in self._members.items():
+            for name in members:
+                yield (filename, name)
+
+    def submit(self, keys: Iterable[MemberKey]) -> None:
+        ''' Queues work for the given members, grouped by file and condition timeout. '''
+        groups: Dict[Tuple[str, float], List[Tuple[str, int]]] = collections.defaultdict(list)
+        for key in keys:
+            condition_timeout = self._condition_timeouts.get(key, _INITIAL_CONDITION_TIMEOUT)
+            groups[(key[0], condition_timeout)].append((key[1], self._generations[key]))
+            self._pending.add(key)
+        for (filename, condition_timeout), members in groups.items():
+            worker_timeout = max(10.0, condition_timeout * 20.0)
             options = dataclasses.replace(
-                self._options, per_condition_timeout=max_condition_timeout)
-            pool.submit((filename, options, time.time() + worker_timeout))
+                self._options, per_condition_timeout=condition_timeout)
+            self._pool.submit((filename, tuple(members), options, time.time() + worker_timeout))
+        if self._priority_files:
+            self._pool.prioritize(lambda item: item[0] in self._priority_files)
 
+    def prioritize(self, filenames: Iterable[str]) -> None:
+        ''' Sets the files whose analysis should come before everything else. '''
+        self._priority_files = {os.path.abspath(f) for f in filenames}
+        self._pool.prioritize(lambda item: item[0] in self._priority_files)
+
+    def _update_members(self, filename: str) -> Set[str]:
+        ''' Re-reads the members of a file, returning the names of those that changed. '''
+        old_members = self._members.pop(filename, {})
+        new_members = self.read_members(filename) if filename in self._modtimes else {}
+        changed = set(old_members.keys()) ^ set(new_members.keys())
+        for name, new_member in new_members.items():
+            old_member = old_members.get(name)
+            if old_member is None:
+                continue
+            line_delta = new_member.line - old_member.line
+            if old_member.consider_new(new_member):
+                changed.add(name)
+            elif line_delta:
+                # The member just moved; keep its results, but at the new location:
+                key = (filename, name)
+                self._member_messages[key] = [
+                    dataclasses.replace(m, line=m.line + line_delta)
+                    if os.path.abspath(m.filename) == filename else m
+                    for m in self._member_messages.get(key, ())]
+            new_members[name] = old_member
+        if new_members:
+            self._members[filename] = new_members
+        return changed
+
+    def invalidate(self, changed_files: Set[str]) -> Set[MemberKey]:
+        '''
+        Cancels and re-queues analysis for the members that changed, and the
+        members that (transitively) reference them. Returns the affected members.
+        '''
+        affected: Set[MemberKey] = set()
+        # Names that changed in each file, or None if everything should be considered changed:
+        worklist: List[Tuple[str, Optional[Set[str]]]] = []
+        for filename in changed_files:
+            self._dependencies.update(filename)
+            changed_names = self._update_members(filename)
+            affected.update((filename, name) for name in changed_names)
+            worklist.append((filename, None if MODULE_LEVEL in changed_names else changed_names))
+        fully_affected: Set[str] = set()
+        while worklist:
+            filename, names = worklist.pop()
+            for target in {filename} | self._dependencies.importers(filename):
+                if target in fully_affected:
+                    continue
+                if names is None:
+                    fully_affected.add(target)
+                newly_affected = {
+                    name for name, member in self._members.get(target, {}).items()
+                    if (target, name) not in affected and
+                    (names is None or not names.isdisjoint(member.references))}
+                if newly_affected or names is None:
+                    affected.update((target, name) for name in newly_affected)
+                    worklist.append((target, None if names is None else newly_affected))
+        debug('Invalidating', len(affected), 'members:', affected)
+
+        cancelled = self._pool.cancel(
+            lambda item: any((item[0], name) in affected for name, _ in item[1]))
+        interrupted = {(filename, name) for filename, members, _, _ in cancelled
+                       for name, _ in members}
+        for key in affected:
+            self._generations[key] += 1
+            self._condition_timeouts.pop(key, None)
+            self._member_messages.pop(key, None)
+            self._pending.discard(key)
+        existing = set(self.member_keys())
+        self.submit(existing & (affected | (interrupted & self._pending)))
+        return affected
+
+    def run_iteration(self) -> Iterator[Tuple[Counter[str], List[AnalysisMessage]]]:
+        '''
+        Yields results until the submitted work is complete, invalidating work
+        as files change.
+        '''
+        pool = self._pool
         pool.garden_workers()
         while pool.is_working():
-            result = pool.get_result(timeout=1.0)
+            result = pool.get_result(timeout=0.1)
             if result is not None:
-                (_, counters, messages) = result
-                yield (counters, messages)
+                (filename, member_name, generation, counters, messages) = result
+                key = (filename, member_name)
+                if generation == self._generations[key]:
+                    self._pending.discard(key)
+                    if self._member_messages.get(key, []) != messages:
+                        self._member_messages[key] = messages
+                        self._change_flag = True
+                    yield (counters, messages)
                 if pool.has_result():
                     continue
-            change_detected = self.check_changed()
-            if change_detected:
+            changed_files = self.check_changed()
+            if changed_files:
                 self._change_flag = True
-                debug('Aborting iteration on change detection')
-                pool.terminate()
-                self._pool = self.startpool()
-                return
+                self.invalidate(changed_files)
+                yield (Counter(), [])
             pool.garden_workers()
         debug('Worker pool tasks complete')
         yield (Counter(), [])
 
     def run_watch_loop(self) -> NoReturn:
-        restart = True
         stats: Counter[str] = Counter()
-        active_messages: Dict[Tuple[str, int], AnalysisMessage]
+        self.show_status(f'Analyzing {len(self._modtimes)} files.')
+        self.submit(self.member_keys())
         while True:
-            if restart:
-                clear_screen()
-                clear_line('-')
-                line = f'  Analyzing {len(self._modtimes)} files.          \r'
-                sys.stdout.write(color(line, AnsiColor.OKBLUE))
-                max_condition_timeout = 0.5
-                restart = False
-                stats = Counter()
-                active_messages = {}
-            else:
-                time.sleep(0.5)
-                max_condition_timeout *= 2
-            for curstats, messages in self.run_iteration(max_condition_timeout):
+            for curstats, messages in self.run_iteration():
                 debug('stats', curstats, messages)
                 stats.update(curstats)
-                if messages_merged(active_messages, messages):
-                    self._state_updater.update(json.dumps({
-                        'version': 1,
-                        'time': time.time(),
-                        'messages': [m.toJSON() for m in active_messages.values()]}))
-                    linecache.checkcache()
-                    clear_screen()
-                    for message in active_messages.values():
-                        lines = long_describe_message(message)
-                        if lines is None:
-                            continue
-                        clear_line('-')
-                        print(lines, end='')
-                    clear_line('-')
-                line = f'  Analyzed {stats["num_paths"]} paths in {len(self._modtimes)} files.          \r'
-                sys.stdout.write(color(line, AnsiColor.OKBLUE))
-            if self._change_flag:
-                self._change_flag = False
-                restart = True
-                line = f'  Restarting analysis over {len(self._modtimes)} files.          \r'
-                sys.stdout.write(color(line, AnsiColor.OKBLUE))
-
-    def check_changed(self) -> bool:
-        if time.time() < self._next_file_check:
-            return False
+                if self._change_flag:
+                    self._change_flag = False
+                    self.show_messages()
+                self.show_status(f'Analyzed {stats["num_paths"]} paths in {len(self._modtimes)} files.')
+            changed_files = self.check_changed(timeout=0.5)
+            if changed_files:
+                affected = self.invalidate(changed_files)
+                self.show_messages()
+                self.show_status(f'Restarting analysis of {len(affected)} functions and classes.')
+            else:
+                keys = list(self.member_keys())
+                for key in keys:
+                    self._condition_timeouts[key] = 2 * self._condition_timeouts.get(
+                        key, _INITIAL_CONDITION_TIMEOUT)
+                self.submit(keys)
+
+    def active_messages(self) -> Dict[Tuple[str, int], AnalysisMessage]:
+        active_messages: Dict[Tuple[str, int], AnalysisMessage] = {}
+        for messages in self._member_messages.values():
+            messages_merged(active_messages, messages)
+        return active_messages
+
+    def show_status(self, line: str) -> None:
+        sys.stdout.write(color(f'  {line}          \r', AnsiColor.OKBLUE))
+
+    def show_messages(self) -> None:
+        active_messages = self.active_messages()
+        self._results_server.update(m.toJSON() for m in active_messages.values())
+        linecache.checkcache()
+        clear_screen()
+        for message in active_messages.values():
+            lines = long_describe_message(message)
+            if lines is None:
+                continue
+            clear_line('-')
+            print(lines, end='')
+        clear_line('-')
+
+    def check_changed(self, timeout: float = 0.0) -> Set[str]:
+        ''' Returns the watched files that were created, modified, or deleted. '''
+        return self.changes_among(self._change_detector.wait_for_changes(timeout))
+
+    def changes_among(self, candidates: Iterable[str]) -> Set[str]:
+        ''' Returns the candidate files that were created, modified, or deleted. '''
         modtimes = self._modtimes
-        changed = False
-        for curfile in walk_paths(self._paths):
+        changed: Set[str] = set()
+        for curfile in candidates:
+            if curfile not in modtimes and not analyzable_filename(os.path.basename(curfile)):
+                continue
             cur_mtime = mtime(curfile)
             if cur_mtime == modtimes.get(curfile):
                 continue
-            changed = True
+            changed.add(curfile)
             if cur_mtime is None:
                 del modtimes[curfile]
             else:
                 modtimes[curfile] = cur_mtime
-        self._next_file_check = time.time() + 1.0
-        if not changed:
-            return False
-        return True
+        return changed
 
 
 def clear_screen():
@@ -366,9 +638,11 @@ def watch(args: argparse.Namespace, options: AnalysisOptions) -> int:
         print('No files or directories given to watch', file=sys.stderr)
         return 1
     try:
-        with StateUpdater() as state_updater:
-            watcher = Watcher(options, args.files, state_updater)
+        with ResultsServer() as results_server:
+            watcher = Watcher(options, args.files, results_server)
             watcher.check_changed()
+            clear_screen()
+            clear_line('-')
             watcher.run_watch_loop()
     except KeyboardInterrupt:
         watcher._pool.terminate()
@@ -377,6 +651,231 @@ def watch(args: argparse.Namespace, options: AnalysisOptions) -> int:
         return 0
 
 
+class LanguageServerWatcher(Watcher):
+    '''
+    Watches on behalf of an editor. Besides polling the filesystem, we hear
+    about saves and open files from the editor, and results are published as
+    diagnostics, one file at a time, as they arrive.
+    '''
+    def __init__(self, options: AnalysisOptions, files: Iterable[str],
+                 results_server: ResultsServer, connection: LanguageServerConnection):
+        Watcher.__init__(self, options, files, results_server)
+        self._connection = connection
+        self._shutdown_requested = False
+        self._open_files: Set[str] = set()
+        self._saved_files: Set[str] = set()
+        self._published: Dict[str, List[JsonObject]] = {}
+
+    def exit_code(self) -> int:
+        return 0 if self._shutdown_requested else 1
+
+    def handle_message(self, message: JsonObject) -> None:
+        method = message.get('method')
+        params = message.get('params') or {}
+        if 'id' in message:
+            if method is None:
+                return  # (a response; we never make requests)
+            if method == 'shutdown':
+                self._shutdown_requested = True
+                self._connection.respond(message['id'], None)
+            else:
+                self._connection.respond_error(
+                    message['id'], METHOD_NOT_FOUND, f'Unsupported method: {method}')
+        elif method == 'exit':
+            sys.exit(self.exit_code())
+        elif method in ('textDocument/didOpen', 'textDocument/didChange',
+                        'textDocument/didSave', 'textDocument/didClose'):
+            try:
+                filename = os.path.abspath(uri_to_path(params['textDocument']['uri']))
+            except (KeyError, ValueError) as e:
+                debug(f'Ignoring {method} notification: {e}')
+                return
+            if method == 'textDocument/didClose':
+                self._open_files.discard(filename)
+            else:
+                self._open_files.add(filename)
+            if method == 'textDocument/didSave':
+                self._saved_files.add(filename)
+            self.prioritize(self._open_files)
+
+    def check_changed(self, timeout: float = 0.0) -> Set[str]:
+        ''' Handles editor messages while waiting; returns early when a file is saved. '''
+        deadline = time.time() + timeout
+        while not self._saved_files:
+            message = self._connection.next_message(max(0.0, deadline - time.time()))
+            if self._connection.closed:
+                sys.exit(self.exit_code())
+            if message is None:
+                break
+            self.handle_message(message)
+        saved, self._saved_files = self._saved_files, set()
+        return self.changes_among(saved) | Watcher.check_changed(self)
+
+    def show_status(self, line: str) -> None:
+        debug(line)  # (editors show diagnostics; there's no status line)
+
+    def show_messages(self) -> None:
+        active_messages = self.active_messages()
+        self._results_server.update(m.toJSON() for m in active_messages.values())
+        linecache.checkcache()
+        diagnostics: Dict[str, List[JsonObject]] = collections.defaultdict(list)
+        for message in active_messages.values():
+            text = message_description(message)
+            if text is None:
+                continue
+            filename = os.path.abspath(message.filename)
+            line_length = len(linecache.getline(filename, message.line).rstrip('\n'))
+            diagnostics[filename].append(
+                make_diagnostic(message.line, message.column, line_length, text))
+        for filename in set(diagnostics.keys()) | set(self._published.keys()):
+            file_diagnostics = diagnostics.get(filename, [])
+            if self._published.get(filename, []) != file_diagnostics:
+                self._connection.notify('textDocument/publishDiagnostics', {
+                    'uri': path_to_uri(filename), 'diagnostics': file_diagnostics})
+        self._published = dict(diagnostics)
+
+
+def wait_for_initialize(connection: LanguageServerConnection, paths: List[str]) -> Optional[List[str]]:
+    '''
+    Handles the initialize request, returning the paths to watch: those given
+    on the command line, or else the workspace folders of the client.
+    Returns None if the client leaves first.
+    '''
+    while True:
+        message = connection.next_message(timeout=1.0)
+        if connection.closed:
+            return None
+        if message is None:
+            continue
+        method = message.get('method')
+        if method == 'exit':
+            return None
+        if 'id' not in message:
+            continue
+        if method != 'initialize':
+            connection.respond_error(message['id'], SERVER_NOT_INITIALIZED,
+                                     'The server has not been initialized')
+            continue
+        params = message.get('params') or {}
+        if not paths:
+            uris = [folder['uri'] for folder in params.get('workspaceFolders') or []]
+            if not uris and params.get('rootUri'):
+                uris = [params['rootUri']]
+            paths = [uri_to_path(uri) for uri in uris]
+        connection.respond(message['id'], {
+            'capabilities': {
+                # (we analyze files as saved; edits only tell us what the user is looking at)
+                'textDocumentSync': {'openClose': True, 'change': 2, 'save': True},
+            },
+            'serverInfo': {'name': 'crosshair'},
+        })
+        return paths
+
+
+def lsp(args: argparse.Namespace, options: AnalysisOptions) -> int:
+    # Avoid fork() because we've already imported the code we're watching:
+    multiprocessing.set_start_method('spawn')
+    # The protocol owns stdout; anything else written to it (by us, by workers,
+    # or by the code under analysis) goes to stderr instead:
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    # (reading unbuffered; a reader thread blocked on a buffered stream can
+    # abort the interpreter at exit)
+    protocol_in = os.fdopen(os.dup(sys.stdin.fileno()), 'rb', buffering=0)
+    connection = LanguageServerConnection(cast(BinaryIO, protocol_in), protocol_out)
+    paths = wait_for_initialize(connection, list(args.files))
+    if paths is None:
+        return 1
+    if not paths:
+        print('No files or directories given to watch', file=sys.stderr)
+        return 1
+    with ResultsServer() as results_server:
+        watcher = LanguageServerWatcher(options, paths, results_server, connection)
+        try:
+            watcher.run_watch_loop()
+        finally:
+            watcher._pool.terminate()
+
+
+def work_items(root: str, paths: Iterable[str]) -> Iterator[WorkItem]:
+    ''' Lists the top-level members of the given files, as work for remote workers. '''
+    for filename in walk_paths(paths):
+        relative = os.path.relpath(os.path.abspath(filename), root)
+        try:
+            with open(filename, encoding='utf-8') as fh:
+                members = [name for name in summarize_members(fh.read()) if name != MODULE_LEVEL]
+        except (SyntaxError, ValueError):
+            members = []
+        # (a worker reports import errors for the module level, when it has no members)
+        for name in members or [MODULE_LEVEL]:
+            yield (relative, name)
+
+
+def coordinate(args: argparse.Namespace, options: AnalysisOptions) -> int:
+    root = os.path.abspath(args.root)
+    items = list(work_items(root, args.files))
+    coordinator = Coordinator(root, items, options, address=args.listen, token=args.token)
+    host, port = coordinator.address
+    print(f'Coordinating {len(items)} work items at {host}:{port}', file=sys.stderr)
+    if args.token is None:
+        print(f'Workers should connect with --token {coordinator.token}', file=sys.stderr)
+    # (start local workers before serving; they are forked, and should not inherit our threads)
+    local_workers = [multiprocessing.Process(target=remote_worker_main,
+                                             args=(coordinator.address, root, coordinator.token))
+                     for _ in range(args.local_workers)]
+    for process in local_workers:
+        process.start()
+    coordinator.start()
+    try:
+        coordinator.wait()
+    finally:
+        coordinator.close()
+        for process in local_workers:
+            process.join(5.0)
+            if process.is_alive():
+                process.terminate()
+    debug('Stats from all workers:', coordinator.stats)
+    any_errors = False
+    for message in coordinator.messages():
+        line = short_describe_message(message)
+        if line is not None:
+            print(line)
+            any_errors = True
+    for filename, member in coordinator.abandoned:
+        print(f'Unable to analyze {member} in {filename}; workers repeatedly failed', file=sys.stderr)
+        any_errors = True
+    return 1 if any_errors else 0
+
+
+def worker(args: argparse.Namespace, options: AnalysisOptions) -> int:
+    '''
+    Runs worker processes until the coordinator runs out of work, replacing
+    any that die (the coordinator reassigns their work).
+    '''
+    if args.token is None:
+        print('A --token is required (the coordinator prints one at startup)', file=sys.stderr)
+        return 2
+
+    def start() -> multiprocessing.Process:
+        process = multiprocessing.Process(target=remote_worker_main,
+                                          args=(args.coordinator, args.root, args.token))
+        process.start()
+        return process
+    processes = [start() for _ in range(args.processes)]
+    while processes:
+        time.sleep(1.0)
+        running = []
+        for process in processes:
+            if process.is_alive():
+                running.append(process)
+            elif process.exitcode != 0:
+                debug('Restarting worker process that exited with', process.exitcode)
+                running.append(start())
+        processes = running
+    return 0
+
+
 def format_src_context(filename: str, lineno: int) -> str:
     amount = 3
     line_numbers = range(max(1, lineno - amount), lineno + amount + 1)
@@ -415,7 +914,8 @@ def long_describe_message(message: AnalysisMessage) -> Optional[str]:
     return f'{tb}\n{intro}\n{context}\n{desc}\n'
 
 
-def short_describe_message(message: AnalysisMessage) -> Optional[str]:
+def message_description(message: AnalysisMessage) -> Optional[str]:
+    ''' Describes a message in one line, or returns None if it isn't worth reporting. '''
     if message.state == MessageType.CANNOT_CONFIRM:
         return None
     elif message.state == MessageType.PRE_UNSAT:
@@ -423,30 +923,126 @@ def short_describe_message(message: AnalysisMessage) -> Optional[str]:
     desc = message.message
     if message.state == MessageType.POST_ERR:
         desc = 'Error while evaluating post condition: ' + desc
+    return desc
+
+
+def short_describe_message(message: AnalysisMessage) -> Optional[str]:
+    desc = message_description(message)
+    if desc is None:
+        return None
     return '{}:{}:{}:{}'.format(message.filename, message.line, 'error', desc)
 
 
 def showresults(args: argparse.Namespace, options: AnalysisOptions) -> int:
-    messages_by_file: Dict[str, List[AnalysisMessage]] = collections.defaultdict(list)
-    states = list(read_states())
-    for fname, content in states:
-        debug('Found watch state file at ', fname)
-        state = json.loads(content)
-        for message in state['messages']:
-            messages_by_file[message['filename']].append(AnalysisMessage.fromJSON(message))
-    debug('Found results for these files: [', ', '.join(messages_by_file.keys()), ']')
-    for name in walk_paths(args.files):
-        name = os.path.abspath(name)
-        debug('Checking file ', name)
-        for message in messages_by_file[name]:
-            desc = short_describe_message(message)
-            debug('Describing ', message)
-            if desc is not None:
-                print(desc)
+    filenames = [os.path.abspath(name) for name in walk_paths(args.files)]
+    debug('Querying results for these files: [', ', '.join(filenames), ']')
+    for message_json in query_results(filenames):
+        message = AnalysisMessage.fromJSON(dict(message_json))
+        desc = short_describe_message(message)
+        debug('Describing ', message)
+        if desc is not None:
+            print(desc)
     return 0
 
+CheckUnit = Tuple[str, Optional[str]]  # (qualified name, and a method name for one method of a class)
+
+
+def check_units(entity: object) -> Iterator[CheckUnit]:
+    '''
+    Splits the analysis of an entity into pieces that can be analyzed
+    independently, in the same order that analyze_any() would analyze them.
+    '''
+    if inspect.ismodule(entity):
+        for _, member in analyzable_members(cast(types.ModuleType, entity)):
+            yield from check_units(member)
+    elif inspect.isclass(entity):
+        cls = cast(type, entity)
+        qual_name = cls.__module__ + '.' + cls.__qualname__
+        for method, conditions in get_class_conditions(cls).methods.items():
+            if conditions.has_any():
+                yield (qual_name, method)
+    else:
+        fn = cast(Callable, entity)
+        yield (fn.__module__ + '.' + fn.__qualname__, None)
+
+
+def entity_functions(entity: object) -> Iterator[Callable]:
+    ''' Yields all of the functions and methods within an entity, with or without contracts. '''
+    if inspect.ismodule(entity):
+        for _, member in analyzable_members(cast(types.ModuleType, entity)):
+            yield from entity_functions(member)
+    elif inspect.isclass(entity):
+        yield from class_functions(cast(type, entity))
+    else:
+        yield cast(Callable, entity)
+
+
+def check_worker_main(item: Tuple[CheckUnit, AnalysisOptions]) -> List[AnalysisMessage]:
+    (qual_name, method_name), options = item
+    entity = load_by_qualname(qual_name)
+    if method_name is None:
+        return analyze_any(entity, options)
+    return analyze_method(cast(type, entity), method_name, options)
+
+
+def load_check_unit(unit: CheckUnit) -> Callable:
+    qual_name, method_name = unit
+    entity = load_by_qualname(qual_name)
+    return entity if method_name is None else getattr(entity, method_name)
+
+
+def analyze_units(units: Sequence[List[CheckUnit]], options: AnalysisOptions,
+                  jobs: int) -> Iterator[List[AnalysisMessage]]:
+    '''
+    Yields the messages for each group of units, in order, as soon as it and
+    all the groups before it are done.
+    '''
+    work = [(unit, options) for group in units for unit in group]
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            pool = stack.enter_context(multiprocessing.Pool(jobs, initializer=worker_initializer))
+            # (imap hands out one unit at a time, and returns results in order)
+            results = pool.imap(check_worker_main, work)
+        else:
+            results = map(check_worker_main, work)
+        for group in units:
+            messages = MessageCollector()
+            for _ in group:
+                messages.extend(next(results))
+            yield messages.get()
+
+
+def analyze_in_parallel(entities: Sequence[object], options: AnalysisOptions,
+                        jobs: int) -> Iterator[List[AnalysisMessage]]:
+    '''
+    Yields the messages for each entity, in order, as soon as it and all the
+    entities before it are done.
+    '''
+    return analyze_units([list(check_units(entity)) for entity in entities], options, jobs)
+
+
+def changed_units(entities: Sequence[object], changed: ChangedLines) -> List[List[CheckUnit]]:
+    '''
+    Splits each entity into units, keeping only the units whose source
+    changed (or that call something that changed).
+    '''
+    units = [list(check_units(entity)) for entity in entities]
+    candidates = {unit: load_check_unit(unit) for group in units for unit in group}
+    candidate_ids = {id(getattr(fn, '__func__', fn)) for fn in candidates.values()}
+    helpers = [fn for entity in entities for fn in entity_functions(entity)
+               if id(fn) not in candidate_ids]
+    selected = select_changed(candidates, changed, helpers)
+    # (class invariants apply to every method of the class)
+    for qual_name in {qual_name for (qual_name, method_name) in candidates if method_name is not None}:
+        if changed_outside_methods(cast(type, load_by_qualname(qual_name)), changed):
+            selected.update(unit for unit in candidates if unit[0] == qual_name)
+    debug('Analyzing', len(selected), 'of', len(candidates), 'functions, based on changes')
+    return [[unit for unit in group if unit in selected] for group in units]
+
+
 def check(args: argparse.Namespace, options: AnalysisOptions) -> int:
     any_errors = False
+    entities: List[object] = []
     for name in args.files:
         entity: object
         if name.endswith('.py'):
@@ -459,7 +1055,20 @@ def check(args: argparse.Namespace, options: AnalysisOptions) -> int:
         else:
             entity = load_by_qualname(name)
         debug('Check ', getattr(entity, '__name__', str(entity)))
-        for message in analyze_any(entity, options):
+        entities.append(entity)
+    if args.changed_since is not None:
+        try:
+            changed = changed_lines(args.changed_since)
+        except GitError as e:
+            print(f'Unable to find changes since "{args.changed_since}": {e}', file=sys.stderr)
+            return 2
+        results = analyze_units(changed_units(entities, changed), options, args.jobs)
+    elif args.jobs > 1:
+        results = analyze_in_parallel(entities, options, args.jobs)
+    else:
+        results = (analyze_any(entity, options) for entity in entities)
+    for messages in results:
+        for message in messages:
             line = short_describe_message(message)
             if line is not None:
                 print(line)
@@ -481,6 +1090,12 @@ def main() -> None:
         exitcode = showresults(args, options)
     elif args.action == 'watch':
         exitcode = watch(args, options)
+    elif args.action == 'lsp':
+        exitcode = lsp(args, options)
+    elif args.action == 'coordinate':
+        exitcode = coordinate(args, options)
+    elif args.action == 'worker':
+        exitcode = worker(args, options)
     else:
         print(f'Unknown action: "{args.action}"', file=sys.stderr)
         exitcode = 1
@@ -1,11 +1,209 @@
+import importlib
+import io
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
 import unittest
 from typing import *
 
+from crosshair.localhost_comms import ResultsServer
+from crosshair.lsp import path_to_uri, read_message, write_message
+from crosshair.main import *
+from crosshair.module_dependencies import MODULE_LEVEL
+
+
+def write_file(path: str, content: str) -> None:
+    with open(path, 'w') as fh:
+        fh.write(content)
+
 
 class MainTest(unittest.TestCase):
     def setUp(self):
-        self.root = tempfile.mkdtemp()
+        self.root = os.path.realpath(tempfile.mkdtemp())
 
     def tearDown(self):
         shutil.rmtree(self.root)
 
+    def make_watcher(self, results_server: ResultsServer) -> Watcher:
+        watcher = Watcher(AnalysisOptions(), [self.root], results_server)
+        watcher._pool = Pool(0)  # (never actually start workers)
+        return watcher
+
+    def queued(self, watcher: Watcher) -> Set[Tuple[str, str]]:
+        return {(item[0], name) for item in watcher._pool._work for name, _ in item[1]}
+
+    def test_module_level_change_invalidates_importers(self):
+        paths = {name: os.path.join(self.root, name + '.py')
+                 for name in ('leafmod', 'usermod', 'othermod')}
+        write_file(paths['leafmod'], 'X = 1\ndef f(): pass\n')
+        write_file(paths['usermod'], 'from leafmod import X\ndef g(): pass\n')
+        write_file(paths['othermod'], 'Y = 2\ndef h(): pass\n')
+        with ResultsServer() as results_server:
+            watcher = self.make_watcher(results_server)
+            write_file(paths['leafmod'], 'X = 2\ndef f(): pass\n')
+            affected = watcher.invalidate({paths['leafmod']})
+            self.assertEqual(affected, {(paths['leafmod'], MODULE_LEVEL),
+                                        (paths['leafmod'], 'f'),
+                                        (paths['usermod'], MODULE_LEVEL),
+                                        (paths['usermod'], 'g')})
+            self.assertEqual(self.queued(watcher), affected)
+
+    def test_member_change_invalidates_referencing_members(self):
+        paths = {name: os.path.join(self.root, name + '.py')
+                 for name in ('leafmod', 'usermod')}
+        write_file(paths['leafmod'], ('def f(): return 1\n'
+                                      'def g(): return f()\n'
+                                      'def h(): return 3\n'))
+        write_file(paths['usermod'], ('from leafmod import g as gg\n'
+                                      'def i(): return gg()\n'
+                                      'def j(): return 4\n'))
+        with ResultsServer() as results_server:
+            watcher = self.make_watcher(results_server)
+            write_file(paths['leafmod'], ('def f():\n'
+                                          '    # (comments and formatting do not matter)\n'
+                                          '    return 1\n'
+                                          'def g(): return f()\n'
+                                          'def h(): return 3\n'))
+            self.assertEqual(watcher.invalidate({paths['leafmod']}), set())
+            write_file(paths['leafmod'], ('def f(): return 2\n'
+                                          'def g(): return f()\n'
+                                          'def h(): return 3\n'))
+            affected = watcher.invalidate({paths['leafmod']})
+            self.assertEqual(affected, {(paths['leafmod'], 'f'),
+                                        (paths['leafmod'], 'g'),
+                                        (paths['usermod'], 'i')})
+            self.assertEqual(self.queued(watcher), affected)
+
+    def test_moved_member_keeps_results(self):
+        path = os.path.join(self.root, 'leafmod.py')
+        write_file(path, 'def f(): return 1\ndef h(): return 3\n')
+        with ResultsServer() as results_server:
+            watcher = self.make_watcher(results_server)
+            message = AnalysisMessage(MessageType.POST_FAIL, '', path, 2, 0, '')
+            watcher._member_messages[(path, 'h')] = [message]
+            write_file(path, 'def f():\n    return 1\ndef h(): return 3\n')
+            self.assertEqual(watcher.invalidate({path}), set())
+            self.assertEqual([m.line for m in watcher._member_messages[(path, 'h')]], [3])
+
+
+class LanguageServerWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.path = os.path.join(self.root, 'leafmod.py')
+        write_file(self.path, 'def f(): return 1\ndef g(): return 2\n')
+        read_fd, write_fd = os.pipe()
+        self.instream = os.fdopen(read_fd, 'rb')
+        self.client = os.fdopen(write_fd, 'wb')
+        self.output = io.BytesIO()
+        self.connection = LanguageServerConnection(self.instream, self.output)
+
+    def tearDown(self):
+        self.client.close()
+        shutil.rmtree(self.root)
+
+    def send(self, method: str, **params) -> None:
+        write_message(self.client, {'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    def sent(self) -> List[JsonObject]:
+        stream = io.BytesIO(self.output.getvalue())
+        self.output.seek(0)
+        self.output.truncate()
+        return list(iter(lambda: read_message(stream), None))
+
+    def test_save_is_a_change(self):
+        with ResultsServer() as results_server:
+            watcher = LanguageServerWatcher(AnalysisOptions(), [self.root], results_server, self.connection)
+            watcher._pool = Pool(0)
+            write_file(self.path, 'def f(): return 3\ndef g(): return 2\n')
+            os.utime(self.path, (time.time() + 5, time.time() + 5))
+            self.send('textDocument/didSave', textDocument={'uri': path_to_uri(self.path)})
+            self.assertEqual(watcher.check_changed(timeout=5.0), {self.path})
+            self.assertEqual(watcher._priority_files, {self.path})
+
+    def test_diagnostics_are_published_per_file(self):
+        with ResultsServer() as results_server:
+            watcher = LanguageServerWatcher(AnalysisOptions(), [self.root], results_server, self.connection)
+            message = AnalysisMessage(MessageType.POST_FAIL, 'false when calling f()', self.path, 1, 0, '')
+            watcher._member_messages[(self.path, 'f')] = [message]
+            watcher.show_messages()
+            (notification,) = self.sent()
+            self.assertEqual(notification['method'], 'textDocument/publishDiagnostics')
+            self.assertEqual(notification['params']['uri'], path_to_uri(self.path))
+            self.assertEqual([d['message'] for d in notification['params']['diagnostics']],
+                             ['false when calling f()'])
+            watcher.show_messages()
+            self.assertEqual(self.sent(), [])  # (nothing changed)
+            del watcher._member_messages[(self.path, 'f')]
+            watcher.show_messages()
+            (notification,) = self.sent()
+            self.assertEqual(notification['params']['diagnostics'], [])
+
+
+class PoolTest(unittest.TestCase):
+    def test_cancel_stops_worker_cooperatively(self):
+        root = os.path.realpath(tempfile.mkdtemp())
+        sys.path.insert(0, root)  # (the worker imports the module by name)
+        try:
+            path = os.path.join(root, 'slowmod.py')
+            write_file(path, ('def f(x: int) -> int:\n'
+                              '    \'\'\' post: _ == 0 \'\'\'\n'
+                              '    while x > 0:\n'
+                              '        x -= 1\n'
+                              '    return x\n'))
+            pool = Pool(1)
+            options = AnalysisOptions(per_condition_timeout=60.0)
+            item = (path, (('f', 1),), options, time.time() + 60.0)
+            pool.submit(item)
+            pool.garden_workers()
+            ((worker, _, _),) = pool._workers
+            time.sleep(0.5)
+            self.assertEqual(pool.cancel(lambda i: i[0] == path), [item])
+            self.assertFalse(pool._workers)
+            worker.join(10.0)
+            self.assertEqual(worker.exitcode, 0)  # (it stopped on its own)
+            pool.garden_workers()
+            self.assertFalse(pool.is_working())
+            pool.terminate()
+        finally:
+            sys.path.remove(root)
+            shutil.rmtree(root)
+
+
+class CheckTest(unittest.TestCase):
+    def test_parallel_results_match_sequential_order(self):
+        root = os.path.realpath(tempfile.mkdtemp())
+        sys.path.insert(0, root)
+        try:
+            write_file(os.path.join(root, 'checkmod.py'), (
+                'def f(x: int) -> int:\n'
+                '    \'\'\' post: _ != 5 \'\'\'\n'
+                '    return x\n'
+                'class C:\n'
+                '    def m(self, x: int) -> int:\n'
+                '        \'\'\' post: _ != 7 \'\'\'\n'
+                '        return x\n'
+                '    def n(self, x: int) -> int:\n'
+                '        \'\'\' post: _ != 8 \'\'\'\n'
+                '        return x\n'))
+            module = importlib.import_module('checkmod')
+            # (the order of a class's methods may vary)
+            self.assertCountEqual(list(check_units(module)), [
+                ('checkmod.C', 'm'), ('checkmod.C', 'n'), ('checkmod.f', None)])
+            entities = [module, module.f]
+            sequential = [analyze_any(entity, AnalysisOptions()) for entity in entities]
+            parallel = list(analyze_in_parallel(entities, AnalysisOptions(), 2))
+            self.assertEqual([[m.line for m in messages] for messages in parallel],
+                             [[m.line for m in messages] for messages in sequential])
+            self.assertEqual([[m.line for m in messages] for messages in parallel],
+                             [[2, 6, 9], [2]])
+        finally:
+            sys.path.remove(root)
+            sys.modules.pop('checkmod', None)
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    unittest.main()
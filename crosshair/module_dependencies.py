@@ -0,0 +1,170 @@
+'''
+Tracks which watched files import which modules, and which top-level members
+reference which names, so that a change only invalidates the code that
+(transitively) depends on it.
+
+Since short-circuited calls can only reach functions that a module imports,
+the import graph also covers the functions that analysis may intercept.
+'''
+
+import ast
+from typing import *
+
+from crosshair.util import debug, extract_module_from_file
+
+
+def module_prefixes(module_name: str) -> Iterator[str]:
+    '''
+    Importing a module also imports its parent packages.
+
+    >>> list(module_prefixes('a.b.c'))
+    ['a', 'a.b', 'a.b.c']
+    '''
+    parts = module_name.split('.')
+    for i in range(1, len(parts) + 1):
+        yield '.'.join(parts[:i])
+
+
+def imported_modules(source: str, module_name: str, is_package: bool = False) -> Set[str]:
+    '''
+    Finds the names of the modules that the given source may import.
+    (names imported from a module are included too, in case they are submodules)
+
+    >>> sorted(imported_modules('import os.path\\nfrom . import b\\nfrom .c import d', 'pkg.a'))
+    ['os', 'os.path', 'pkg', 'pkg.b', 'pkg.c', 'pkg.c.d']
+    '''
+    tree = ast.parse(source)
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    modules: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                modules.update(module_prefixes(alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base_parts = package.split('.') if package else []
+                if node.level > 1:
+                    base_parts = base_parts[:-(node.level - 1)]
+                base = '.'.join(base_parts + ([node.module] if node.module else []))
+            else:
+                base = node.module or ''
+            if not base:
+                continue
+            modules.update(module_prefixes(base))
+            modules.update(base + '.' + alias.name for alias in node.names
+                           if alias.name != '*')
+    return modules
+
+
+MODULE_LEVEL = '<module>'  # stands for the code outside of any function or class
+
+
+def referenced_names(tree: ast.AST) -> Set[str]:
+    '''
+    Finds the names used in the given syntax tree, and the attributes it accesses.
+
+    >>> sorted(referenced_names(ast.parse('f(x.y)')))
+    ['f', 'x', 'y']
+    '''
+    references: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            references.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            references.add(node.attr)
+    return references
+
+
+class MemberSource(NamedTuple):
+    body: str  # (a normalized form; insensitive to whitespace and comments)
+    references: FrozenSet[str]
+    line: int
+
+
+def summarize_members(source: str) -> Dict[str, MemberSource]:
+    '''
+    Summarizes each top-level function and class in the source, plus the
+    remaining module-level code (under the MODULE_LEVEL key).
+    References include names used in the member, and attributes it accesses.
+    References to imported aliases are reported under their original names.
+
+    >>> members = summarize_members('from m import f as g\\n'
+    ...                             'def a(x):  # comment\\n'
+    ...                             '    return g(x) + x.y\\n'
+    ...                             'class B: pass\\n')
+    >>> sorted(members.keys())
+    ['<module>', 'B', 'a']
+    >>> sorted(members['a'].references)
+    ['f', 'g', 'x', 'y']
+    >>> members['B'].line
+    4
+    '''
+    tree = ast.parse(source)
+    aliases: Dict[str, str] = {}
+    module_level: List[ast.stmt] = []
+    definitions: List[Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            definitions.append(node)
+            continue
+        module_level.append(node)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.asname:
+                    aliases[alias.asname] = alias.name.rpartition('.')[2]
+    members: Dict[str, MemberSource] = {}
+    for definition in definitions:
+        references = referenced_names(definition)
+        references.update([aliases[r] for r in references if r in aliases])
+        members[definition.name] = MemberSource(
+            ast.dump(definition), frozenset(references), definition.lineno)
+    members[MODULE_LEVEL] = MemberSource(
+        ast.dump(ast.Module(body=module_level, type_ignores=[])), frozenset(), 1)
+    return members
+
+
+class DependencyGraph:
+    def __init__(self) -> None:
+        self._imports: Dict[str, Set[str]] = {}  # filename -> imported module names
+        self._module_names: Dict[str, str] = {}  # filename -> module name
+
+    def _module_name(self, filename: str) -> str:
+        module_name = self._module_names.get(filename)
+        if module_name is None:
+            _, module_name = extract_module_from_file(filename)
+            self._module_names[filename] = module_name
+        return module_name
+
+    def update(self, filename: str) -> None:
+        ''' (Re-)reads the imports of a file, or forgets them if the file is gone. '''
+        module_name = self._module_name(filename)
+        try:
+            with open(filename, encoding='utf-8') as fh:
+                source = fh.read()
+            self._imports[filename] = imported_modules(
+                source, module_name, filename.endswith('__init__.py'))
+        except FileNotFoundError:
+            self._imports.pop(filename, None)
+        except (SyntaxError, UnicodeDecodeError, ValueError) as e:
+            debug(f'Unable to read imports from "{filename}": {e}')
+            self._imports[filename] = set()
+
+    def importers(self, filename: str) -> Set[str]:
+        ''' Returns the files that directly import the given file. '''
+        module_name = self._module_name(filename)
+        return {importer for importer, modules in self._imports.items()
+                if importer != filename and module_name in modules}
+
+    def dependents(self, filenames: Iterable[str]) -> Set[str]:
+        '''
+        Returns the given files, plus all the files that (transitively) import them.
+        '''
+        affected = set(filenames)
+        pending = list(affected)
+        while pending:
+            changed_module = self._module_name(pending.pop())
+            for importer, modules in self._imports.items():
+                if importer not in affected and changed_module in modules:
+                    affected.add(importer)
+                    pending.append(importer)
+        return affected
@@ -0,0 +1,63 @@
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from crosshair.module_dependencies import *
+
+
+def write_file(path: str, content: str) -> None:
+    with open(path, 'w') as fh:
+        fh.write(content)
+
+
+class DependencyGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        self.pkg = os.path.join(self.root, 'pkg')
+        os.mkdir(self.pkg)
+        self.files = {
+            '__init__.py': '',
+            'leaf.py': 'X = 1',
+            'mid.py': 'from .leaf import X',
+            'top.py': 'import pkg.mid',
+            'other.py': 'import os',
+        }
+        for name, content in self.files.items():
+            write_file(self.path(name), content)
+        self.graph = DependencyGraph()
+        for name in self.files:
+            self.graph.update(self.path(name))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.pkg, name)
+
+    def test_transitive_dependents(self):
+        self.assertEqual(self.graph.dependents([self.path('leaf.py')]),
+                         {self.path(n) for n in ('leaf.py', 'mid.py', 'top.py')})
+        self.assertEqual(self.graph.dependents([self.path('other.py')]),
+                         {self.path('other.py')})
+
+    def test_package_init_affects_importers(self):
+        self.assertEqual(self.graph.dependents([self.path('__init__.py')]),
+                         {self.path(n) for n in ('__init__.py', 'mid.py', 'top.py')})
+
+    def test_update_after_edit(self):
+        write_file(self.path('mid.py'), 'import os')
+        self.graph.update(self.path('mid.py'))
+        self.assertEqual(self.graph.dependents([self.path('leaf.py')]),
+                         {self.path('leaf.py')})
+
+    def test_syntax_error(self):
+        write_file(self.path('top.py'), 'import (')
+        self.graph.update(self.path('top.py'))
+        self.assertEqual(self.graph.dependents([self.path('mid.py')]),
+                         {self.path('mid.py')})
+
+
+if __name__ == '__main__':
+    unittest.main()
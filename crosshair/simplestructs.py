@@ -1,14 +1,44 @@
 import collections.abc
 import dataclasses
+import enum
 import itertools
-from typing import Mapping, MutableSequence, Sequence, Tuple, TypeVar, Union
+from typing import Dict, Iterable, Mapping, MutableSequence, Optional, Sequence, Tuple, TypeVar, Union
 from crosshair.util import is_iterable
 
 _MISSING = object()
 
 
+_ATOMIC_TYPES = frozenset([int, float, complex, str, bytes, bool, type(None)])
+
+
+def is_concrete_key(key: object) -> bool:
+    '''
+    Decides whether a key can be hashed (and compared) without making any
+    symbolic values concrete.
+
+    >>> is_concrete_key((1, 'one', None))
+    True
+    >>> is_concrete_key([1])
+    False
+    '''
+    typ = type(key)  # (not key.__class__, which proxies may fake)
+    if typ in _ATOMIC_TYPES or issubclass(typ, enum.Enum):
+        return True
+    if typ in (tuple, frozenset):
+        return all(is_concrete_key(item) for item in key)  # type: ignore
+    if dataclasses.is_dataclass(key) and typ.__hash__ is not None:
+        return all(is_concrete_key(getattr(key, field.name))
+                   for field in dataclasses.fields(key))
+    return typ.__hash__ is object.__hash__ and typ.__eq__ is object.__eq__
+
+
 class SimpleDict(collections.abc.MutableMapping):
     '''
+    A mapping for keys that (being symbolic) should not be hashed.
+    The initial contents are searched with ==, but keys that are added later
+    go into a real dict; concrete ones are found there by hash, without
+    comparing them to every entry.
+
     #inv: set(self.keys()) == set(dict(self.items()).keys())
 
     >>> d = SimpleDict([(1, 'one'), (2, 'two')])
@@ -23,36 +53,75 @@ class SimpleDict(collections.abc.MutableMapping):
     >>> del d[1]
     >>> list(d.keys())
     [2, 3]
+    >>> d[1] = 'one again'
+    >>> list(d.items())
+    [(2, 'cat'), (3, 'three'), (1, 'one again')]
     '''
     contents_: MutableSequence
+    added_: Dict[Tuple[bool, object], Tuple[object, object]]
 
     def __init__(self, contents: MutableSequence):
         # TODO: assumes initial data has no duplicate keys. Is that right?
         self.contents_ = contents
+        # Keyed by (True, key) for concrete keys, and by (False, id(key)) otherwise:
+        self.added_ = {}
 
-    def __getitem__(self, key, default=_MISSING):
+    def _find(self, key) -> Optional[Tuple[Union[int, Tuple[bool, object]], object]]:
+        '''
+        Finds the entry for the key, returning its position (an index into
+        contents_, or a key of added_) and its value.
+        '''
+        concrete = is_concrete_key(key)
+        if concrete:
+            entry = self.added_.get((True, key))
+            if entry is not None:
+                return ((True, key), entry[1])
         for (i, (k, v)) in enumerate(self.contents_):
             if k == key:
-                return v
+                return (i, v)
+        for (slot, (k, v)) in self.added_.items():
+            # (concrete keys were already checked by hash)
+            if not (concrete and slot[0]) and k == key:
+                return (slot, v)
+        return None
+
+    def __getitem__(self, key, default=_MISSING):
+        found = self._find(key)
+        if found is not None:
+            return found[1]
         if default is _MISSING:
             raise KeyError(key)
         return default
 
     def __setitem__(self, key, value):
-        for (i, (k, v)) in enumerate(self.contents_):
-            if k == key:
-                self.contents_[i] = (k, value)
-                return
-        self.contents_.append((key, value))
+        found = self._find(key)
+        if found is None:
+            slot = (True, key) if is_concrete_key(key) else (False, id(key))
+            self.added_[slot] = (key, value)
+            return
+        position = found[0]
+        if isinstance(position, int):
+            (k, _) = self.contents_[position]
+            self.contents_[position] = (k, value)
+        else:
+            (k, _) = self.added_[position]
+            self.added_[position] = (k, value)
 
     def __delitem__(self, key):
-        for (i, (k, v)) in enumerate(self.contents_):
-            if k == key:
-                del self.contents_[i]
-                return
+        found = self._find(key)
+        if found is None:
+            raise KeyError(key)
+        position = found[0]
+        if isinstance(position, int):
+            del self.contents_[position]
+        else:
+            del self.added_[position]
+
+    def _entries(self) -> Iterable[Tuple[object, object]]:
+        return itertools.chain(self.contents_, self.added_.values())
 
     def __iter__(self):
-        return (k for (k, v) in self.contents_)
+        return (k for (k, v) in self._entries())
 
     def __eq__(self, other):
         # Make our own __eq__ because the one in abc will hash all of our keys.
@@ -60,7 +129,7 @@ class SimpleDict(collections.abc.MutableMapping):
             return NotImplemented
         if len(self) != len(other):
             return False
-        for (k, self_value) in self.contents_:
+        for (k, self_value) in self._entries():
             found = False
             # We do a slow nested loop search because we don't want to hash the key.
             for (other_key, other_value) in other.items():
@@ -76,13 +145,13 @@ class SimpleDict(collections.abc.MutableMapping):
         return True
 
     def __bool__(self):
-        return (len(self.contents_) > 0).__bool__()
+        return bool(self.added_) or (len(self.contents_) > 0).__bool__()
 
     def __len__(self):
-        return len(self.contents_)
+        return len(self.contents_) + len(self.added_)
 
     def __repr__(self):
-        return str(dict(self.items()))
+        return str(dict(self._entries()))
 
 
 
@@ -128,26 +197,84 @@ class SeqBase:
     def __bool__(self):
         return bool(self.__len__() > 0)
 
+# Concrete pieces of a concatenation are merged together, up to this length:
+_MAX_MERGED_LEN = 32
+
+
+def concatenation_depth(seq: Sequence) -> int:
+    return seq._depth if isinstance(seq, SequenceConcatenation) else 0
+
+
+def _merged(first: Sequence, second: Sequence) -> Optional[list]:
+    if type(first) in (list, tuple) and type(second) in (list, tuple):
+        if len(first) + len(second) <= _MAX_MERGED_LEN:
+            return [*first, *second]
+    return None
+
+
+def concatenate(first: Sequence, second: Sequence) -> Sequence:
+    '''
+    Concatenates two sequences without copying them, in the manner of a rope:
+    small concrete pieces are merged, and the tree of concatenations is kept
+    balanced (by descending into the deeper side), so that indexing stays
+    logarithmic no matter how it was built up.
+
+    >>> rope: Sequence = []
+    >>> for i in range(1000):
+    ...   rope = concatenate(rope, range(i, i + 1))
+    >>> concatenation_depth(rope) <= 20
+    True
+    >>> rope[500], len(rope)
+    (500, 1000)
+    '''
+    merged = _merged(first, second)
+    if merged is not None:
+        return merged
+    first_depth, second_depth = concatenation_depth(first), concatenation_depth(second)
+    if first_depth > second_depth + 1:
+        assert isinstance(first, SequenceConcatenation)
+        merged = _merged(first._second, second)
+        if merged is not None:
+            return SequenceConcatenation(first._first, merged)
+        return concatenate(first._first, concatenate(first._second, second))
+    if second_depth > first_depth + 1:
+        assert isinstance(second, SequenceConcatenation)
+        merged = _merged(first, second._first)
+        if merged is not None:
+            return SequenceConcatenation(merged, second._second)
+        return concatenate(concatenate(first, second._first), second._second)
+    return SequenceConcatenation(first, second)
+
+
 @dataclasses.dataclass(eq=False)
 class SequenceConcatenation(collections.abc.Sequence, SeqBase):
     _first: Sequence
     _second: Sequence
+    _len: int = dataclasses.field(init=False, repr=False)
+    _depth: int = dataclasses.field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Our parts never change, so their lengths can be cached.
+        # (use __len__() directly; len() would force symbolic lengths to be concrete)
+        self._len = self._first.__len__() + self._second.__len__()
+        self._depth = 1 + max(concatenation_depth(self._first), concatenation_depth(self._second))
 
     def __getitem__(self, i:Union[int, slice]):
         '''
         post: _ == (self._first + self._second)[i]
         '''
         first, second = self._first, self._second
-        firstlen, secondlen = len(first), len(second)
-        totallen = firstlen + secondlen
+        firstlen, totallen = first.__len__(), self._len
         if isinstance(i, int):
-            if not (0 <= i < self.__len__()):
-                raise IndexError(i)
             i = positive_index(i, totallen)
+            if not (0 <= i < totallen):
+                raise IndexError(i)
             return first[i] if i < firstlen else second[i - firstlen]
         else:
             start, stop, step = indices(i, totallen)
             bump = 0
+            if step == 1 and start <= 0 and stop >= totallen:
+                return self
             if step > 0:
                 if start >= firstlen:
                     return second[unidirectional_slice2(start - firstlen, stop - firstlen, step)]
@@ -170,7 +297,7 @@ class SequenceConcatenation(collections.abc.Sequence, SeqBase):
                         bump = (-step) - bump
                 first_output = second[unidirectional_slice(start - firstlen, stop - firstlen, step)]
                 second_output = first[unidirectional_slice(firstlen - (1 + bump), stop, step)]
-            return SequenceConcatenation(first_output, second_output)
+            return concatenate(first_output, second_output)
 
     def __contains__(self, item):
         return self._first.__contains__(item) or self._second.__contains__(item)
@@ -179,13 +306,13 @@ class SequenceConcatenation(collections.abc.Sequence, SeqBase):
         return itertools.chain(self._first, self._second)
 
     def __len__(self):
-        return len(self._first) + len(self._second)
+        return self._len
 
     def __add__(self, other):
-        return SequenceConcatenation(self, other)
+        return concatenate(self, other)
 
     def __radd__(self, other):
-        return SequenceConcatenation(other, self)
+        return concatenate(other, self)
 
 
 @dataclasses.dataclass(init=False, eq=False) # type: ignore # (https://github.com/python/mypy/issues/5374)
@@ -229,10 +356,64 @@ class SliceView(collections.abc.Sequence, SeqBase):
             yield self.seq[i]
 
     def __add__(self, other):
-        return SequenceConcatenation(self, other)
+        return concatenate(self, other)
 
     def __radd__(self, other):
-        return SequenceConcatenation(other, self)
+        return concatenate(other, self)
+
+@dataclasses.dataclass(eq=False)
+class ReversedView(collections.abc.Sequence, SeqBase):
+    '''
+    A reversed sequence that does not make (or realize the length of) a copy.
+
+    >>> view = ReversedView([1, 2, 3])
+    >>> list(view), view[0], list(view[1:])
+    ([3, 2, 1], 3, [2, 1])
+    '''
+    seq: Sequence
+
+    def __getitem__(self, key):
+        mylen = self.seq.__len__()
+        if type(key) is slice:
+            start, stop, step = indices(key, mylen)
+            if step == 1:
+                return SliceView(self, start, stop)
+            else:
+                return list(self)[key]
+        else:
+            key = positive_index(key, mylen)
+            if key < 0 or key >= mylen:
+                raise IndexError(key)
+            return self.seq[mylen - (key + 1)]
+
+    def __len__(self):
+        return self.seq.__len__()
+
+    def __contains__(self, item):
+        return self.seq.__contains__(item)
+
+    def __iter__(self):
+        seq = self.seq
+        idx = seq.__len__() - 1
+        while idx >= 0:
+            yield seq[idx]
+            idx -= 1
+
+    def __add__(self, other):
+        return concatenate(self, other)
+
+    def __radd__(self, other):
+        return concatenate(other, self)
+
+
+def _unaliased(seq: Sequence) -> Sequence:
+    ''' Returns a sequence with the current contents of `seq`, that will not change. '''
+    if isinstance(seq, ShellMutableSequence):
+        return seq.inner
+    if type(seq) in (tuple, str, range, SequenceConcatenation, SliceView, ReversedView):
+        return seq
+    return list(seq)
+
 
 @dataclasses.dataclass(eq=False)
 class ShellMutableSequence(collections.abc.MutableSequence, SeqBase):
@@ -242,9 +423,21 @@ class ShellMutableSequence(collections.abc.MutableSequence, SeqBase):
     original list as best it can.
     '''
     inner: Sequence
+
+    def __eq__(self, other):
+        inner = self.inner
+        if type(inner) not in (list, tuple):
+            # (the inner sequence may know how to compare itself more efficiently)
+            ret = inner.__eq__(other.inner if isinstance(other, ShellMutableSequence) else other)
+            if ret is not NotImplemented:
+                return ret
+        return SeqBase.__eq__(self, other)
+
+    __hash__ = SeqBase.__hash__
+
     def __setitem__(self, k, v):
         inner = self.inner
-        old_len = len(inner)
+        old_len = inner.__len__()
         if isinstance(k, slice):
             start, stop, step = indices(k, old_len)
             if step != 1:
@@ -254,15 +447,15 @@ class ShellMutableSequence(collections.abc.MutableSequence, SeqBase):
                 self.inner = newinner
                 return
             else:
-                newinner = v
+                newinner = _unaliased(v)
         else:
             k = positive_index(k, old_len)
             start, stop = k, k + 1
             newinner = [v]
         if start != 0:
-            newinner = SequenceConcatenation(inner[:start], newinner)
+            newinner = concatenate(inner[:start], newinner)
         if stop < old_len:
-            newinner = SequenceConcatenation(newinner, inner[stop:])
+            newinner = concatenate(newinner, inner[stop:])
         self.inner = newinner
 
     def __delitem__(self, k):
@@ -272,16 +465,22 @@ class ShellMutableSequence(collections.abc.MutableSequence, SeqBase):
             self.__setitem__(slice(k, k + 1, 1), [])
 
     def __add__(self, other):
-        return ShellMutableSequence(SequenceConcatenation(self, other))
+        return ShellMutableSequence(concatenate(self.inner, _unaliased(other)))
 
     def __radd__(self, other):
-        return ShellMutableSequence(SequenceConcatenation(other, self))
+        return ShellMutableSequence(concatenate(_unaliased(other), self.inner))
+
+    def append(self, item):
+        self.inner = concatenate(self.inner, [item])
 
     def extend(self, other):
-        self.inner = SequenceConcatenation(self.inner, other)
+        self.inner = concatenate(self.inner, _unaliased(other))
 
-    def sort(self):
-        self.inner = sorted(self.inner)
+    def sort(self, key=None, reverse=False):
+        # (comparisons between symbolic values decide the order as we go)
+        newinner = list(self.inner.__iter__())
+        newinner.sort(key=key, reverse=reverse)
+        self.inner = newinner
 
     def __len__(self):
         return self.inner.__len__()
@@ -305,4 +504,5 @@ class ShellMutableSequence(collections.abc.MutableSequence, SeqBase):
         return self.inner.__iter__()
 
     def reverse(self):
-        self.inner = list(reversed(self.inner))
+        inner = self.inner
+        self.inner = inner.seq if isinstance(inner, ReversedView) else ReversedView(inner)
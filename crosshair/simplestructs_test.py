@@ -1,7 +1,23 @@
+import dataclasses
 import unittest
 
 from crosshair.simplestructs import *
 
+
+class UnhashableKey:
+    ''' Stands in for a symbolic key: it cannot be hashed, and counts comparisons. '''
+    comparisons = 0
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        UnhashableKey.comparisons += 1
+        return isinstance(other, UnhashableKey) and self.value == other.value
+
+    __hash__ = None  # type: ignore
+
+
 class SimpleStructTests(unittest.TestCase):
     def test_sequence_concatenation(self) -> None:
         c1 = SequenceConcatenation((11,22,33), (44,55,66))
@@ -36,6 +52,78 @@ class SimpleStructTests(unittest.TestCase):
         shell[1:3] = ['1', '1.5', '2']
         self.assertEqual(shell, ['0', '1', '1.5', '2', '3'])
         self.assertEqual(shell, shell)
+    def test_ShellMutableSequence_mutations(self) -> None:
+        shell = ShellMutableSequence(range(10))
+        concrete = list(range(10))
+        for i in range(100):
+            shell.append(i)
+            concrete.append(i)
+        for seq in (shell, concrete):
+            seq[50] = 'x'
+            seq.insert(3, 'y')
+            del seq[70:80]
+            seq.extend(['z'] * 40)
+        self.assertEqual(list(shell), concrete)
+        self.assertLessEqual(concatenation_depth(shell.inner), 4)
+
+    def test_ShellMutableSequence_does_not_alias(self) -> None:
+        shell = ShellMutableSequence([1, 2])
+        other = [3]
+        shell.extend(other)
+        added = shell + other
+        other.append(4)
+        shell.append(5)
+        self.assertEqual(list(shell), [1, 2, 3, 5])
+        self.assertEqual(list(added), [1, 2, 3, 3])
+
+    def test_ShellMutableSequence_reverse_and_sort(self) -> None:
+        shell = ShellMutableSequence(SequenceConcatenation(range(3), (7, 5)))
+        shell.reverse()
+        self.assertIsInstance(shell.inner, ReversedView)
+        self.assertEqual(list(shell), [5, 7, 2, 1, 0])
+        self.assertEqual(shell[1], 7)
+        shell.reverse()
+        self.assertEqual(list(shell), [0, 1, 2, 7, 5])
+        shell.sort(reverse=True)
+        self.assertEqual(list(shell), [7, 5, 2, 1, 0])
+        shell.sort(key=lambda x: x % 5)
+        self.assertEqual(list(shell), [5, 0, 1, 7, 2])
+
+    def test_SimpleDict_concrete_keys_are_hashed(self) -> None:
+        symbolic = [UnhashableKey(i) for i in range(5)]
+        d = SimpleDict([(k, k.value) for k in symbolic])
+        for i in range(10):
+            d[('concrete', i)] = i
+        UnhashableKey.comparisons = 0
+        self.assertEqual(d[('concrete', 7)], 7)
+        d[('concrete', 3)] = 'three'
+        del d[('concrete', 4)]
+        self.assertEqual(UnhashableKey.comparisons, 0)
+        self.assertEqual(d[symbolic[2]], 2)
+        self.assertEqual(len(d), 14)
+        self.assertEqual(list(d)[:6], symbolic + [('concrete', 0)])
+        with self.assertRaises(KeyError):
+            del d[UnhashableKey(10)]
+
+    def test_SimpleDict_symbolic_key_can_match_concrete_entry(self) -> None:
+        class EqualsOne:
+            def __eq__(self, other):
+                return other == 1
+            __hash__ = None  # type: ignore
+        d = SimpleDict([])
+        d[1] = 'one'
+        d[EqualsOne()] = 'uno'
+        self.assertEqual(dict(d.items()), {1: 'uno'})
+
+    def test_is_concrete_key(self) -> None:
+        @dataclasses.dataclass(frozen=True)
+        class Point:
+            x: object
+            y: object
+        self.assertTrue(is_concrete_key(Point(1, (2, 'a'))))
+        self.assertFalse(is_concrete_key(Point(1, UnhashableKey(2))))
+        self.assertTrue(is_concrete_key(object()))
+
 
 if __name__ == '__main__':
     unittest.main()
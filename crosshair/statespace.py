@@ -1,18 +1,23 @@
 import ast
+import codecs
+import collections
+import contextlib
 import copy
 import enum
 import itertools
 import functools
 import random
+import sys
 import time
 import traceback
+import types
 from dataclasses import dataclass
 from typing import *
 
 import z3  # type: ignore
 
 from crosshair import dynamic_typing
-from crosshair.util import debug, PathTimeout, UnknownSatisfiability, CrosshairInternal, IgnoreAttempt, IdentityWrapper
+from crosshair.util import debug, AnalysisCancelled, PathTimeout, UnknownSatisfiability, CrosshairInternal, IgnoreAttempt, IdentityWrapper
 from crosshair.condition_parser import ConditionExpr
 from crosshair.type_repo import SmtTypeRepository
 
@@ -52,6 +57,7 @@ class AnalysisMessage:
     execution_log: Optional[str] = None
     test_fn: Optional[str] = None
     condition_src: Optional[str] = None
+    counterexample: Optional[str] = None  # the arguments, as a python dict literal
 
     def toJSON(self):
         d = self.__dict__.copy()
@@ -88,7 +94,8 @@ SnapshotRef = NewType('SnapshotRef', int)
 
 def model_value_to_python(value: z3.ExprRef) -> object:
     if z3.is_string_value(value):
-        return value.as_string()
+        # z3 escapes backslashes and non-printable characters:
+        return codecs.decode(value.as_string().encode('latin-1'), 'unicode_escape')
     elif z3.is_real(value):
         return float(value.as_fraction())
     else:
@@ -114,21 +121,230 @@ class WithFrameworkCode:
         self.space.running_framework_code = self.previous
 
 
-class StateSpace:
+_MAX_CACHED_MODELS = 4
+
+
+class SlicingSolver:
+    '''
+    Accumulates constraints, partitioned into independent groups: constraints
+    land in the same group when they (transitively) share an uninterpreted
+    symbol. A check with assumptions is solved on a scratch solver holding only
+    the groups related to those assumptions; unrelated constraints cannot
+    change its satisfiability. (a check without assumptions includes everything)
+
+    Recent models are cached: when one of them already satisfies the related
+    constraints and the assumptions, a check answers "sat" without solving.
+    Hints (see hint()) help to find models that can be reused this way.
+
+    >>> solver = SlicingSolver(model_check_timeout=1.0)
+    >>> a, b, c = z3.Ints('a b c')
+    >>> solver.add(a > 1, b > 2, b < c)
+    >>> solver.related_constraints([c == 3])
+    [b > 2, b < c]
+    >>> solver.check(c == 3)
+    unsat
+    >>> solver.check(a == 3)
+    sat
+    >>> solver.check(a > 2)  # answered by the model found above
+    sat
+    >>> solver.model().evaluate(a)
+    3
+    '''
     def __init__(self, model_check_timeout: float):
-        smt_tactic = z3.TryFor(z3.Tactic('smt'), 1 +
-                               int(model_check_timeout * 1000))
-        self.solver = smt_tactic.solver()
-        self.solver.set(mbqi=True)
+        self._tactic = z3.TryFor(z3.Tactic('smt'), 1 +
+                                 int(model_check_timeout * 1000))
+        self._last_model: Optional[z3.ModelRef] = None
+        # Each cached model is listed with the (indices of) constraints it is
+        # known to satisfy, and the constraints it is known to violate:
+        self._models: List[Tuple[z3.ModelRef, Set[int], Set[int]]] = []
+        self._constraints: List[z3.ExprRef] = []
+        self._ground_constraints: List[int] = []
+        self._groups: Dict[int, List[int]] = {}  # by root symbol
+        self._parent: Dict[int, int] = {}  # union-find over symbol ids
+        self._symbol_memo: Dict[int, FrozenSet[int]] = {}
+        # Memoized expressions are kept alive so that their ids are not reused:
+        self._memo_refs: List[z3.AstRef] = []
+        self._hints: List[z3.ExprRef] = []
+
+    def _make_solver(self) -> z3.Solver:
+        solver = self._tactic.solver()
+        solver.set(mbqi=True)
         # turn off every randomization thing we can think of:
-        self.solver.set('random-seed', 42)
-        self.solver.set('smt.random-seed', 42)
-        #self.solver.set('randomize', False)
+        solver.set('random-seed', 42)
+        solver.set('smt.random-seed', 42)
+        #solver.set('randomize', False)
+        return solver
+
+    def _symbols(self, expr: z3.AstRef) -> FrozenSet[int]:
+        memo = self._symbol_memo
+        stack = [(expr, False)]
+        while stack:
+            node, expanded = stack.pop()
+            node_id = node.get_id()
+            if node_id in memo:
+                continue
+            if z3.is_quantifier(node):
+                children = [node.body()]
+            elif z3.is_app(node):
+                children = node.children()
+            else:  # (a bound variable)
+                children = []
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+                continue
+            symbols: Set[int] = set()
+            if z3.is_app(node) and node.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+                symbols.add(node.decl().get_id())
+            for child in children:
+                symbols.update(memo[child.get_id()])
+            memo[node_id] = frozenset(symbols)
+            self._memo_refs.append(node)
+        return memo[expr.get_id()]
+
+    def _find(self, symbol: int) -> int:
+        parent = self._parent
+        root = symbol
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while symbol != root:
+            parent[symbol], symbol = root, parent[symbol]
+        return root
+
+    def _roots(self, exprs: Iterable[z3.AstRef]) -> Set[int]:
+        return set(self._find(symbol) for expr in exprs for symbol in self._symbols(expr))
+
+    def add(self, *exprs: Union[z3.ExprRef, Sequence[z3.ExprRef]]) -> None:
+        for expr in exprs:
+            if isinstance(expr, (list, tuple)):
+                self.add(*expr)
+                continue
+            index = len(self._constraints)
+            self._constraints.append(expr)
+            roots = self._roots([expr])
+            if not roots:
+                self._ground_constraints.append(index)
+                continue
+            root, *others = roots
+            group = self._groups.setdefault(root, [])
+            for other in others:
+                self._parent[other] = root
+                group.extend(self._groups.pop(other, ()))
+            group.append(index)
+
+    def _related_indices(self, exprs: Iterable[z3.AstRef]) -> List[int]:
+        groups = self._groups
+        related = list(self._ground_constraints)
+        for root in self._roots(exprs):
+            related.extend(groups.get(root, ()))
+        return related
+
+    def related_constraints(self, exprs: Iterable[z3.AstRef]) -> List[z3.ExprRef]:
+        constraints = self._constraints
+        return [constraints[idx] for idx in self._related_indices(exprs)]
+
+    def hint(self, *exprs: z3.ExprRef) -> None:
+        '''
+        Suggests facts that likely hold in some model (concrete values for an
+        expression, say) without asserting them. When a check has to solve,
+        it first tries each related hint as an extra assumption. This helps
+        when the solver struggles to find models on its own; hinted models are
+        cached like any others.
+
+        >>> solver = SlicingSolver(model_check_timeout=1.0)
+        >>> s = z3.String('s')
+        >>> solver.add(z3.Length(s) > 2)
+        >>> solver.hint(s == z3.StringVal('xyz'))
+        >>> solver.check(s != z3.StringVal('abc'))
+        sat
+        >>> solver.model().evaluate(s)
+        "xyz"
+        '''
+        self._hints.extend(exprs)
+
+    def _related_hints(self, assumptions: Sequence[z3.ExprRef],
+                       related_to: Sequence[z3.AstRef]) -> List[z3.ExprRef]:
+        if not (assumptions or related_to):
+            return list(self._hints)
+        roots = self._roots(itertools.chain(assumptions, related_to))
+        return [hint for hint in self._hints if not self._roots([hint]).isdisjoint(roots)]
+
+    def _cached_model(self, indices: Sequence[int],
+                      assumptions: Sequence[z3.ExprRef]) -> Optional[z3.ModelRef]:
+        constraints = self._constraints
+        for model, satisfied, violated in reversed(self._models):
+            if not violated.isdisjoint(indices):
+                continue
+            for idx in indices:
+                if idx in satisfied:
+                    continue
+                if z3.is_true(model.evaluate(constraints[idx], model_completion=True)):
+                    satisfied.add(idx)
+                else:
+                    violated.add(idx)
+                    break
+            else:
+                if all(z3.is_true(model.evaluate(a, model_completion=True))
+                       for a in assumptions):
+                    return model
+        return None
+
+    def check(self, *assumptions: z3.ExprRef,
+              related_to: Sequence[z3.AstRef] = ()) -> z3.CheckSatResult:
+        '''
+        Checks the constraints related to the given assumptions (and
+        `related_to` expressions), or all constraints if there are none.
+        '''
+        if assumptions or related_to:
+            indices = self._related_indices(itertools.chain(assumptions, related_to))
+        else:
+            indices = list(range(len(self._constraints)))
+        model = self._cached_model(indices, assumptions)
+        if model is not None:
+            self._last_model = model
+            return z3.sat
+        solver = self._make_solver()
+        constraints = self._constraints
+        solver.add([constraints[idx] for idx in indices])
+        for hint in self._related_hints(assumptions, related_to):
+            if solver.check(*assumptions, hint) == z3.sat:
+                ret = z3.sat
+                break
+        else:
+            ret = solver.check(*assumptions)
+        if ret == z3.sat:
+            model = solver.model()
+            self._models = self._models[-(_MAX_CACHED_MODELS - 1):]
+            self._models.append((model, set(indices), set()))
+        self._last_model = model
+        return ret
+
+    def model(self) -> z3.ModelRef:
+        if self._last_model is None:
+            raise CrosshairInternal('No model is available from the last check')
+        return self._last_model
+
+    def sexpr(self) -> str:
+        solver = self._make_solver()
+        solver.add(self._constraints)
+        return solver.sexpr()
+
+    def __str__(self) -> str:
+        return str(self._constraints)
+
+
+class StateSpace:
+    def __init__(self, model_check_timeout: float):
+        self.solver = SlicingSolver(model_check_timeout)
         self.choices_made: List[SearchTreeNode] = []
         self.running_framework_code = False
         self.heaps: List[List[Tuple[z3.ExprRef, Type, object]]] = [[]]
         self.next_uniq = 1
         self.type_repo = SmtTypeRepository(self.solver)
+        # Counts of interesting events on this path (see AnalysisOptions.stats):
+        self.stats: Counter[str] = collections.Counter()
+        # Lets library models reuse the symbolic results they've produced on this path:
+        self.memo: Dict[Hashable, object] = {}
 
     def framework(self) -> ContextManager:
         return WithFrameworkCode(self)
@@ -144,17 +360,18 @@ class StateSpace:
         #debug('Committed to ', expr)
         self.solver.add(expr)
 
+    def hint(self, *exprs: z3.ExprRef) -> None:
+        ''' Suggests facts that are likely to hold in some model. (see SlicingSolver.hint) '''
+        self.solver.hint(*exprs)
+
     def check(self, expr: z3.ExprRef) -> z3.CheckSatResult:
         solver = self.solver
-        solver.push()
-        solver.add(expr)
         #debug('CHECK ? ' + str(solver.sexpr()))
-        ret = solver.check()
+        ret = solver.check(expr)
         #debug('CHECK => ' + str(ret))
         if ret not in (z3.sat, z3.unsat):
             debug('Solver cannot decide satisfiability')
             raise UnknownSatisfiability(str(ret) + ': ' + str(solver))
-        solver.pop()
         return ret
 
     def fork_with_confirm_or_else(self, false_probabilty: float) -> bool:
@@ -166,6 +383,19 @@ class StateSpace:
     def choose_possible(self, expr: z3.ExprRef, favor_true=False) -> bool:
         raise NotImplementedError
 
+    def choose_index(self, num_options: int) -> int:
+        '''
+        Chooses one of `num_options` unconstrained alternatives, returning its index.
+        '''
+        raise NotImplementedError
+
+    def choose_among(self, conditions: Sequence[z3.ExprRef]) -> int:
+        '''
+        Chooses one of the conditions that is possible, and commits to it,
+        returning its index.
+        '''
+        raise NotImplementedError
+
     def find_model_value(self, expr: z3.ExprRef) -> object:
         value = self.solver.model().evaluate(expr, model_completion=True)
         return model_value_to_python(value)
@@ -234,6 +464,113 @@ def newrandom():
     return random.Random(1801243388510242075)
 
 
+class SearchStrategy:
+    '''
+    Decides which branch to descend when more than one branch of a decision
+    remains unexhausted. This default strategy chooses randomly.
+    '''
+    def choose_branch(self, node: 'RandomizedBinaryPathNode') -> bool:
+        return node._random.uniform(0.0, 1.0) > node.false_probability()
+
+    def choose_option(self, node: 'NaryChoiceNode', candidates: List[int]) -> int:
+        return node._random.choice(candidates)
+
+    def tracing(self, fn: Callable) -> ContextManager:
+        ''' Wraps the execution of each path. '''
+        return contextlib.nullcontext()
+
+    def path_finished(self, space: 'TrackingStateSpace') -> None:
+        pass
+
+
+class CoverageTracer:
+    '''
+    Records the line-to-line transitions ("arcs") executed within a function
+    (including the code objects nested inside it, like comprehensions).
+    '''
+    def __init__(self, fn: Callable):
+        self.codes: Set[types.CodeType] = set()
+        self.arcs: Set[Tuple[types.CodeType, int, int]] = set()
+        pending = [fn.__code__]
+        while pending:
+            code = pending.pop()
+            self.codes.add(code)
+            pending.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+
+    def _trace_call(self, frame, event, arg):
+        code = frame.f_code
+        if code not in self.codes:
+            return None
+        arcs = self.arcs
+        last_line = 0
+        def trace_line(frame, event, arg):
+            nonlocal last_line
+            if event == 'line':
+                arcs.add((code, last_line, frame.f_lineno))
+                last_line = frame.f_lineno
+            elif event == 'return':
+                arcs.add((code, last_line, 0))
+            return trace_line
+        return trace_line
+
+    def __enter__(self) -> 'CoverageTracer':
+        self._previous_trace = sys.gettrace()
+        sys.settrace(self._trace_call)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        sys.settrace(self._previous_trace)
+
+
+class CoverageGuidedStrategy(SearchStrategy):
+    '''
+    Traces the function under analysis and biases decisions towards branches
+    whose past descents reached code that had not been covered before.
+    Unexplored branches keep their default (random) weighting.
+    '''
+    def __init__(self):
+        self.covered: Set[Tuple[types.CodeType, int, int]] = set()
+        self._tracer: Optional[CoverageTracer] = None
+        # (visits, newly covered arcs) for each (node, branch):
+        self._stats: Dict[Tuple['SearchTreeNode', object], List[int]] = {}
+
+    def _score(self, node: 'SearchTreeNode', branch: object) -> float:
+        visits, discoveries = self._stats.get((node, branch), (0, 0))
+        return (1.0 + discoveries) / (1.0 + visits)
+
+    def choose_branch(self, node: 'RandomizedBinaryPathNode') -> bool:
+        false_probability = node.false_probability()
+        true_weight = (1.0 - false_probability) * self._score(node, True)
+        false_weight = false_probability * self._score(node, False)
+        return node._random.uniform(0.0, true_weight + false_weight) < true_weight
+
+    def choose_option(self, node: 'NaryChoiceNode', candidates: List[int]) -> int:
+        weights = [self._score(node, idx) for idx in candidates]
+        return node._random.choices(candidates, weights)[0]
+
+    def tracing(self, fn: Callable) -> ContextManager:
+        self._tracer = CoverageTracer(fn)
+        return self._tracer
+
+    def path_finished(self, space: 'TrackingStateSpace') -> None:
+        arcs = self._tracer.arcs if self._tracer else set()
+        self._tracer = None
+        num_new = len(arcs - self.covered)
+        self.covered |= arcs
+        if num_new:
+            debug('Path covered', num_new, 'new arcs')
+        for decision in space.decisions():
+            stats = self._stats.setdefault(decision, [0, 0])
+            stats[0] += 1
+            stats[1] += num_new
+
+
+SEARCH_STRATEGIES: Dict[str, Callable[[], SearchStrategy]] = {
+    'random': SearchStrategy,
+    'coverage': CoverageGuidedStrategy,
+}
+
+
 class NodeLike:
     def is_exhausted(self) -> bool:
         return False
@@ -273,6 +610,7 @@ class SearchTreeNode(NodeLike):
     statehash: Optional[str] = None
     result: CallAnalysis = CallAnalysis()
     exhausted: bool = False
+    strategy: SearchStrategy = SearchStrategy()
 
     def choose(self, favor_true=False) -> Tuple[bool, NodeLike]:
         raise NotImplementedError
@@ -290,8 +628,8 @@ class SearchTreeNode(NodeLike):
     def compute_result(self) -> Tuple[CallAnalysis, bool]:
         raise NotImplementedError
 
-def solver_is_sat(solver, *a) -> bool:
-    ret = solver.check(*a)
+def solver_is_sat(solver, *a, **kw) -> bool:
+    ret = solver.check(*a, **kw)
     if ret == z3.unknown:
         raise UnknownSatisfiability
     return ret == z3.sat
@@ -348,7 +686,7 @@ class RandomizedBinaryPathNode(BinaryPathNode):
             if favor_true:
                 choice = True
             else:
-                choice = self._random.uniform(0.0, 1.0) > self.false_probability()
+                choice = self.strategy.choose_branch(self)
         else:
             choice = positive_ok
         return (choice, self.positive if choice else self.negative)
@@ -387,6 +725,58 @@ class ParallelNode(RandomizedBinaryPathNode):
     def false_probability(self) -> float:
         return 1.0 if self.positive.is_exhausted() else self._false_probability
 
+class NaryChoiceNode(SearchTreeNode):
+    '''
+    A single decision among a fixed number of alternatives that are not
+    constrained by the solver (union members, enum values, subtypes, etc).
+    Like WorstResultNode, a refutation in any child is the result for the node.
+    '''
+    children: List[NodeLike]
+    _random: random.Random
+
+    def __init__(self, num_options: int, rand=None):
+        self._random = rand if rand else newrandom()
+        self.children = [NodeStem() for _ in range(num_options)]
+
+    def choose_index(self) -> Tuple[int, NodeLike]:
+        candidates = [idx for (idx, child) in enumerate(self.children)
+                      if not child.is_exhausted()]
+        assert candidates
+        if len(candidates) == 1:
+            idx = candidates[0]
+        else:
+            idx = self.strategy.choose_option(self, candidates)
+        return (idx, self.children[idx])
+
+    def compute_result(self) -> Tuple[CallAnalysis, bool]:
+        self.children = [child.simplify() for child in self.children]
+        exhausted = all(child.is_exhausted() for child in self.children)
+        for child in self.children:
+            if node_has_status(child, VerificationStatus.REFUTED):
+                return (child.get_result(), exhausted)
+        first = self.children[0]
+        result, exhausted = first.get_result(), first.is_exhausted()
+        for child in self.children[1:]:
+            result, exhausted = merge_node_results(result, exhausted, child)
+        return (result, exhausted)
+
+class ConditionChoiceNode(NaryChoiceNode):
+    '''
+    A single decision among conditions, some of which may be impossible.
+    Possibility is checked once, when the node is made; impossible conditions
+    are never chosen.
+    '''
+    def __init__(self, conditions: Sequence[z3.ExprRef], solver: SlicingSolver, rand=None):
+        NaryChoiceNode.__init__(self, len(conditions), rand)
+        possible = [solver_is_sat(solver, condition) for condition in conditions]
+        if not any(possible):
+            debug(' *** Reached impossible code path *** ')
+            debug('Current solver state:\n', str(solver))
+            raise CrosshairInternal('Reached impossible code path')
+        for idx, is_possible in enumerate(possible):
+            if not is_possible:
+                self.children[idx] = SearchLeaf(CallAnalysis())
+
 def merge_node_results(left: CallAnalysis, exhausted: bool, node: NodeLike) -> Tuple[CallAnalysis, bool]:
     '''
     Merges analysis from different branches of code. (combines messages, takes
@@ -412,7 +802,7 @@ def merge_node_results(left: CallAnalysis, exhausted: bool, node: NodeLike) -> T
 
 class WorstResultNode(RandomizedBinaryPathNode):
     forced_path: Optional[bool] = None
-    def __init__(self, rand: random.Random, expr: z3.ExprRef, solver: z3.Solver):
+    def __init__(self, rand: random.Random, expr: z3.ExprRef, solver: SlicingSolver):
         RandomizedBinaryPathNode.__init__(self, rand)
         notexpr = z3.Not(expr)
         could_be_true = solver_is_sat(solver, expr)
@@ -455,9 +845,9 @@ class WorstResultNode(RandomizedBinaryPathNode):
 
 class ModelValueNode(WorstResultNode):
     condition_value: object = None
-    def __init__(self, rand: random.Random, expr: z3.ExprRef, solver: z3.Solver):
+    def __init__(self, rand: random.Random, expr: z3.ExprRef, solver: SlicingSolver):
         if self.condition_value is None:
-            if not solver_is_sat(solver):
+            if not solver_is_sat(solver, related_to=(expr,)):
                 debug('bad solver', solver.sexpr())
                 raise CrosshairInternal('unexpected un sat')
             self.condition_value = solver.model().evaluate(expr, model_completion=True)
@@ -468,15 +858,32 @@ class TrackingStateSpace(StateSpace):
     def __init__(self,
                  execution_deadline: float,
                  model_check_timeout: float,
-                 search_root: SinglePathNode):
+                 search_root: SinglePathNode,
+                 search_strategy: Optional[SearchStrategy] = None,
+                 is_cancelled: Optional[Callable[[], bool]] = None):
         StateSpace.__init__(self, model_check_timeout)
         self.execution_deadline = execution_deadline
+        self.is_cancelled = is_cancelled
         self._random = newrandom()
+        self.search_strategy = search_strategy if search_strategy else SearchStrategy()
         _, self.search_position = search_root.choose()
 
+    def _grow(self, node: SearchTreeNode) -> SearchTreeNode:
+        node.strategy = self.search_strategy
+        return self.search_position.grow_into(node)
+
+    def _check_timeouts(self) -> None:
+        if time.time() > self.execution_deadline:
+            debug('Path execution timeout after making ',
+                  len(self.choices_made), ' choices.')
+            raise PathTimeout
+        if self.is_cancelled is not None and self.is_cancelled():
+            debug('Analysis was cancelled')
+            raise AnalysisCancelled
+
     def fork_with_confirm_or_else(self, false_probability: float) -> bool:
         if self.search_position.is_stem():
-            self.search_position = self.search_position.grow_into(ConfirmOrElseNode(false_probability))
+            self.search_position = self._grow(ConfirmOrElseNode(false_probability))
         node = self.search_position.simplify()
         assert isinstance(node, SearchTreeNode)
         self.choices_made.append(node)
@@ -486,7 +893,7 @@ class TrackingStateSpace(StateSpace):
 
     def fork_parallel(self, false_probability: float) -> bool:
         if self.search_position.is_stem():
-            self.search_position = self.search_position.grow_into(ParallelNode(false_probability))
+            self.search_position = self._grow(ParallelNode(false_probability))
         node = self.search_position.simplify()
         assert isinstance(node, SearchTreeNode)
         self.choices_made.append(node)
@@ -494,39 +901,39 @@ class TrackingStateSpace(StateSpace):
         self.search_position = next_node
         return ret
 
+    def _check_deterministic(self, node: SearchTreeNode) -> None:
+        # NOTE: format_stack() is more human readable, but it pulls source file contents,
+        # so it is (1) slow, and (2) unstable when source code changes while we are checking.
+        statedesc = '\n'.join(map(str, traceback.extract_stack()))
+        if node.statehash is None:
+            node.statehash = statedesc
+        else:
+            if node.statehash != statedesc:
+                debug(self.choices_made)
+                debug(' *** Begin Not Deterministic Debug *** ')
+                debug('     First state: ', len(node.statehash))
+                debug(node.statehash)
+                debug('     Last state: ', len(statedesc))
+                debug(statedesc)
+                debug('     Stack Diff: ')
+                import difflib
+                debug('\n'.join(difflib.context_diff(
+                    node.statehash.split('\n'), statedesc.split('\n'))))
+                debug(' *** End Not Deterministic Debug *** ')
+                raise NotDeterministic()
+
     def choose_possible(self, expr: z3.ExprRef, favor_true=False) -> bool:
         with self.framework():
-            if time.time() > self.execution_deadline:
-                debug('Path execution timeout after making ',
-                      len(self.choices_made), ' choices.')
-                raise PathTimeout
+            self._check_timeouts()
             notexpr = z3.Not(expr)
             if self.search_position.is_stem():
-                self.search_position = self.search_position.grow_into(
+                self.search_position = self._grow(
                     WorstResultNode(self._random, expr, self.solver))
 
             self.search_position = self.search_position.simplify()
             node = self.search_position
-            # NOTE: format_stack() is more human readable, but it pulls source file contents,
-            # so it is (1) slow, and (2) unstable when source code changes while we are checking.
-            statedesc = '\n'.join(map(str, traceback.extract_stack()))
             assert isinstance(node, SearchTreeNode)
-            if node.statehash is None:
-                node.statehash = statedesc
-            else:
-                if node.statehash != statedesc:
-                    debug(self.choices_made)
-                    debug(' *** Begin Not Deterministic Debug *** ')
-                    debug('     First state: ', len(node.statehash))
-                    debug(node.statehash)
-                    debug('     Last state: ', len(statedesc))
-                    debug(statedesc)
-                    debug('     Stack Diff: ')
-                    import difflib
-                    debug('\n'.join(difflib.context_diff(
-                        node.statehash.split('\n'), statedesc.split('\n'))))
-                    debug(' *** End Not Deterministic Debug *** ')
-                    raise NotDeterministic()
+            self._check_deterministic(node)
             choose_true, stem = node.choose(favor_true=favor_true)
             assert isinstance(self.search_position, SearchTreeNode)
             self.choices_made.append(self.search_position)
@@ -536,11 +943,44 @@ class TrackingStateSpace(StateSpace):
             self.add(expr)
             return choose_true
 
+    def choose_index(self, num_options: int) -> int:
+        if num_options == 1:
+            return 0
+        with self.framework():
+            self._check_timeouts()
+            if self.search_position.is_stem():
+                self.search_position = self._grow(
+                    NaryChoiceNode(num_options, self._random))
+            self.search_position = self.search_position.simplify()
+            node = self.search_position
+            assert isinstance(node, NaryChoiceNode)
+            self._check_deterministic(node)
+            idx, stem = node.choose_index()
+            self.choices_made.append(node)
+            self.search_position = stem
+            return idx
+
+    def choose_among(self, conditions: Sequence[z3.ExprRef]) -> int:
+        with self.framework():
+            self._check_timeouts()
+            if self.search_position.is_stem():
+                self.search_position = self._grow(
+                    ConditionChoiceNode(conditions, self.solver, self._random))
+            self.search_position = self.search_position.simplify()
+            node = self.search_position
+            assert isinstance(node, ConditionChoiceNode)
+            self._check_deterministic(node)
+            idx, stem = node.choose_index()
+            self.choices_made.append(node)
+            self.search_position = stem
+            self.add(conditions[idx])
+            return idx
+
     def find_model_value(self, expr: z3.ExprRef) -> object:
         with self.framework():
             while True:
                 if self.search_position.is_stem():
-                    self.search_position = self.search_position.grow_into(ModelValueNode(self._random, expr, self.solver))
+                    self.search_position = self._grow(ModelValueNode(self._random, expr, self.solver))
                 node = self.search_position.simplify()
                 assert isinstance(node, ModelValueNode)
                 (chosen, next_node) = node.choose(favor_true=True)
@@ -569,8 +1009,26 @@ class TrackingStateSpace(StateSpace):
             if isinstance(node, BinaryPathNode):
                 assert next_node is node.positive or next_node is node.negative
                 log.append('1' if node.positive is next_node else '0')
+            elif isinstance(node, NaryChoiceNode):
+                log.append('(' + str(node.children.index(next_node)) + ')')
         return ''.join(log)
 
+    def decisions(self) -> Iterator[Tuple[SearchTreeNode, object]]:
+        '''
+        Yields each decision node on the current path along with the branch
+        taken (a bool for binary nodes, an index for n-ary nodes).
+        '''
+        choices = self.choices_made
+        for idx, node in enumerate(choices):
+            next_node = choices[idx + 1] if idx + 1 < len(choices) else self.search_position
+            if isinstance(node, BinaryPathNode):
+                yield (node, node.positive.simplify() is next_node)
+            elif isinstance(node, NaryChoiceNode):
+                for child_idx, child in enumerate(node.children):
+                    if child.simplify() is next_node:
+                        yield (node, child_idx)
+                        break
+
     def bubble_status(self, analysis: CallAnalysis) -> Tuple[
             Optional[CallAnalysis], bool]:
         # In some cases, we might ignore an attempt while not at a leaf.
@@ -622,3 +1080,73 @@ class ReplayStateSpace(StateSpace):
             if not self.solver.check():
                 debug('Precise path replay unsuccessful.')
             return decide_true
+
+    def choose_index(self, num_options: int) -> int:
+        if num_options == 1:
+            return 0
+        log, idx = self.execution_log, self.log_index
+        if log[idx:idx + 1] != '(':
+            debug('Precise path replay unsuccessful.')
+            return 0
+        end = log.index(')', idx)
+        self.log_index = end + 1
+        decision = int(log[idx + 1:end])
+        debug('REPLAY CHOICE', decision, 'of', num_options)
+        return decision
+
+    def choose_among(self, conditions: Sequence[z3.ExprRef]) -> int:
+        with self.framework():
+            idx = self.choose_index(len(conditions))
+            self.add(conditions[idx])
+            return idx
+
+class ConcreteStateSpace(StateSpace):
+    '''
+    A state space for calls on concrete inputs. It never forks (so nothing is
+    short-circuited or prematurely realized), and makes any symbolic choices
+    at random, among the possible ones.
+
+    >>> space = ConcreteStateSpace(model_check_timeout=1.0, rand=newrandom())
+    >>> space.fork_parallel(false_probability=0.5)
+    False
+    >>> x = z3.Int('x')
+    >>> space.choose_possible(x == x + 1)
+    False
+    >>> space.choose_index(1)
+    0
+    >>> space.choose_among([x < 0, x == x + 1])
+    0
+    '''
+    def __init__(self, model_check_timeout: float, rand: random.Random):
+        StateSpace.__init__(self, model_check_timeout=model_check_timeout)
+        self._random = rand
+
+    def fork_with_confirm_or_else(self, false_probability: float) -> bool:
+        return False
+
+    def fork_parallel(self, false_probability: float) -> bool:
+        return False
+
+    def choose_possible(self, expr: z3.ExprRef, favor_true=False) -> bool:
+        with self.framework():
+            decide_true = favor_true or self._random.random() < 0.5
+            first = expr if decide_true else z3.Not(expr)
+            if self.check(first) != z3.sat:
+                decide_true = not decide_true
+                if self.check(z3.Not(first)) != z3.sat:
+                    raise CrosshairInternal('Reached impossible code path')
+            self.add(expr if decide_true else z3.Not(expr))
+            return decide_true
+
+    def choose_index(self, num_options: int) -> int:
+        return self._random.randrange(num_options)
+
+    def choose_among(self, conditions: Sequence[z3.ExprRef]) -> int:
+        with self.framework():
+            possible = [idx for idx, condition in enumerate(conditions)
+                        if self.check(condition) == z3.sat]
+            if not possible:
+                raise CrosshairInternal('Reached impossible code path')
+            idx = self._random.choice(possible)
+            self.add(conditions[idx])
+            return idx
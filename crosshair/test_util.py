@@ -37,7 +37,7 @@ def check_messages(msgs: List[AnalysisMessage], **kw) -> ComparableLists:
     default_msg = AnalysisMessage(MessageType.CANNOT_CONFIRM, '', '', 0, 0, '')
     msg = msgs[0] if msgs else replace(default_msg)
     fields = ('state', 'message', 'filename', 'line', 'column', 'traceback',
-              'execution_log', 'test_fn', 'condition_src')
+              'execution_log', 'test_fn', 'condition_src', 'counterexample')
     for k in fields:
         if k not in kw:
             default_val = getattr(default_msg, k)
@@ -157,6 +157,14 @@ class CrosshairUnsupported(UnexploredPath):
               ''.join(traceback.format_stack()))
 
 
+class AnalysisCancelled(BaseException):
+    '''
+    Raised inside an analysis whose results are no longer wanted.
+    (a BaseException, so that user code catching Exception won't swallow it)
+    '''
+    pass
+
+
 class IgnoreAttempt(Exception):
     def __init__(self, *a):
         debug('IgnoreAttempt', str(self))